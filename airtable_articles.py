@@ -1,14 +1,19 @@
 # airtable_articles.py
-from pyairtable import Table
 import os
 import time
 
+import search_index
+from app_log import get_logger
+from storage import get_table
+
+logger = get_logger("airtable_articles")
+
 AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
 AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
 ARTICLES_TABLE = os.getenv("AIRTABLE_ARTICLES_TABLE", "articles")  # default "articles"
 
 def get_articles_table():
-    return Table(AIRTABLE_API_KEY, AIRTABLE_BASE_ID, ARTICLES_TABLE)
+    return get_table(ARTICLES_TABLE)
 
 def save_article_to_airtable(user_record_id: str, *,
                              title: str,
@@ -20,7 +25,8 @@ def save_article_to_airtable(user_record_id: str, *,
                              source_video_id: str = None,
                              source_transcript: str = None,
                              credits_used: int = 1,
-                             status: str = "draft"):
+                             status: str = "draft",
+                             search_transcript: str = None):
   
     table = get_articles_table()
 
@@ -43,4 +49,10 @@ def save_article_to_airtable(user_record_id: str, *,
     fields = {k: v for k, v in fields.items() if v is not None}
 
     record = table.create(fields)
+
+    # index de recherche local ; `search_transcript` n'est pas envoyé à Airtable
+    try:
+        search_index.indexer(record, transcript=search_transcript)
+    except Exception as e:
+        logger.warning("indexation de l'article impossible", article_id=record.get("id"), error=e)
     return record
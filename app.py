@@ -1,22 +1,44 @@
-from flask import Flask, request, render_template, redirect, url_for, session, jsonify, abort, current_app, json
+from flask import Flask, request, render_template, redirect, url_for, session, jsonify, abort, current_app, json, make_response
+from flask import Response, stream_template, g
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 
 from blog_utils import generer_article_et_seo, generer_image_article
-from youtube_utils import extraire_video_id, recuperer_transcription
+from youtube_utils import extraire_video_id, recuperer_segments, texte_des_segments
 from youtube_transcript_api import TranscriptsDisabled, NoTranscriptFound, VideoUnavailable
 from config_airtable import get_users_table
 from airtable_articles import save_article_to_airtable, get_articles_table as get_articles_table_helper
+from storage import get_table, taille_outbox
+import credits_ledger
+import article_cache
+import processed_events_store
+import webhook_queue
+import stripe_cache
+import session_store
+import transcript_store
+import transcript_prefetch
+import idempotency
+import resilience
+import assets
+import compression
+import metrics
+import profiler
+import health
+import rate_limit
+import export
+import seo_score
+import search_index
+import chapters
+from background_tasks import start_periodic
+from app_log import get_logger, logs_perdus
 
 import time
-import threading
+import hmac
+import uuid
 import stripe
-import logging
 import random
-import traceback
 from openai import OpenAI
-import traceback
 
 from dotenv import load_dotenv
 import os
@@ -25,12 +47,27 @@ client = OpenAI()
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
+
+# server : session stockée côté serveur, le cookie ne contient qu'un id opaque
+# cookie : ancien comportement Flask (session entière signée dans le cookie)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "server")
+if SESSION_BACKEND != "cookie":
+    app.session_interface = session_store.SQLiteSessionInterface()
+
+# {{ asset_url('style.css') }} : version avec empreinte (static/dist) si build_assets.py a tourné
+app.add_template_global(assets.asset_url)
+app.add_template_filter(chapters.horodatage)
+# une clé par formulaire affiché : un renvoi du même formulaire ne relance pas la génération
+app.add_template_global(idempotency.nouvelle_cle, "cle_idempotence")
+app.after_request(compression.compresser_reponse)
+
+# Optionnel : si défini, /metrics exige "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 stripe.api_key = os.getenv("STRIPE_API_KEY")
+# timeout par défaut de la bibliothèque : 80 s
+stripe.default_http_client = stripe.RequestsClient(timeout=resilience.TIMEOUTS["stripe"])
 
 USER_CACHE_TTL_SECONDS = 30
-# Locks in-memory pour éviter les requêtes concurrentes par user
-_USER_LOCKS = {}                    # user_id -> threading.Lock()
-_USER_LOCKS_MUTEX = threading.Lock()  # protège l'accès au dict _USER_LOCKS
 
 STRIPE_PRICE_BY_PLAN = {
     "medium": os.getenv("STRIPE_PRICE_MEDIUM"),
@@ -60,6 +97,9 @@ PLANS = {
 
 PLANS_AUTORISES = ["free", "medium", "premium"]
 
+# Comptes ayant accès aux pages /admin (liste d'e-mails séparés par des virgules)
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
 PLAN_TO_AIRTABLE_LABEL = {
     "free": "free",
     "medium": "medium",
@@ -76,49 +116,12 @@ REFRESH_ENDPOINTS = {
     # ajoute ici d'autres endpoints critiques si tu veux
 }
 
-PROCESSED_EVENTS_FILE = "processed_events.txt"
+logger = get_logger("app")
 
-# logger simple vers fichier
-logger = logging.getLogger("upgrade")
-logger.setLevel(logging.INFO)
-fh = logging.FileHandler("upgrade_errors.log")
-fh.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
-fh.setFormatter(formatter)
-if not logger.handlers:
-    logger.addHandler(fh)
 
-
-def _load_processed_events_file():
-    try:
-        with open(PROCESSED_EVENTS_FILE, "r", encoding="utf-8") as f:
-            return set(line.strip() for line in f if line.strip())
-    except FileNotFoundError:
-        return set()
-
-def _save_processed_event_file(event_id: str):
-    with open(PROCESSED_EVENTS_FILE, "a", encoding="utf-8") as f:
-        f.write(event_id + "\n")
-
-def _is_event_processed_in_airtable(event_id: str):
-    """
-    Essaie d'utiliser une table 'stripe_events' dans Airtable pour stocker les event ids traités.
-    Retourne True si déjà traité, False sinon.
-    """
-    try:
-        from pyairtable import Table as PyTable
-        table_events = PyTable(os.getenv("AIRTABLE_API_KEY"), os.getenv("AIRTABLE_BASE_ID"), "stripe_events")
-        # rechercher si event existe (formule simple)
-        formula = f"{{event_id}} = '{event_id}'"
-        rec = table_events.first(formula=formula)
-        return bool(rec)
-    except Exception:
-        return None  # None signifie "impossible de vérifier via Airtable"
-    
 def _mark_event_processed_in_airtable(event_id: str, event_type: str):
     try:
-        from pyairtable import Table as PyTable
-        table_events = PyTable(os.getenv("AIRTABLE_API_KEY"), os.getenv("AIRTABLE_BASE_ID"), "stripe_events")
+        table_events = get_table("stripe_events")
         table_events.create({"event_id": event_id, "type": event_type, "created_at": int(time.time())})
         return True
     except Exception:
@@ -136,217 +139,184 @@ def stripe_webhook():
         else:
             event = json.loads(payload)  # fallback (moins sûr)
     except Exception as e:
-        print("Webhook signature verification failed:", e)
+        logger.warning("webhook : signature invalide", error=e)
         return abort(400)
 
     event_id = event.get("id")
     event_type = event.get("type")
     if not event_id:
-        print("Webhook reçu sans event id")
+        logger.warning("webhook : event sans id")
         return "", 400
 
-    processed_via_airtable = _is_event_processed_in_airtable(event_id)
-    if processed_via_airtable is True:
-        print("[Webhook] event déjà traité (airtable)", event_id)
+    # Idempotence locale (mémoire + SQLite), avant tout appel distant
+    if processed_events_store.deja_traite(event_id):
+        logger.debug("webhook : event déjà traité", event_id=event_id)
         return "", 200
 
-    if processed_via_airtable is None:
-        processed_file_set = _load_processed_events_file()
-        if event_id in processed_file_set:
-            print("[Webhook] event déjà traité (fichier)", event_id)
-            return "", 200
+    # Enregistrement durable puis réponse immédiate à Stripe : les appels Stripe/Airtable
+    # sont faits par le worker (webhook_queue), dans l'ordre pour un même client.
+    webhook_queue.enqueue(event, payload)
+    processed_events_store.marquer_traite(event_id, event_type)
+    return "", 200
 
-    data = event.get("data", {}).get("object", {})
 
-    try:
-        if event_type == "checkout.session.completed":
-            session_obj = data
-            metadata = session_obj.get("metadata", {}) or {}
-            user_id = metadata.get("user_id")
-            plan = metadata.get("plan")
-
-            if not user_id or not plan:
-                subscription_id = session_obj.get("subscription")
-                if subscription_id:
-                    try:
-                        sub = stripe.Subscription.retrieve(subscription_id)
-                        user_id = user_id or (sub.get("metadata") or {}).get("user_id")
-                        plan = plan or (sub.get("metadata") or {}).get("plan")
-                    except Exception as e:
-                        print("Impossible de récupérer subscription pour fallback metadata:", e)
+def _traiter_checkout_complete(event_id: str, session_obj: dict):
+    metadata = session_obj.get("metadata", {}) or {}
+    user_id = metadata.get("user_id")
+    plan = metadata.get("plan")
 
-            if not user_id or not plan:
-                print("[Webhook] checkout.session.completed sans user_id/plan, skipping")
-            else:
-                # identifier l'utilisateur en Airtable
-                try:
-                    table = get_users_table()
-                    if isinstance(user_id, str) and user_id.startswith("rec"):
-                        rec = table.get(user_id)
-                        user_record_id = rec["id"]
-                        fields = rec.get("fields", {})
-                    else:
-                        rec = table.first(formula=f"LOWER({{email}}) = '{user_id.lower()}'")
-                        if not rec:
-                            print("[Webhook] utilisateur introuvable pour checkout.session.completed:", user_id)
-                            rec = None
-                        else:
-                            user_record_id = rec["id"]
-                            fields = rec.get("fields", {})
-
-                    if rec:
-                        # detection idempotence : subscription déjà enregistrée ?
-                        stripe_subscription = session_obj.get("subscription")
-                        if isinstance(stripe_subscription, dict):
-                            subs_id = stripe_subscription.get("id")
-                        else:
-                            subs_id = stripe_subscription
-
-                        if subs_id and fields.get("stripeSubscriptionId") == subs_id:
-                            print("[Webhook] checkout.session.completed : subscription déjà appliquée", subs_id)
-                        else:
-                            # calculer crédits à ajouter (1er paiement)
-                            credits_to_add = PLANS.get(plan, {}).get("credits", 0)
-                            current_credits = int(fields.get("credits", 0) or 0)
-                            new_credits = current_credits + credits_to_add
-
-                            updated = {
-                                "credits": new_credits,
-                                "planName": plan,
-                                "status": "payant",
-                            }
-                            customer_id = session_obj.get("customer")
-                            if customer_id:
-                                updated["stripeCustomerId"] = customer_id
-                            if subs_id:
-                                updated["stripeSubscriptionId"] = subs_id
-
-                            print(f"[Webhook] checkout.session.completed : user {user_record_id} +{credits_to_add} crédits (total {new_credits})")
-                            table.update(user_record_id, updated)
-
-                            # mettre à jour la session server-side si l'utilisateur est connecté
-                            try:
-                                sess_user = session.get("user", {})
-                                if sess_user.get("id") == user_record_id:
-                                    sess_user.update(
-                                        {
-                                            "planName": updated.get("planName"),
-                                            "status": updated.get("status"),
-                                            "credits": new_credits,
-                                            "stripeCustomerId": updated.get("stripeCustomerId"),
-                                            "stripeSubscriptionId": updated.get("stripeSubscriptionId"),
-                                            "_credits_updated_at": int(time.time()),
-                                        }
-                                    )
-                                    session["user"] = sess_user
-                            except Exception:
-                                pass
+    if not user_id or not plan:
+        subscription_id = session_obj.get("subscription")
+        if subscription_id:
+            sub = stripe_cache.get_subscription(subscription_id)
+            user_id = user_id or (sub.get("metadata") or {}).get("user_id")
+            plan = plan or (sub.get("metadata") or {}).get("plan")
 
-                except Exception as e:
-                    print("Erreur traitement checkout.session.completed:", e)
+    if not user_id or not plan:
+        logger.warning("webhook checkout.session.completed sans user_id/plan, ignoré", event_id=event_id)
+        return
+
+    # identifier l'utilisateur en Airtable
+    table = get_users_table()
+    if isinstance(user_id, str) and user_id.startswith("rec"):
+        rec = table.get(user_id)
+    else:
+        rec = table.first_where("email", user_id, lower=True)
+        if not rec:
+            logger.warning("webhook checkout.session.completed : utilisateur introuvable", event_id=event_id, user_id=user_id)
+            return
 
-        elif event_type == "invoice.payment_succeeded":
-            invoice = data
+    user_record_id = rec["id"]
+    fields = rec.get("fields", {})
 
-            # Ne pas créditer la première facture (création d'abonnement)
-            billing_reason = invoice.get("billing_reason")
-            if billing_reason == "subscription_create":
-                print("[Webhook] invoice.payment_succeeded (subscription_create) -> pas de crédit (déjà fait dans checkout.session.completed)")
-                return "", 200
+    # detection idempotence : subscription déjà enregistrée ?
+    stripe_subscription = session_obj.get("subscription")
+    if isinstance(stripe_subscription, dict):
+        subs_id = stripe_subscription.get("id")
+    else:
+        subs_id = stripe_subscription
 
-            subscription_id = invoice.get("subscription")
-            customer_id = invoice.get("customer")
+    if subs_id and fields.get("stripeSubscriptionId") == subs_id:
+        logger.info("webhook checkout.session.completed : subscription déjà appliquée", subscription_id=subs_id)
+        return
 
-            if not subscription_id:
-                print("[Webhook] invoice.payment_succeeded sans subscription -> skip")
-            else:
-                try:
-                    # récupérer la subscription pour connaître le price_id
-                    sub = stripe.Subscription.retrieve(subscription_id, expand=["items"])
-                    items = sub.get("items", {}).get("data", [])
-                    if not items:
-                        print("[Webhook] Subscription sans items", subscription_id)
-                    else:
-                        price_id = items[0].get("price", {}).get("id")
-                        plan = PRICE_TO_PLAN.get(price_id)
-                        if not plan:
-                            print("[Webhook] Price ID non mappé:", price_id)
-                        else:
-                            credits_to_add = PLANS.get(plan, {}).get("credits", 0)
-                            # retrouver user via stripeCustomerId dans Airtable
-                            try:
-                                table = get_users_table()
-                                rec = table.first(formula=f"{{stripeCustomerId}} = '{customer_id}'")
-                                if not rec:
-                                    print("[Webhook] Aucun utilisateur Airtable pour stripeCustomerId:", customer_id)
-                                else:
-                                    user_record_id = rec.get("id")
-                                    fields = rec.get("fields", {})
-                                    current = int(fields.get("credits", 0) or 0)
-                                    new = current + credits_to_add
-                                    table.update(user_record_id, {"credits": new})
-                                    print(
-                                        f"[Webhook] invoice.payment_succeeded : ajouté {credits_to_add} crédits à {user_record_id} (total {new})"
-                                    )
-                                    # update session if same user
-                                    try:
-                                        sess_user = session.get("user", {})
-                                        if sess_user.get("id") == user_record_id:
-                                            sess_user["credits"] = new
-                                            sess_user["_credits_updated_at"] = int(time.time())
-                                            session["user"] = sess_user
-                                    except Exception:
-                                        pass
-                            except Exception as e:
-                                print("Erreur traitement invoice.payment_succeeded (Airtable):", e)
-                except Exception as e:
-                    print("Erreur récupération subscription dans invoice.payment_succeeded:", e)
+    # calculer crédits à ajouter (1er paiement)
+    credits_to_add = PLANS.get(plan, {}).get("credits", 0)
+    # les crédits passent par le ledger local (idempotent par event id)
+    new_credits = credits_ledger.crediter(user_record_id, credits_to_add, ref=event_id)
 
-        elif event_type == "customer.subscription.deleted":
-            sub = data
-            stripe_subscription_id = sub.get("id")
-            customer_id = sub.get("customer")
-            try:
-                table = get_users_table()
-                rec = table.first(formula=f"{{stripeSubscriptionId}} = '{stripe_subscription_id}'")
-                if rec:
-                    user_id = rec.get("id")
-
-                    # 1) Mise à jour Airtable : statut + plan free
-                    table.update(user_id, {
-                        "status": "annulé",
-                        "planName": "free",
-                    })
-                    print(f"[Webhook] subscription.deleted : user {user_id} passé en free et marqué annulé")
+    updated = {
+        "planName": plan,
+        "status": "payant",
+    }
+    customer_id = session_obj.get("customer")
+    if customer_id:
+        updated["stripeCustomerId"] = customer_id
+    if subs_id:
+        updated["stripeSubscriptionId"] = subs_id
+
+    logger.info("webhook checkout.session.completed", user_id=user_record_id, plan=plan,
+                credits_added=credits_to_add, credits=new_credits)
+    table.update(user_record_id, updated)
+
+    # répercuter sur les sessions ouvertes de l'utilisateur
+    session_store.maj_sessions_utilisateur(user_record_id, {
+        "planName": plan,
+        "status": "payant",
+        "credits": new_credits,
+        "stripeCustomerId": updated.get("stripeCustomerId"),
+        "stripeSubscriptionId": updated.get("stripeSubscriptionId"),
+        "_credits_updated_at": int(time.time()),
+    })
+
+
+def _traiter_paiement_facture(event_id: str, invoice: dict):
+    # Ne pas créditer la première facture (création d'abonnement)
+    billing_reason = invoice.get("billing_reason")
+    if billing_reason == "subscription_create":
+        logger.debug("webhook invoice.payment_succeeded (subscription_create) : crédits déjà ajoutés au checkout", event_id=event_id)
+        return
+
+    subscription_id = invoice.get("subscription")
+    customer_id = invoice.get("customer")
+
+    if not subscription_id:
+        logger.info("webhook invoice.payment_succeeded sans subscription, ignoré", event_id=event_id)
+        return
+
+    # subscription relue via l'API : la facture peut précéder son customer.subscription.updated
+    # (changement de formule), le cache aurait encore l'ancien price_id
+    sub = stripe_cache.get_subscription(subscription_id, frais=True)
+    items = sub.get("items", {}).get("data", [])
+    if not items:
+        logger.warning("webhook : subscription sans items", subscription_id=subscription_id)
+        return
+
+    price_id = items[0].get("price", {}).get("id")
+    plan = PRICE_TO_PLAN.get(price_id)
+    if not plan:
+        logger.warning("webhook : price id non mappé", price_id=price_id)
+        return
+
+    credits_to_add = PLANS.get(plan, {}).get("credits", 0)
+    # retrouver user via stripeCustomerId dans Airtable
+    table = get_users_table()
+    rec = table.first_where("stripeCustomerId", customer_id)
+    if not rec:
+        logger.warning("webhook : aucun utilisateur pour ce client Stripe", customer_id=customer_id)
+        return
 
-                    # 2) Mise à jour de la session si l'utilisateur est connecté
-                    try:
-                        sess_user = session.get("user", {})
-                        if sess_user.get("id") == user_id:
-                            sess_user.update({
-                                "status": "annulé",
-                                "planName": "free",
-                            })
-                            session["user"] = sess_user
-                    except Exception:
-                        pass
+    user_record_id = rec.get("id")
+    new = credits_ledger.crediter(user_record_id, credits_to_add, ref=event_id)
+    logger.info("webhook invoice.payment_succeeded", user_id=user_record_id, credits_added=credits_to_add, credits=new)
+    session_store.maj_sessions_utilisateur(user_record_id, {"credits": new, "_credits_updated_at": int(time.time())})
 
-            except Exception as e:
-                print("Erreur traitement customer.subscription.deleted:", e)
 
-    except Exception as e:
-        
-        print("Erreur traitement webhook général:", e)
+def _traiter_abonnement_supprime(sub: dict):
+    stripe_subscription_id = sub.get("id")
+    table = get_users_table()
+    rec = table.first_where("stripeSubscriptionId", stripe_subscription_id)
+    if not rec:
+        return
 
-    try:
-        marked = _mark_event_processed_in_airtable(event_id, event_type)
-        if not marked:
-            _save_processed_event_file(event_id)
-    except Exception as e:
-        print("Impossible de marquer event comme traité (non critique):", e)
+    user_id = rec.get("id")
+    # Mise à jour Airtable : statut + plan free
+    table.update(user_id, {
+        "status": "annulé",
+        "planName": "free",
+    })
+    logger.info("webhook subscription.deleted : passage en free", user_id=user_id)
+    session_store.maj_sessions_utilisateur(user_id, {"status": "annulé", "planName": "free"})
 
-    return "", 200
 
+def traiter_evenement_stripe(event: dict):
+    """
+    Applique un event Stripe mis en file par /webhook (appelé par le worker webhook_queue).
+    Une exception (Stripe ou Airtable indisponible...) provoque un nouvel essai ;
+    les cas non récupérables (metadata absente, utilisateur inconnu) sont juste loggés.
+    """
+    event_id = event.get("id")
+    event_type = event.get("type")
+    data = event.get("data", {}).get("object", {})
+
+    stripe_cache.rafraichir_depuis_event(event_type or "", data)
+
+    if event_type == "checkout.session.completed":
+        _traiter_checkout_complete(event_id, data)
+    elif event_type == "invoice.payment_succeeded":
+        _traiter_paiement_facture(event_id, data)
+    elif event_type == "customer.subscription.deleted":
+        _traiter_abonnement_supprime(data)
+
+    # trace pour le back-office uniquement (l'idempotence ne dépend plus d'Airtable)
+    if not _mark_event_processed_in_airtable(event_id, event_type):
+        logger.warning("trace de l'event dans Airtable impossible (non critique)", event_id=event_id)
+
+
+
+@app.route("/assets/<path:filename>")
+def asset_dist(filename):
+    return assets.envoyer_asset(filename)
 
 
 @app.context_processor
@@ -382,8 +352,8 @@ def inject_user():
             record = table.get(sess_user["id"])
             fields = record.get("fields", {})
 
-            # Extrait et normalise les champs attendus
-            credits_val = int(fields.get("credits", 0) or 0)
+            # Extrait et normalise les champs attendus (crédits : ledger local, source de vérité)
+            credits_val = credits_ledger.solde(sess_user["id"])
             plan_val = fields.get("planName", sess_user.get("planName"))
             status_val = fields.get("status", sess_user.get("status"))
 
@@ -397,7 +367,7 @@ def inject_user():
             user = sess_user  # on retourne la version enrichie
         except Exception as e:
             # En cas d'erreur : on ne plante pas l'app, on log et on garde les données en session
-            print("Warning inject_user(): impossible de rafraîchir Airtable :", e)
+            logger.warning("inject_user : rafraîchissement Airtable impossible", error=e)
             
             user = sess_user
     else:
@@ -414,6 +384,17 @@ def login_required(view_func):
         return view_func(*args, **kwargs)
     return wrapper   
 
+def admin_required(view_func):
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        user = get_current_user()
+        if not user:
+            return redirect(url_for("login"))
+        if (user.get("email") or "").lower() not in ADMIN_EMAILS:
+            abort(403)
+        return view_func(*args, **kwargs)
+    return wrapper
+
 def get_current_user():
     
     return session.get("user")
@@ -421,28 +402,118 @@ def get_current_user():
 
 def consume_credit_for_user(user_id: str) -> int:
     """
-    Lit la valeur actuelle des crédits, vérifie >=1, la décrémente de 1,
-    met à jour Airtable et renvoie le nouveau solde.
-    Lève ValueError si solde insuffisant.
+    Débite 1 crédit de façon atomique via le ledger local et renvoie le nouveau solde.
+    La synchro vers Airtable est faite par la réconciliation périodique.
+    Lève ValueError (SoldeInsuffisant) si solde insuffisant.
     """
-    table = get_users_table()
-    record = table.get(user_id)
-    fields = record.get("fields", {})
-    credits = int(fields.get("credits", 0) or 0)
+    request_id = f"consume-{uuid.uuid4().hex}"
+    new_credits = credits_ledger.reserver(user_id, 1, request_id)
+    credits_ledger.confirmer(request_id)
+    return new_credits
 
-    if credits <= 0:
-        raise ValueError("Solde de crédits insuffisant.")
 
-    new_credits = credits - 1
-    table.update(record["id"], {"credits": new_credits})
-    return new_credits
-    
+@app.before_request
+def demarrer_taches_de_fond():
+    # no-op après la première requête de chaque worker
+    credits_ledger.demarrer_reconciliation()
+    webhook_queue.demarrer_worker(traiter_evenement_stripe)
+    if SESSION_BACKEND != "cookie":
+        start_periodic("sessions-purge", 3600, session_store.purger)
+    start_periodic("transcripts-purge", 3600, transcript_store.purger)
+    start_periodic("transcript-prefetch-purge", 300, transcript_prefetch.purger)
+    start_periodic("idempotency-purge", 3600, idempotency.purger)
+    start_periodic("metrics-publish", 15, metrics.publier)
+    health.demarrer_sondes()
+    rate_limit.demarrer_purge()
+    search_index.demarrer_remplissage()
+
+
+@app.before_request
+def demarrer_chrono():
+    g.request_started_at = time.perf_counter()
+    resilience.demarrer_budget()
+    profiler.debut_requete()
+
+
+@app.after_request
+def mesurer_requete(response):
+    # Pour les pages streamées : temps jusqu'au début de l'envoi
+    started = g.pop("request_started_at", None)
+    if started is not None:
+        metrics.observer_requete(request.endpoint, request.method, response.status_code,
+                                 time.perf_counter() - started)
+    return response
+
+
+@app.teardown_request
+def mesurer_requete_en_erreur(exc):
+    # exception non gérée : after_request n'a pas été appelé
+    started = g.pop("request_started_at", None)
+    if started is not None and exc is not None:
+        metrics.observer_requete(request.endpoint, request.method, 500, time.perf_counter() - started)
+    # teardown : les pages streamées ont fini d'être rendues
+    profiler.fin_requete(request.endpoint or "none")
+
+
+metrics.jauge("webhook_queue_events", "Events Stripe en file par statut",
+              lambda: {s: 0 for s in ("pending", "processing", "done", "dead")} | webhook_queue.stats(),
+              label="status")
+metrics.jauge("logs_dropped", "Logs perdus (file d'écriture pleine) depuis le démarrage du worker", logs_perdus)
+metrics.jauge("circuit_breaker_state", "État des disjoncteurs (0 fermé, 1 semi-ouvert, 2 ouvert)",
+              lambda: {s: resilience.STATES[e["state"]] for s, e in resilience.etats().items()},
+              label="service")
+metrics.jauge("storage_replication_outbox", "Écritures locales en attente de réplication vers Airtable",
+              taille_outbox)
+
+
+STREAM_CHUNK_SIZE = 8192
+
+
+def _regrouper(chunks, taille=STREAM_CHUNK_SIZE):
+    """
+    Regroupe les petits morceaux produits par Jinja (évite un write réseau par balise).
+    Un gros morceau (transcription, article) vide d'abord le tampon : ce qui précède part tout de suite.
+    """
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        if len(chunk) >= taille and buffer:
+            yield "".join(buffer)
+            buffer, size = [], 0
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= taille:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def rendre_en_flux(template_name, **context):
+    """
+    Rendu streamé des pages lourdes (transcription + article) : l'en-tête et le formulaire
+    sont envoyés pendant que le reste de la page est généré.
+    """
+    return Response(_regrouper(stream_template(template_name, **context)), mimetype="text/html")
+
+
+def _chapitrer(segments: list) -> list:
+    # chapitres détectés localement ; non bloquant pour la transcription
+    try:
+        return chapters.decouper(segments)
+    except Exception as e:
+        logger.warning("découpage en chapitres impossible", error=e)
+        return []
+
 
 @app.route("/", methods=["GET", "POST"])
 @app.route("/transcription", methods=["GET", "POST"])
 @login_required
+@rate_limit.limite("transcription")
 def transcription():
     transcript = None
+    transcript_handle = None
+    video_chapters = []
     erreur = None
     video_id = None
     url = None
@@ -457,17 +528,14 @@ def transcription():
     user = get_current_user()
     if user:
         try:
-            table = get_users_table()
-            record = table.get(user["id"])
-            fields = record.get("fields", {})
-            credits_left = int(fields.get("credits", 0) or 0)
+            credits_left = credits_ledger.solde(user["id"])
             # Met à jour la session côté serveur pour garder l'UI synchronisée
             session_user = session.get("user", {}) or {}
             session_user["credits"] = credits_left
             session["user"] = session_user
         except Exception as e:
             # Ne bloque pas l'affichage si Airtable a un problème : on log localement et continue
-            print("Erreur récupération crédits Airtable :", e)
+            logger.warning("récupération des crédits impossible", user_id=user["id"], error=e)
             credits_left = session.get("user", {}).get("credits", 0)
 
    
@@ -482,7 +550,14 @@ def transcription():
             if not video_id:
                 raise ValueError("Impossible d'extraire l'ID de la vidéo.")
 
-            transcript = recuperer_transcription(video_id, langues=["fr", "en"])
+            # le plus souvent déjà téléchargée par /transcription/prefetch pendant la saisie
+            segments = transcript_prefetch.obtenir(video_id)
+            if segments is None:
+                segments = recuperer_segments(video_id, langues=["fr", "en"])
+            transcript = texte_des_segments(segments)
+            video_chapters = _chapitrer(segments)
+            # Le formulaire /blogify ne renverra que ce handle, pas la transcription complète
+            transcript_handle = transcript_store.enregistrer(user["id"], video_id, transcript, video_chapters)
 
         except ValueError as e:
             erreur = str(e)
@@ -492,17 +567,22 @@ def transcription():
             erreur = "Aucune transcription trouvée pour cette vidéo (ni en FR ni en EN)."
         except VideoUnavailable:
             erreur = "Cette vidéo est indisponible."
+        except resilience.DependanceIndisponible as e:
+            erreur = str(e)
         except Exception as e:
             erreur = f"Erreur inattendue : {e}"
 
     # rendu final
-    return render_template(
+    return rendre_en_flux(
         "transcription.html",
         active_page="transcription",
         transcript=transcript,
+        transcript_handle=transcript_handle,
         erreur=erreur,
         video_id=video_id,
         url=url,
+        chapitres=video_chapters,
+        description_chapitres=chapters.description_youtube(video_chapters),
         article_html=article_html,
         article_id=article_id,
         seo_keyword=seo_keyword,
@@ -514,10 +594,34 @@ def transcription():
 
 
 
+@app.route("/transcription/prefetch", methods=["POST"])
+@login_required
+@rate_limit.limite("prefetch")
+def precharger_transcription():
+    # appelé par la page dès qu'une URL valide est collée, avant l'envoi du formulaire
+    try:
+        video_id = extraire_video_id(request.form.get("url", "").strip())
+        status = transcript_prefetch.precharger(video_id)
+    except ValueError:
+        return jsonify({"error": "URL YouTube non reconnue."}), 400
+    return jsonify({"video_id": video_id, "status": status}), 200 if status == "ready" else 202
+
+
+# Attente maximale d'une génération identique déjà en cours (même clé d'idempotence)
+BLOGIFY_IDEMPOTENCY_WAIT_SECONDS = int(os.getenv("BLOGIFY_IDEMPOTENCY_WAIT_SECONDS", "90"))
+# Part du budget de la requête gardée pour enregistrer l'article une fois les crédits débités
+BLOGIFY_SAVE_RESERVE_SECONDS = float(os.getenv("BLOGIFY_SAVE_RESERVE_SECONDS", "20"))
+# En dessous de ce temps restant, pas de régénération SEO (la première version est gardée)
+BLOGIFY_SEO_RETRY_MIN_SECONDS = float(os.getenv("BLOGIFY_SEO_RETRY_MIN_SECONDS", "60"))
+
+
 @app.route("/blogify", methods=["POST"])
 @login_required
 def blogify():
+    transcript_handle = request.form.get("transcript_handle", "").strip()
+    # source_text n'est envoyé que si l'utilisateur a modifié la transcription
     transcript = request.form.get("source_text", "").strip()
+    video_id = None
     titre_souhaite = request.form.get("titre_souhaite", "").strip() or None
     with_image = request.form.get("with_image")  # "1" si coché, None sinon
 
@@ -530,10 +634,6 @@ def blogify():
     warning = None
     article_record_id = None
 
-    if not transcript:
-        erreur = "Aucun texte à transformer. Commence par générer une transcription."
-        return render_template("transcription.html", active_page="transcription", transcript=transcript, erreur=erreur)
-
     user = get_current_user()
     if not user:
         erreur = "Utilisateur non authentifié."
@@ -544,31 +644,94 @@ def blogify():
         erreur = "Erreur interne : identifiant utilisateur manquant."
         return render_template("transcription.html", active_page="transcription", transcript=transcript, erreur=erreur)
 
-    # Lecture du solde
-    try:
-        table = get_users_table()
-        record = table.get(user_id)
-        fields = record.get("fields", {})
-        credits_current = int(fields.get("credits", 0) or 0)
-    except Exception as e:
-        print("Erreur récupération crédits avant blogify :", e)
-        credits_current = int(session.get("user", {}).get("credits", 0) or 0)
+    # Même formulaire renvoyé (double clic, rafraîchissement) : on se rattache à la
+    # génération en cours ou à son résultat au lieu de la relancer
+    idem_key = request.form.get("idempotency_key", "")
+    if not idempotency.cle_valide(idem_key):
+        idem_key = idempotency.nouvelle_cle()  # ancien formulaire sans clé
+    etat, attempt = idempotency.demarrer("blogify", user_id, idem_key)
+    if etat == "pending":
+        logger.info("blogify déjà en cours, attente du résultat", user_id=user_id)
+        resultat = idempotency.attendre("blogify", user_id, idem_key, BLOGIFY_IDEMPOTENCY_WAIT_SECONDS)
+        if resultat is None:
+            erreur = ("La génération de cet article est déjà en cours. Il apparaîtra dans "
+                      "« Mes articles » dès qu'il sera prêt.")
+            return render_template("transcription.html", active_page="transcription", transcript=transcript,
+                                   transcript_handle=transcript_handle, erreur=erreur)
+        return _rendre_blogify(resultat, user_id)
+    if etat == "done":
+        logger.info("blogify déjà traité, résultat réutilisé", user_id=user_id)
+        return _rendre_blogify(attempt, user_id)
+    # limitation après l'idempotence : un renvoi du même formulaire ne consomme pas de jeton
+    refus = rate_limit.verifier("blogify")
+    if refus is not None:
+        idempotency.echouer("blogify", user_id, idem_key)
+        return refus
+
+    stored = transcript_store.lire(transcript_handle, user_id)
+    video_chapters = transcript_store.lire_chapitres(transcript_handle, user_id) if stored else []
+    if stored:
+        video_id, stored_text = stored
+        if not transcript:
+            transcript = stored_text
+        elif transcript != stored_text:
+            # Texte modifié : nouveau handle pour que la page suivante reparte de cette version
+            # (les chapitres, horodatés sur la vidéo, restent valables)
+            transcript_handle = transcript_store.enregistrer(user_id, video_id, transcript, video_chapters)
+    elif transcript:
+        transcript_handle = transcript_store.enregistrer(user_id, None, transcript)
+
+    if not transcript:
+        if transcript_handle:
+            erreur = "La transcription a expiré. Relance la transcription de la vidéo."
+        else:
+            erreur = "Aucun texte à transformer. Commence par générer une transcription."
+        idempotency.echouer("blogify", user_id, idem_key)
+        return render_template("transcription.html", active_page="transcription", transcript=transcript,
+                               transcript_handle=transcript_handle, erreur=erreur)
+
+    # OpenAI en panne : on renonce avant de réserver des crédits
+    if resilience.ouvert("openai"):
+        idempotency.echouer("blogify", user_id, idem_key)
+        erreur = str(resilience.DependanceIndisponible("openai", "open"))
+        return render_template("transcription.html", active_page="transcription", transcript=transcript,
+                               transcript_handle=transcript_handle, erreur=erreur)
 
     # Coût : 1 crédit pour l'article, +2 si image demandée
     cost_for_article = 1
     cost_for_image = 2 if with_image else 0
     total_cost = cost_for_article + cost_for_image
 
-    if credits_current < total_cost:
-        if with_image and credits_current >= 1:
-            # Pas assez pour l'image, mais assez pour l'article seul
+    # Réservation atomique des crédits AVANT la génération : confirmée si l'article est
+    # généré, libérée sinon. Pas de lecture-modification-écriture sur Airtable.
+    # Dérivé de la clé d'idempotence : un même envoi ne peut pas débiter deux fois
+    reservation_id = f"blogify-{idem_key}-{attempt}"
+    try:
+        try:
+            credits_ledger.reserver(user_id, total_cost, reservation_id)
+        except credits_ledger.SoldeInsuffisant:
+            if not with_image:
+                raise
+            # Pas assez pour l'image, on retente pour l'article seul
+            credits_ledger.reserver(user_id, cost_for_article, reservation_id)
             warning = "Solde insuffisant pour générer l'image. L'article sera généré sans illustration."
             with_image = None  # on désactive l'image, on ne prendra que 1 crédit
-            total_cost = 1
-        else:
-            erreur = "Solde insuffisant : vous n’avez plus assez de crédits."
-            return render_template("transcription.html", active_page="transcription", transcript=transcript, erreur=erreur)
- 
+            total_cost = cost_for_article
+    except credits_ledger.SoldeInsuffisant:
+        idempotency.echouer("blogify", user_id, idem_key)
+        erreur = "Solde insuffisant : vous n’avez plus assez de crédits."
+        return render_template("transcription.html", active_page="transcription", transcript=transcript,
+                               transcript_handle=transcript_handle, erreur=erreur)
+    except Exception:
+        logger.exception("réservation des crédits impossible avant blogify", user_id=user_id)
+        idempotency.echouer("blogify", user_id, idem_key)
+        erreur = "Impossible de vérifier votre solde de crédits pour le moment. Réessayez dans un instant."
+        return render_template("transcription.html", active_page="transcription", transcript=transcript,
+                               transcript_handle=transcript_handle, erreur=erreur)
+
+    # Les appels OpenAI (article, régénération, image) ne peuvent pas entamer le temps
+    # gardé pour la sauvegarde de l'article
+    resilience.reserver(BLOGIFY_SAVE_RESERVE_SECONDS)
     try:
         data = generer_article_et_seo(
             transcript,
@@ -576,6 +739,7 @@ def blogify():
             ton="pédagogique et accessible",
             public_cible="grand public intéressé par le sujet",
             langue="français",
+            plan=chapters.plan_article(video_chapters),
         )
         article_html = data.get("html") or data.get("article_html") or ""
         seo_keyword = data.get("keyword")
@@ -583,41 +747,66 @@ def blogify():
         meta_description = data.get("meta_description")
         image_prompt = data.get("image_prompt", "")
     except Exception as e:
-        print("ERREUR GENERATION ARTICLE:", repr(e))
-        traceback.print_exc()
+        logger.exception("génération de l'article en échec", user_id=user_id, source_len=len(transcript))
+        credits_ledger.liberer(reservation_id)
+        idempotency.echouer("blogify", user_id, idem_key)
         erreur = f"Erreur lors de la génération de l'article : {e}"
-        return render_template("transcription.html", active_page="transcription", transcript=transcript, erreur=erreur)
-    
+        return render_template("transcription.html", active_page="transcription", transcript=transcript,
+                               transcript_handle=transcript_handle, erreur=erreur)
+
+    # Analyse SEO ; une seule régénération (sans crédit supplémentaire) si le score est trop bas
     try:
-        rec = table.get(user_id)
-        current_after = int(rec.get("fields", {}).get("credits", 0) or 0)
+        seo = seo_score.analyser(article_html, seo_keyword, seo_title, meta_description)
     except Exception as e:
-        print("Erreur relecture crédits avant décrémentation :", e)
-        current_after = int(session.get("user", {}).get("credits", 0) or 0)
-
-    if current_after < total_cost:
-        warning = "L'article a été généré mais le solde est insuffisant au moment de la finalisation."
-    else:
+        logger.warning("analyse SEO impossible", user_id=user_id, error=e)
+        seo = None
+    if seo and seo_score.doit_regenerer(seo) and resilience.restant() < BLOGIFY_SEO_RETRY_MIN_SECONDS:
+        logger.info("score SEO insuffisant, pas de régénération faute de temps", user_id=user_id,
+                    score=seo["score"], remaining_s=round(resilience.restant(), 1))
+    elif seo and seo_score.doit_regenerer(seo):
+        logger.info("score SEO insuffisant, régénération", user_id=user_id, score=seo["score"])
         try:
-            new_credits = current_after - total_cost
-            table.update(user_id, {"credits": new_credits})
-            session_user = session.get("user", {}) or {}
-            session_user["credits"] = new_credits
-            session_user["_credits_updated_at"] = int(time.time())
-            session["user"] = session_user
+            retry = generer_article_et_seo(
+                transcript,
+                titre_souhaite=titre_souhaite,
+                ton="pédagogique et accessible",
+                public_cible="grand public intéressé par le sujet",
+                langue="français",
+                corrections=seo["issues"],
+                plan=chapters.plan_article(video_chapters),
+            )
+            retry_html = retry.get("html") or retry.get("article_html") or ""
+            retry_seo = seo_score.analyser(retry_html, retry.get("keyword"), retry.get("seo_title"),
+                                           retry.get("meta_description"))
+            if retry_seo["score"] > seo["score"]:
+                data, seo, article_html = retry, retry_seo, retry_html
+                seo_keyword = data.get("keyword")
+                seo_title = data.get("seo_title")
+                meta_description = data.get("meta_description")
+                image_prompt = data.get("image_prompt", "") or image_prompt
         except Exception as e:
-            warning = f"L'article a été généré, mais impossible de mettre à jour les crédits : {e}"
-            print("Erreur mise à jour credits après génération :", e)
+            logger.warning("régénération SEO en échec, première version conservée", user_id=user_id, error=e)
+
+    try:
+        credits_ledger.confirmer(reservation_id)
+        session_user = session.get("user", {}) or {}
+        session_user["credits"] = credits_ledger.solde(user_id)
+        session_user["_credits_updated_at"] = int(time.time())
+        session["user"] = session_user
+    except Exception as e:
+        warning = f"L'article a été généré, mais impossible de mettre à jour les crédits : {e}"
+        logger.exception("confirmation des crédits impossible après génération", user_id=user_id)
 
     # Génération image (seulement si demandé)
     if with_image:
         try:
             image_url = generer_image_article(image_prompt)
         except Exception as e:
-            print("Erreur génération image (non bloquante) :", e)
+            logger.warning("génération de l'image en échec (non bloquant)", user_id=user_id, error=e)
             image_url = None
 
-    # Sauvegarde dans Airtable
+    # Sauvegarde dans Airtable, avec le temps mis de côté
+    resilience.liberer_reserve()
     try:
         title_to_save = seo_title or (titre_souhaite or "Article généré")
         record = save_article_to_airtable(
@@ -628,10 +817,11 @@ def blogify():
             meta_description=meta_description,
             html_content=article_html,
             image_url=None,
-            source_video_id=None,
+            source_video_id=video_id,
             source_transcript=None,
             credits_used=total_cost,
-            status="draft"
+            status="draft",
+            search_transcript=transcript,
         )
         article_record_id = record.get("id")
       
@@ -640,25 +830,51 @@ def blogify():
         session_user["_credits_updated_at"] = int(time.time())
         session["user"] = session_user
 
-    except Exception as e:
-        print("Erreur sauvegarde article Airtable :", e)
+    except Exception:
+        logger.exception("sauvegarde de l'article impossible", user_id=user_id)
         warning = (warning or "") + " Erreur lors de la sauvegarde de l'article."
 
-    return render_template(
+    resultat = {
+        "transcript_handle": transcript_handle,
+        "video_id": video_id,
+        "chapitres": video_chapters,
+        "article_html": article_html,
+        "seo_keyword": seo_keyword,
+        "seo_title": seo_title,
+        "meta_description": meta_description,
+        "image_url": image_url,
+        "warning": warning,
+        "article_id": article_record_id,
+    }
+    try:
+        idempotency.terminer("blogify", user_id, idem_key, resultat)
+    except Exception as e:
+        logger.warning("enregistrement du résultat blogify impossible", user_id=user_id, error=e)
+    return _rendre_blogify(resultat, user_id, transcript)
+
+
+def _rendre_blogify(resultat: dict, user_id: str, transcript: str = None):
+    """
+    Page de résultat de /blogify, aussi utilisée pour rejouer un résultat déjà généré.
+    """
+    if transcript is None:
+        stored = transcript_store.lire(resultat["transcript_handle"], user_id)
+        transcript = stored[1] if stored else None
+    return rendre_en_flux(
         "transcription.html",
         active_page="transcription",
         transcript=transcript,
-        erreur=erreur,
-        article_html=article_html,
-        seo_keyword=seo_keyword,
-        seo_title=seo_title,
-        meta_description=meta_description,
-        image_url=image_url,
-        warning=warning,
-        article_id=article_record_id,
+        description_chapitres=chapters.description_youtube(resultat["chapitres"]),
+        **resultat,
     )
 
 
+def _date_courte(created_raw: str):
+    # date ISO Airtable -> jj/mm/aa (valeur brute si illisible)
+    try:
+        return datetime.fromisoformat(created_raw.replace("Z", "+00:00")).strftime("%d/%m/%y")
+    except Exception:
+        return created_raw
 
 
 @app.route("/articles")
@@ -671,50 +887,111 @@ def mes_articles():
 def mes_articles_list():
     user = get_current_user()
     articles = []
+    query = (request.args.get("q") or "").strip()
+    if query:
+        # recherche plein texte : index local uniquement, aucun appel Airtable
+        try:
+            for r in search_index.rechercher(user.get("id"), query):
+                articles.append({"id": r["id"], "title": r["title"], "created_at": _date_courte(r["created_time"]),
+                                 "snippet": r["snippet"]})
+        except Exception:
+            logger.exception("recherche d'articles impossible", user_id=user.get("id"))
+        return render_template("mes_articles.html", articles=articles, query=query, active_page="mes_articles",
+                               title="Mes articles – YouTranscripRank")
+
+    degrade = False
     try:
         table = get_articles_table_helper()
-        records = table.all()
+        records = table.list_linked("user", user.get("id")) if user else []
         for r in records:
             fields = r.get("fields", {})
-            linked = fields.get("user") or []  
-            if user and linked and user.get("id") in linked:
-                created_raw = r.get("createdTime")  
-                created_fmt = None
-                if created_raw:
-                    try:
-                        dt = datetime.fromisoformat(created_raw.replace("Z", "+00:00"))
-                        created_fmt = dt.strftime("%d/%m/%y")  # jj/mm/aa
-                    except Exception:
-                        created_fmt = created_raw  # fallback
-
-                articles.append({
-                    "id": r.get("id"),
-                    "title": fields.get("title"),
-                    "seo_title": fields.get("seo_title"),
-                    "keyword": fields.get("keyword"),
-                    "created_at": created_fmt,
-                    "status": fields.get("status"),
-                })
+            created_raw = r.get("createdTime")  
+            created_fmt = None
+            if created_raw:
+                try:
+                    dt = datetime.fromisoformat(created_raw.replace("Z", "+00:00"))
+                    created_fmt = dt.strftime("%d/%m/%y")  # jj/mm/aa
+                except Exception:
+                    created_fmt = created_raw  # fallback
+
+            articles.append({
+                "id": r.get("id"),
+                "title": fields.get("title"),
+                "seo_title": fields.get("seo_title"),
+                "keyword": fields.get("keyword"),
+                "created_at": created_fmt,
+                "status": fields.get("status"),
+                "seo": seo_score.analyser_article(fields),  # en cache par empreinte du contenu
+            })
     except Exception as e:
-        print("Erreur récupération articles :", e)
+        if isinstance(e, resilience.DependanceIndisponible):
+            logger.warning("liste des articles en mode dégradé", user_id=user.get("id"), error=e)
+        else:
+            logger.exception("récupération des articles impossible")
+        # liste de secours : articles connus de l'index de recherche local
+        degrade = True
         articles = []
+        try:
+            for r in search_index.lister(user.get("id")):
+                articles.append({"id": r["id"], "title": r["title"], "created_at": _date_courte(r["created_time"])})
+        except Exception:
+            logger.exception("liste de secours des articles impossible", user_id=user.get("id"))
+
+    return render_template("mes_articles.html", articles=articles, degrade=degrade, active_page="mes_articles",
+                           title="Mes articles – YouTranscripRank")
 
-    return render_template("mes_articles.html", articles=articles, active_page="mes_articles", title="Mes articles – YouTranscripRank")
+
+@app.route("/mes-articles/export")
+@login_required
+@rate_limit.limite("export", methods=("GET",))
+def exporter_articles():
+    fmt = request.args.get("format", "html")
+    if fmt not in export.FORMATS:
+        abort(400)
+    user = get_current_user()
+    mimetype, extension = export.FORMATS[fmt]
+    filename = f"articles-{datetime.now().strftime('%Y%m%d')}.{extension}"
+    # le générateur ne touche plus au contexte de requête : user_id capturé ici
+    response = Response(export.flux(user["id"], fmt), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 
 @app.route("/article/<article_id>")
 @login_required
 def voir_article(article_id):
-    try:
-        table = get_articles_table_helper()
-        rec = table.get(article_id)
-    except Exception as e:
-        return f"Article introuvable : {e}", 404
+    user = get_current_user()
 
-    fields = rec.get("fields", {})
-    html_content = fields.get("html_content", "")
-    # Si tu veux nettoyer -> utiliser bleach (optionnel)
-    return render_template("article_view.html", article=fields, html_content=html_content)
+    # HTML nettoyé une seule fois, au remplissage du cache ; pas d'appel Airtable si le cache est frais
+    entry = article_cache.lire(article_id)
+    if entry is None:
+        try:
+            table = get_articles_table_helper()
+            rec = table.get(article_id)
+        except resilience.DependanceIndisponible as e:
+            # Airtable en panne : dernière version en cache, même à revalider
+            entry = article_cache.lire(article_id, perime=True)
+            if entry is None:
+                return str(e), 503
+        except Exception as e:
+            return f"Article introuvable : {e}", 404
+        else:
+            entry = article_cache.remplir(rec)
+
+    if entry["owners"] and user.get("id") not in entry["owners"]:
+        return "Article introuvable", 404
+
+    etag = article_cache.etag_page(entry, user)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(
+            render_template("article_view.html", article=entry["article"], html_content=entry["html"])
+        )
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 
 @app.route("/upgrade", methods=["GET", "POST"])
@@ -732,7 +1009,10 @@ def mise_a_niveau():
 
     fields = record.get("fields", {})
     current_plan = fields.get("planName", "free")
-    current_credits = fields.get("credits", 0)
+    try:
+        current_credits = credits_ledger.solde(record["id"])
+    except Exception:
+        current_credits = fields.get("credits", 0)
 
     if request.method == "POST":
         new_status = request.form.get("status")  # "free" | "medium" | "premium"
@@ -797,33 +1077,36 @@ def create_checkout_session(plan):
         fields = record.get("fields", {})
         current_sub_id = fields.get("stripeSubscriptionId")
     except Exception as e:
-        print("Erreur récupération user avant upgrade :", e)
+        logger.warning("récupération de l'utilisateur avant upgrade impossible", error=e)
         current_sub_id = None
 
     if current_sub_id:
         try:
             # Annulation immédiate
-            stripe.Subscription.delete(current_sub_id)
-            print(f"[Upgrade] Ancienne subscription {current_sub_id} annulée immédiatement.")
+            with resilience.appel("stripe", "subscription.delete"):
+                stripe.Subscription.delete(current_sub_id)
+            stripe_cache.invalider_abonnement(current_sub_id)
+            logger.info("upgrade : ancienne subscription annulée", subscription_id=current_sub_id)
         except Exception as e:
-            print("Erreur annulation ancienne subscription Stripe :", e)
+            logger.warning("upgrade : annulation de l'ancienne subscription impossible", subscription_id=current_sub_id, error=e)
 
     try:
-        session_stripe = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[{"price": price_id, "quantity": 1}],
-            mode="subscription",
-            success_url=url_for("upgrade_success", _external=True) + "?session_id={CHECKOUT_SESSION_ID}",
-            cancel_url=url_for("mise_a_niveau", _external=True),
-            metadata={
-                "user_id": user.get("id"),
-                "plan": plan
-            },
-        )
+        with resilience.appel("stripe", "checkout_session.create"):
+            session_stripe = stripe.checkout.Session.create(
+                payment_method_types=["card"],
+                line_items=[{"price": price_id, "quantity": 1}],
+                mode="subscription",
+                success_url=url_for("upgrade_success", _external=True) + "?session_id={CHECKOUT_SESSION_ID}",
+                cancel_url=url_for("mise_a_niveau", _external=True),
+                metadata={
+                    "user_id": user.get("id"),
+                    "plan": plan
+                },
+            )
         # Retourner l'URL de redirection
         return jsonify({"url": session_stripe.url})
     except Exception as e:
-        print("Erreur création Stripe session:", e)
+        logger.exception("création de la session Checkout impossible", plan=plan)
         return jsonify({"error": str(e)}), 500
 
 
@@ -835,12 +1118,9 @@ def upgrade_success():
         return "Session Stripe introuvable", 400
 
     try:
-        checkout_session = stripe.checkout.Session.retrieve(
-            session_id,
-            expand=["subscription", "customer"],
-        )
+        checkout_session = stripe_cache.get_checkout_session(session_id)
     except Exception as e:
-        print("Erreur récupération session Stripe:", e)
+        logger.exception("récupération de la session Checkout impossible", session_id=session_id)
         return f"Erreur lors de la vérification du paiement : {e}", 500
 
     metadata = checkout_session.get("metadata", {}) or {}
@@ -856,6 +1136,8 @@ def upgrade_success():
         return "Données utilisateur manquantes dans la session Stripe.", 400
 
     stripe_customer_id = checkout_session.get("customer")
+    if isinstance(stripe_customer_id, dict):
+        stripe_customer_id = stripe_customer_id.get("id")
     stripe_subscription_id = sub.get("id") if isinstance(sub, dict) else sub
 
     try:
@@ -865,7 +1147,7 @@ def upgrade_success():
         if isinstance(user_id, str) and user_id.startswith("rec"):
             rec = table.get(user_id)
         else:
-            rec = table.first(formula=f"LOWER({{email}}) = '{user_id.lower()}'")
+            rec = table.first_where("email", user_id, lower=True)
             if not rec:
                 raise RuntimeError("Utilisateur introuvable en Airtable.")
 
@@ -879,7 +1161,7 @@ def upgrade_success():
         if stripe_subscription_id and not fields.get("stripeSubscriptionId"):
             updates["stripeSubscriptionId"] = stripe_subscription_id
         if updates:
-            print("DEBUG Airtable update user", user_record_id, "updates=", updates)
+            logger.debug("upgrade_success : mise à jour utilisateur", user_id=user_record_id, updates=updates)
             table.update(user_record_id, updates)
             rec = table.get(user_record_id)
             fields = rec.get("fields", {})
@@ -890,7 +1172,7 @@ def upgrade_success():
             {
                 "planName": fields.get("planName") or plan,
                 "status": fields.get("status") or "payant",
-                "credits": int(fields.get("credits", 0) or 0),
+                "credits": credits_ledger.solde(user_record_id),
                 "stripeCustomerId": fields.get("stripeCustomerId") or stripe_customer_id,
                 "stripeSubscriptionId": fields.get("stripeSubscriptionId") or stripe_subscription_id,
                 "_credits_updated_at": int(time.time()),
@@ -905,10 +1187,8 @@ def upgrade_success():
             plan=plan,
         )
 
-    except Exception as e:
-        import traceback
-        print("Échec mise à jour Airtable dans upgrade_success:", e)
-        traceback.print_exc()
+    except Exception:
+        logger.exception("upgrade_success : mise à jour Airtable en échec")
         user_msg = (
             "Le paiement a été confirmé, mais impossible de mettre à jour votre compte automatiquement. "
             "Nous avons enregistré l'incident et nous allons le traiter. "
@@ -949,10 +1229,12 @@ def cancel_subscription():
             return redirect(url_for("mon_compte"))
 
         # Annuler à la fin de la période actuelle 
-        stripe.Subscription.modify(
-            stripe_subscription_id,
-            cancel_at_period_end=True,
-        )
+        with resilience.appel("stripe", "subscription.modify"):
+            stripe.Subscription.modify(
+                stripe_subscription_id,
+                cancel_at_period_end=True,
+            )
+        stripe_cache.invalider_abonnement(stripe_subscription_id)
 
         # Flag pour la popup de succès
         session_user = session.get("user", {}) or {}
@@ -961,8 +1243,8 @@ def cancel_subscription():
 
         return redirect(url_for("mon_compte"))
 
-    except Exception as e:
-        print("Erreur annulation subscription:", e)
+    except Exception:
+        logger.exception("annulation de la subscription impossible")
         return redirect(url_for("mon_compte"))
 
 @app.route("/account", methods=["GET", "POST"])
@@ -993,7 +1275,10 @@ def mon_compte():
 
     # Valeurs actuelles
     current_plan = fields.get("planName", "free")
-    credits_left = int(fields.get("credits", 0) or 0)
+    try:
+        credits_left = credits_ledger.solde(record["id"])
+    except Exception:
+        credits_left = int(fields.get("credits", 0) or 0)
     status = fields.get("status", "")  
 
     if request.method == "POST":
@@ -1057,6 +1342,8 @@ def mon_compte():
                     new_hash = generate_password_hash(new_password)
                     try:
                         table.update(record["id"], {"password": new_hash})
+                        # les autres appareils connectés doivent se reconnecter
+                        session_store.regenerer(session, fermer_autres=True)
                         # message de succès
                         success = "Votre mot de passe a été mis à jour avec succès."
                     except Exception as e:
@@ -1086,6 +1373,7 @@ def mon_compte():
 
 
 @app.route("/signup", methods=["GET", "POST"])
+@rate_limit.limite("signup")
 def signup():
     table = get_users_table()
     erreur = None
@@ -1104,8 +1392,7 @@ def signup():
             erreur = "Le mot de passe doit contenir au moins 6 caractères."
         else:
             try:
-                formula = f"LOWER({{email}}) = '{email}'"
-                existing = table.first(formula=formula)
+                existing = table.first_where("email", email, lower=True)
             except Exception as e:
                 return f"Erreur lors de la vérification de l'utilisateur : {e}"
 
@@ -1163,8 +1450,7 @@ def confirm_signup():
             erreur = "Merci de renseigner l'e-mail et le code de confirmation."
         else:
             try:
-                formula = f"LOWER({{email}}) = '{email}'"
-                record = table.first(formula=formula)
+                record = table.first_where("email", email, lower=True)
             except Exception as e:
                 return f"Erreur lors de la recherche de l'utilisateur : {e}"
 
@@ -1187,6 +1473,7 @@ def confirm_signup():
                         return f"Erreur lors de la confirmation du compte : {e}"
 
                     # Connexion après confirmation
+                    session_store.regenerer(session)
                     session["user"] = {
                         "id": record["id"],
                         "email": fields.get("email"),
@@ -1218,6 +1505,7 @@ def logout():
 
 
 @app.route("/login", methods=["GET", "POST"])
+@rate_limit.limite("login")
 def login():
     table = get_users_table()
     erreur = None
@@ -1232,8 +1520,7 @@ def login():
             erreur = "Merci de renseigner un e-mail et un mot de passe."
         else:
             try:
-                formula = f"LOWER({{email}}) = '{email}'"
-                record = table.first(formula=formula)
+                record = table.first_where("email", email, lower=True)
             except Exception as e:
                 return f"Erreur lors de la recherche de l'utilisateur : {e}"
 
@@ -1248,7 +1535,8 @@ def login():
                 elif not check_password_hash(password_hash, password):
                     erreur = "Mot de passe incorrect."
                 else:
-                    # Auth OK → on stocke en session
+                    # Auth OK → nouvel identifiant de session, puis on stocke en session
+                    session_store.regenerer(session)
                     session["user"] = {
                         "id": record.get("id"),
                         "email": fields.get("email"),
@@ -1265,22 +1553,132 @@ def login():
         email_value=email_value,
     )
 
+@app.route("/admin/webhooks", methods=["GET", "POST"])
+@admin_required
+def admin_webhooks():
+    """
+    Dead-letter des webhooks Stripe : events abandonnés après WEBHOOK_MAX_ATTEMPTS essais.
+    """
+    success = None
+    if request.method == "POST":
+        event_id = request.form.get("event_id", "")
+        if webhook_queue.rejouer(event_id):
+            success = f"Event {event_id} remis en file."
+
+    status = request.args.get("status", "dead")
+    return render_template(
+        "admin_webhooks.html",
+        title="Webhooks Stripe – Admin",
+        stats=webhook_queue.stats(),
+        events=webhook_queue.lister(status),
+        status=status,
+        success=success,
+    )
+
+
+@app.route("/admin/resilience", methods=["GET", "POST"])
+@admin_required
+def admin_resilience():
+    """
+    État des disjoncteurs des dépendances externes, avec remise à zéro manuelle.
+    """
+    success = None
+    if request.method == "POST":
+        service = request.form.get("service", "")
+        if resilience.reinitialiser(service):
+            success = f"Disjoncteur {service} refermé."
+    return render_template(
+        "admin_resilience.html",
+        title="Disjoncteurs – Admin",
+        breakers={
+            service: dict(b, opened=datetime.fromtimestamp(b["opened_at"]).strftime("%d/%m %H:%M:%S")
+                          if b["opened_at"] else None)
+            for service, b in resilience.etats().items()
+        },
+        services=resilience.SERVICES,
+        timeouts=resilience.TIMEOUTS,
+        success=success,
+    )
+
+
+@app.route("/admin/profiler", methods=["GET", "POST"])
+@admin_required
+def admin_profiler():
+    """
+    Active / désactive le profilage d'une requête sur N et affiche les fonctions les plus coûteuses.
+    """
+    success = None
+    if request.method == "POST":
+        action = request.form.get("action")
+        if action == "reset":
+            profiler.reinitialiser()
+            success = "Échantillons effacés."
+        else:
+            try:
+                n = int(request.form.get("sample_every", "0") or 0)
+            except ValueError:
+                n = 0
+            profiler.configurer(n)
+            success = f"Profilage d'une requête sur {n}." if n else "Profilage désactivé."
+
+    return render_template(
+        "admin_profiler.html",
+        title="Profilage – Admin",
+        sample_every=profiler.sample_every(),
+        interval_ms=profiler.PROFILER_INTERVAL_MS,
+        top=profiler.resume(),
+        success=success,
+    )
+
+
+@app.route("/admin/profiler/collapsed.txt")
+@admin_required
+def admin_profiler_collapsed():
+    return Response(profiler.collapsed(), mimetype="text/plain")
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    if METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+            abort(401)
+    return Response(metrics.exposition(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/healthz")
+def healthz():
+    # liveness : le process répond, sans aucune I/O
+    return "ok", 200, {"Content-Type": "text/plain", "Cache-Control": "no-store"}
+
+
+@app.route("/readyz")
+def readyz():
+    # readiness : dernier résultat des sondes de fond, jamais d'appel externe ici
+    state = health.etat()
+    resp = jsonify(state)
+    resp.status_code = 200 if state["ready"] else 503
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
 @app.route("/test-openai")
+@admin_required
 def test_openai():
     try:
         resp = client.responses.create(
             model="gpt-5.1",
             input="ping",
         )
-        print("TEST OPENAI OK")
+        logger.info("test OpenAI ok")
         return "TEST OPENAI OK", 200
     except Exception as e:
-        print("TEST OPENAI FAILED:", repr(e))
-        traceback.print_exc()
+        logger.exception("test OpenAI en échec")
         return f"TEST OPENAI FAILED: {e}", 500    
 
 
 @app.route("/debug/users")
+@admin_required
 def debug_users():
     table = get_users_table()  # si l'import est bon, plus de NameError ici
     try:
@@ -0,0 +1,171 @@
+# app_log.py
+"""
+Logs structurés non bloquants.
+
+    from app_log import get_logger
+    logger = get_logger(__name__)
+    logger.info("article généré", user_id=uid, html_len=len(html))
+
+Chaque ligne est au format clé=valeur (logfmt). Les threads de requête ne font que
+mettre l'enregistrement dans une file bornée ; un thread dédié écrit sur stderr
+(comme les logs de gunicorn : stdout reste libre pour les sorties des outils).
+Les valeurs longues sont tronquées, les logs DEBUG sont échantillonnés.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Part des logs DEBUG réellement émis (1 = tous), quand LOG_LEVEL=DEBUG
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_MAX_FIELD_LENGTH = int(os.getenv("LOG_MAX_FIELD_LENGTH", "500"))
+LOG_QUEUE_SIZE = 10000
+
+_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_listener = None
+_listener_pid = None
+_listener_mutex = threading.Lock()
+_dropped = 0
+
+
+def tronquer(value, limit: int = None):
+    """
+    Représentation courte d'une valeur de log (jamais plus de `limit` caractères).
+    """
+    limit = limit or LOG_MAX_FIELD_LENGTH
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} octets>"
+    if isinstance(value, BaseException):
+        value = f"{type(value).__name__}: {value}"
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) > limit:
+        return f"{text[:limit]}…(+{len(text) - limit})"
+    return text
+
+
+def _logfmt(value: str) -> str:
+    if value == "" or any(c in value for c in ' ="\n'):
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+    return value
+
+
+class _LogfmtFormatter(logging.Formatter):
+    def format(self, record):
+        ts = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+        parts = [
+            f"ts={ts}",
+            f"level={record.levelname.lower()}",
+            f"logger={record.name}",
+            f"msg={_logfmt(record.getMessage())}",
+        ]
+        for key, value in getattr(record, "fields", {}).items():
+            parts.append(f"{key}={_logfmt(value)}")
+        if record.exc_text:
+            parts.append(f"exc={_logfmt(record.exc_text)}")
+        return " ".join(parts)
+
+
+class _DebugSampler(logging.Filter):
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < LOG_DEBUG_SAMPLE_RATE
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    File pleine : on perd le log plutôt que de bloquer la requête (compteur `_dropped`).
+    """
+
+    def prepare(self, record):
+        # La trace d'exception est formatée ici (les frames ne survivent pas au thread)
+        if record.exc_info:
+            record.exc_text = tronquer(logging.Formatter().formatException(record.exc_info), 4000)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        global _dropped
+        _assurer_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+def _assurer_listener():
+    # Thread d'écriture propre au process (les threads ne survivent pas au fork gunicorn)
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_mutex:
+        if _listener_pid == os.getpid():
+            return
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(_LogfmtFormatter())
+        _listener = logging.handlers.QueueListener(_queue, stream, respect_handler_level=False)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def _arreter():
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()  # vide la file avant la sortie
+
+
+class StructuredLogger:
+    """
+    Enveloppe d'un logging.Logger : message + champs clé=valeur tronqués.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+
+    def _log(self, level, msg, fields, exc_info=False):
+        if not self._logger.isEnabledFor(level):
+            return
+        self._logger.log(
+            level, msg, exc_info=exc_info,
+            extra={"fields": {k: tronquer(v) for k, v in fields.items() if v is not None}},
+        )
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg, **fields):
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg, **fields):
+        # à appeler dans un bloc except : ajoute la trace
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+
+def _configurer():
+    root = logging.getLogger("ytr")
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+    handler = _NonBlockingQueueHandler(_queue)
+    handler.addFilter(_DebugSampler())
+    root.addHandler(handler)
+    atexit.register(_arreter)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(logging.getLogger(f"ytr.{name}"))
+
+
+def logs_perdus() -> int:
+    return _dropped
+
+
+_configurer()
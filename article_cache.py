@@ -0,0 +1,170 @@
+# article_cache.py
+import hashlib
+import json
+import math
+import os
+import time
+from html import escape
+from html.parser import HTMLParser
+
+import metrics
+from local_db import ensure_schema, get_connection
+
+# Au-delà de ce délai on relit le record (prise en compte des modifs faites dans Airtable)
+ARTICLE_CACHE_REVALIDATE_SECONDS = int(os.getenv("ARTICLE_CACHE_REVALIDATE_SECONDS", "300"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS article_render_cache (
+    record_id TEXT PRIMARY KEY,
+    version TEXT NOT NULL,        -- empreinte des champs affichés (HTML brut + meta + propriétaires)
+    etag TEXT NOT NULL,
+    owners TEXT NOT NULL,         -- ids des utilisateurs liés (JSON)
+    meta TEXT NOT NULL,           -- title, keyword, seo_title, meta_description, image_url (JSON)
+    html TEXT NOT NULL,           -- HTML déjà nettoyé
+    checked_at REAL NOT NULL
+);
+"""
+
+# Balises produites par generer_article_et_seo (+ quelques balises inoffensives)
+_ALLOWED_TAGS = {
+    "h1", "h2", "h3", "h4", "h5", "h6", "p", "ul", "ol", "li", "strong", "em", "b", "i",
+    "blockquote", "br", "a", "code", "pre", "span", "table", "thead", "tbody", "tr", "th", "td",
+}
+_VOID_TAGS = {"br"}
+_DROP_CONTENT_TAGS = {"script", "style", "iframe", "object", "embed", "template", "noscript"}
+_SAFE_URL_PREFIXES = ("http://", "https://", "mailto:", "/", "#")
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _DROP_CONTENT_TAGS:
+            self._skip_depth += 1
+            return
+        if self._skip_depth or tag not in _ALLOWED_TAGS:
+            return
+        attr_html = ""
+        if tag == "a":
+            href = dict(attrs).get("href") or ""
+            if href.strip().lower().startswith(_SAFE_URL_PREFIXES):
+                attr_html = f' href="{escape(href.strip(), quote=True)}" rel="nofollow noopener"'
+        self.out.append(f"<{tag}{attr_html}>")
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in _DROP_CONTENT_TAGS:
+            self._skip_depth -= 1
+
+    def handle_endtag(self, tag):
+        if tag in _DROP_CONTENT_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if self._skip_depth or tag not in _ALLOWED_TAGS or tag in _VOID_TAGS:
+            return
+        self.out.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.out.append(escape(data, quote=False))
+
+
+def nettoyer_html(html: str) -> str:
+    """
+    Nettoie le HTML généré par le modèle : liste blanche de balises, aucun attribut
+    hormis les href sûrs, contenu des <script>/<style> supprimé.
+    """
+    parser = _Sanitizer()
+    parser.feed(html or "")
+    parser.close()
+    return "".join(parser.out)
+
+
+def _init():
+    ensure_schema("article_cache", _SCHEMA)
+
+
+def _row_to_entry(row) -> dict:
+    return {
+        "record_id": row["record_id"],
+        "version": row["version"],
+        "etag": row["etag"],
+        "owners": json.loads(row["owners"]),
+        "article": json.loads(row["meta"]),
+        "html": row["html"],
+    }
+
+
+def lire(record_id: str, perime: bool = False):
+    """
+    Retourne l'article rendu depuis le cache local, ou None s'il est absent ou à revalider.
+    `perime=True` : retourne aussi une entrée à revalider (source indisponible).
+    """
+    _init()
+    max_age = math.inf if perime else ARTICLE_CACHE_REVALIDATE_SECONDS
+    row = get_connection().execute(
+        "SELECT * FROM article_render_cache WHERE record_id = ? AND checked_at > ?",
+        (record_id, time.time() - max_age),
+    ).fetchone()
+    metrics.cache("article", row is not None)
+    return _row_to_entry(row) if row else None
+
+
+def remplir(record: dict) -> dict:
+    """
+    Nettoie et met en cache un record d'article. Si les champs affichés n'ont pas changé
+    depuis le dernier remplissage, on garde le HTML déjà nettoyé et on repousse juste
+    l'échéance.
+    """
+    _init()
+    conn = get_connection()
+    fields = record.get("fields", {})
+    meta = {k: fields.get(k) for k in ("title", "keyword", "seo_title", "meta_description", "image_url")}
+    owners = list(fields.get("user") or [])
+    # version = empreinte du contenu brut : une modification faite dans Airtable change la
+    # version sans dépendre d'un champ « dernière modification »
+    version = hashlib.sha256(
+        json.dumps([fields.get("html_content", ""), meta, owners], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:32]
+    now = time.time()
+
+    row = conn.execute(
+        "SELECT * FROM article_render_cache WHERE record_id = ? AND version = ?",
+        (record["id"], version),
+    ).fetchone()
+    if row:
+        conn.execute(
+            "UPDATE article_render_cache SET checked_at = ? WHERE record_id = ?", (now, record["id"])
+        )
+        return _row_to_entry(row)
+
+    html = nettoyer_html(fields.get("html_content", ""))
+    digest = hashlib.sha256(
+        json.dumps([record["id"], version, meta, html], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:32]
+
+    conn.execute(
+        "INSERT OR REPLACE INTO article_render_cache "
+        "(record_id, version, etag, owners, meta, html, checked_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (record["id"], version, digest, json.dumps(owners), json.dumps(meta, ensure_ascii=False), html, now),
+    )
+    return {"record_id": record["id"], "version": version, "etag": digest,
+            "owners": owners, "article": meta, "html": html}
+
+
+def invalider(record_id: str):
+    _init()
+    get_connection().execute("DELETE FROM article_render_cache WHERE record_id = ?", (record_id,))
+
+
+def etag_page(entry: dict, user: dict) -> str:
+    """
+    ETag fort de la page complète : article + éléments propres à l'utilisateur
+    affichés dans la sidebar (crédits, formule).
+    """
+    user = user or {}
+    raw = f"{entry['etag']}|{user.get('id')}|{user.get('credits')}|{user.get('planName')}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
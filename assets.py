@@ -0,0 +1,72 @@
+# assets.py
+import json
+import mimetypes
+import os
+
+from flask import abort, request, send_from_directory, url_for
+
+from build_assets import DIST_DIR, MANIFEST_NAME
+
+# Fichiers avec empreinte : le contenu ne change jamais pour une URL donnée
+ASSET_MAX_AGE_SECONDS = 365 * 86400
+
+# Ordre de préférence des variantes précompressées
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = None
+_manifest_mtime = None
+
+
+def _charger_manifest() -> dict:
+    """
+    Relit static/dist/manifest.json s'il a changé (rebuild en dev), {} s'il est absent.
+    """
+    global _manifest, _manifest_mtime
+    path = os.path.join(DIST_DIR, MANIFEST_NAME)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        _manifest, _manifest_mtime = {}, None
+        return _manifest
+    if mtime != _manifest_mtime:
+        with open(path, encoding="utf-8") as f:
+            _manifest = json.load(f)
+        _manifest_mtime = mtime
+    return _manifest
+
+
+def asset_url(filename: str) -> str:
+    """
+    URL d'un asset (ex : 'style.css', 'js/transcription.js') : version avec empreinte si
+    build_assets.py a été lancé, sinon le fichier source via le handler static de Flask.
+    """
+    hashed = _charger_manifest().get(filename)
+    if hashed:
+        return url_for("asset_dist", filename=hashed)
+    return url_for("static", filename=filename)
+
+
+def envoyer_asset(filename: str):
+    """
+    Sert un fichier de static/dist (variante .br / .gz si le client l'accepte),
+    avec un cache d'un an marqué immutable.
+    """
+    if filename.endswith((".gz", ".br")) or filename == MANIFEST_NAME:
+        abort(404)
+    if not os.path.isfile(os.path.join(DIST_DIR, filename)):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    served, encoding = filename, None
+    for name, suffix in _ENCODINGS:
+        if name in request.accept_encodings and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            served, encoding = filename + suffix, name
+            break
+
+    response = send_from_directory(DIST_DIR, served, mimetype=mimetype, max_age=ASSET_MAX_AGE_SECONDS)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
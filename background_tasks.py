@@ -0,0 +1,40 @@
+# background_tasks.py
+import os
+import threading
+import time
+
+from app_log import get_logger
+
+logger = get_logger("background_tasks")
+
+_STARTED = {}                 # nom -> pid du process qui a lancé le thread
+_STARTED_MUTEX = threading.Lock()
+
+
+def start_periodic(name: str, interval_seconds: float, func, initial_delay: float = None):
+    """
+    Lance (une seule fois par process) un thread daemon qui appelle `func` toutes les
+    `interval_seconds` secondes ; le premier appel a lieu après `initial_delay` (par
+    défaut, un intervalle). Appelable à chaque requête : c'est un no-op après le
+    premier appel. Le pid est vérifié pour relancer le thread après un fork gunicorn.
+    """
+    pid = os.getpid()
+    if _STARTED.get(name) == pid:
+        return
+    with _STARTED_MUTEX:
+        if _STARTED.get(name) == pid:
+            return
+        _STARTED[name] = pid
+
+    def _loop():
+        delay = interval_seconds if initial_delay is None else initial_delay
+        while True:
+            time.sleep(delay)
+            delay = interval_seconds
+            try:
+                func()
+            except Exception:
+                logger.exception("erreur tâche de fond", task=name)
+
+    t = threading.Thread(target=_loop, name=name, daemon=True)
+    t.start()
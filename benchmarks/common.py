@@ -0,0 +1,75 @@
+# benchmarks/common.py
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+
+
+def preparer_environnement(**overrides):
+    """
+    Variables d'environnement d'un banc de test isolé : base SQLite temporaire,
+    stockage local, clés factices. À appeler AVANT d'importer `app`.
+    """
+    workdir = tempfile.mkdtemp(prefix="ytr-bench-")
+    env = {
+        "LOCAL_DB_PATH": os.path.join(workdir, "bench.db"),
+        "STORAGE_BACKEND": "sqlite",
+        "FLASK_SECRET_KEY": "bench-secret",
+        "OPENAI_API_KEY": "sk-bench",
+        "STRIPE_API_KEY": "sk_test_bench",
+        "STRIPE_WEBHOOK_SECRET": "whsec_bench",
+        "STRIPE_PRICE_MEDIUM": "price_bench_medium",
+        "STRIPE_PRICE_PREMIUM": "price_bench_premium",
+        # on mesure le débit de l'application, pas le limiteur (tous les clients partagent une IP)
+        "RATE_LIMIT_ENABLED": "0",
+    }
+    env.update({k: str(v) for k, v in overrides.items()})
+    os.environ.update(env)
+    return workdir
+
+
+def signer_payload_stripe(payload: str, secret: str, timestamp: int = None) -> str:
+    """
+    En-tête Stripe-Signature (schéma v1) pour un payload, identique à celui de Stripe.
+    """
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.{payload}".encode("utf-8")
+    signature = hmac.new(secret.encode("utf-8"), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def resume_latences(latencies_s) -> dict:
+    ms = [x * 1000 for x in latencies_s]
+    return {
+        "count": len(ms),
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(max(ms), 2) if ms else 0.0,
+    }
+
+
+def afficher_rapport(titre: str, resultats: dict, as_json: bool = False):
+    if as_json:
+        print(json.dumps(resultats, indent=2, sort_keys=True))
+        return
+    print(f"\n=== {titre} ===")
+    for key, value in resultats.items():
+        if isinstance(value, dict):
+            print(f"{key}:")
+            for k, v in value.items():
+                print(f"    {k:<24} {v}")
+        else:
+            print(f"{key:<28} {value}")
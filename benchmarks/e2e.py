@@ -0,0 +1,221 @@
+# benchmarks/e2e.py
+"""
+Benchmark de bout en bout : l'application tourne avec de vrais clients HTTP (pyairtable,
+openai, youtube-transcript-api, stripe) pointés vers des doublures locales
+(benchmarks/fake_services.py), limite de débit Airtable comprise.
+
+Parcours mesurés, phase par phase : /login, /transcription, /blogify, /mes-articles, /webhook.
+Pour chaque phase : débit, latences, codes HTTP et appels amont par requête.
+
+    python -m benchmarks.e2e --concurrency 4 --requests 40 --storage airtable
+    python -m benchmarks.e2e --json > avant.json    # comparaison entre commits
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import afficher_rapport, preparer_environnement, resume_latences, signer_payload_stripe
+from benchmarks.fake_services import FakeServices
+
+PHASES = ("login", "transcription", "blogify", "mes_articles", "webhook")
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4, help="utilisateurs simultanés (un client chacun)")
+    parser.add_argument("--requests", type=int, default=20, help="requêtes par phase")
+    parser.add_argument("--phases", default=",".join(PHASES))
+    parser.add_argument("--storage", default="airtable", choices=["airtable", "replicated", "sqlite"],
+                        help="STORAGE_BACKEND de l'application")
+    parser.add_argument("--airtable-rate-limit", type=float, default=5, help="req/s Airtable avant 429 (0 : illimité)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="latence simulée d'OpenAI")
+    parser.add_argument("--youtube-latency-ms", type=float, default=0, help="latence simulée d'un fetch YouTube")
+    parser.add_argument("--transcript-lines", type=int, default=600, help="lignes de transcription par vidéo")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="attente max du traitement des webhooks (s)")
+    parser.add_argument("--json", action="store_true", help="sortie JSON")
+    parser.add_argument("--verbose", action="store_true", help="affiche les logs de l'application")
+    return parser.parse_args(argv)
+
+
+def _pointer_youtube_vers(base_url: str):
+    from youtube_transcript_api import _transcripts
+
+    _transcripts.WATCH_URL = base_url + "/youtube/watch?v={video_id}"
+    _transcripts.INNERTUBE_API_URL = base_url + "/youtube/youtubei/v1/player?key={api_key}"
+
+
+class _Utilisateur:
+    """
+    Un utilisateur du benchmark : son client de test Flask (cookies) et son état de parcours.
+    """
+
+    def __init__(self, n, app, record_id):
+        self.n = n
+        self.email = f"bench{n}@example.com"
+        self.record_id = record_id
+        self.client = app.test_client()
+        self.transcript_handle = None
+
+
+def _phase(nom, users, nb_requetes, action, fake):
+    """
+    Répartit `nb_requetes` appels de `action(user, i)` entre les utilisateurs (un thread chacun).
+    """
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def run(user):
+        for i in range(user.n, nb_requetes, len(users)):
+            t0 = time.perf_counter()
+            status = action(user, i)
+            elapsed = time.perf_counter() - t0
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    fake.reset_compteurs()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(users)) as pool:
+        list(pool.map(run, users))
+    wall = time.perf_counter() - started
+    return latencies, statuses, wall
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    fake = FakeServices(
+        airtable_rate_limit=args.airtable_rate_limit,
+        llm_latency_s=args.llm_latency_ms / 1000.0,
+        youtube_latency_s=args.youtube_latency_ms / 1000.0,
+        transcript_lines=args.transcript_lines,
+    )
+    base_url = fake.start()
+    preparer_environnement(
+        STORAGE_BACKEND=args.storage,
+        AIRTABLE_API_KEY="patbench",
+        AIRTABLE_BASE_ID="appbench",
+        AIRTABLE_ENDPOINT_URL=base_url,
+        OPENAI_BASE_URL=base_url + "/v1",
+    )
+    _pointer_youtube_vers(base_url)
+
+    import stripe
+    from werkzeug.security import generate_password_hash
+
+    import app as app_module
+    import webhook_queue
+
+    stripe.api_base = base_url
+    app = app_module.app
+    secret = os.environ["STRIPE_WEBHOOK_SECRET"]
+    password = "bench-password"
+    password_hash = generate_password_hash(password)
+
+    # Comptes abonnés (plan medium), créés directement dans la doublure Airtable
+    # (en mode sqlite, via le stockage local)
+    users = []
+    for n in range(args.concurrency):
+        fields = {
+            "email": f"bench{n}@example.com", "password": password_hash, "isConfirmed": True,
+            "status": "payant", "planName": "medium", "credits": 100000,
+            "stripeCustomerId": f"cus_bench_{n}", "stripeSubscriptionId": f"sub_bench_{n}",
+        }
+        if args.storage == "sqlite":
+            from config_airtable import get_users_table
+            record = get_users_table().create(fields)
+        else:
+            record = fake.creer_record("users", fields)
+        users.append(_Utilisateur(n, app, record["id"]))
+        fake.subscriptions[f"sub_bench_{n}"] = {
+            "id": f"sub_bench_{n}", "object": "subscription", "customer": f"cus_bench_{n}",
+            "metadata": {"user_id": record["id"], "plan": "medium"},
+            "items": {"object": "list", "data": [
+                {"id": f"si_{n}", "object": "subscription_item",
+                 "price": {"id": app_module.STRIPE_PRICE_BY_PLAN["medium"], "object": "price"}},
+            ]},
+        }
+
+    def login(user, i):
+        return user.client.post("/login", data={"email": user.email, "password": password}).status_code
+
+    def transcription(user, i):
+        resp = user.client.post("/transcription", data={"url": f"https://youtu.be/vid{i:08d}"})
+        match = re.search(rb'name="transcript_handle" value="([^"]+)"', resp.get_data())
+        if match:
+            user.transcript_handle = match.group(1).decode()
+        return resp.status_code
+
+    def blogify(user, i):
+        resp = user.client.post("/blogify", data={"transcript_handle": user.transcript_handle or ""})
+        return resp.status_code if b"article-html" in resp.get_data() else f"{resp.status_code}-sans-article"
+
+    def mes_articles(user, i):
+        return user.client.get("/mes-articles").status_code
+
+    def webhook(user, i):
+        event = {
+            "id": f"evt_bench_{i}", "type": "invoice.payment_succeeded",
+            "data": {"object": {
+                "id": f"in_bench_{i}", "customer": f"cus_bench_{user.n}",
+                "subscription": f"sub_bench_{user.n}", "billing_reason": "subscription_cycle",
+            }},
+        }
+        payload = json.dumps(event)
+        headers = {"Stripe-Signature": signer_payload_stripe(payload, secret), "Content-Type": "application/json"}
+        return user.client.post("/webhook", data=payload, headers=headers).status_code
+
+    actions = {
+        "login": login, "transcription": transcription, "blogify": blogify,
+        "mes_articles": mes_articles, "webhook": webhook,
+    }
+    phases = [p.strip() for p in args.phases.split(",") if p.strip()]
+    if "login" not in phases:
+        phases.insert(0, "login")  # les autres parcours exigent une session
+
+    results = {"storage": args.storage, "concurrency": args.concurrency, "phases": {}}
+    app_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with app_output:
+        for phase in phases:
+            # le login initial de chaque utilisateur n'est mesuré que dans la phase login
+            nb = max(args.requests, len(users)) if phase == "login" else args.requests
+            latencies, statuses, wall = _phase(phase, users, nb, actions[phase], fake)
+            if phase == "webhook":
+                # traitement asynchrone : les appels amont arrivent après l'acquittement
+                deadline = time.perf_counter() + args.drain_timeout
+                while time.perf_counter() < deadline:
+                    stats = webhook_queue.stats()
+                    if not stats.get("pending") and not stats.get("processing"):
+                        break
+                    time.sleep(0.05)
+            calls = fake.compteurs()
+            results["phases"][phase] = {
+                "requests": len(latencies),
+                "throughput_per_s": round(len(latencies) / wall, 1) if wall else 0,
+                "latency": resume_latences(latencies),
+                "http_statuses": {str(k): v for k, v in sorted(statuses.items(), key=lambda kv: str(kv[0]))},
+                "upstream_calls": calls,
+                "upstream_calls_per_request": {
+                    k: round(v / len(latencies), 2) for k, v in calls.items()
+                } if latencies else {},
+            }
+
+    fake.stop()
+    if args.json:
+        afficher_rapport("E2E", results, as_json=True)
+    else:
+        print(f"\nstorage={args.storage} concurrency={args.concurrency}")
+        for phase, res in results["phases"].items():
+            afficher_rapport(f"/{phase.replace('_', '-')}", res)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
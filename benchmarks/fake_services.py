@@ -0,0 +1,281 @@
+# benchmarks/fake_services.py
+"""
+Doublures HTTP locales des services externes, servies par un seul serveur threadé :
+
+- Airtable REST (/v0/<base>/<table>...) avec sa limite de débit (429 au-delà de N req/s)
+- OpenAI (/v1/responses, /v1/images/generations)
+- YouTube (page watch, API innertube, timedtext)
+- Stripe (/v1/subscriptions/<id>)
+
+Chaque appel est compté par (service, opération) pour rapporter les appels amont par requête.
+"""
+import base64
+import json
+import re
+import secrets
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# PNG 1x1 transparent (réponse d'image OpenAI)
+_PNG_1X1 = base64.b64encode(bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)).decode()
+
+_FORMULA_RE = re.compile(r"^(LOWER\()?\{(\w+)\}\)?='((?:[^'\\]|\\.)*)'$")
+
+
+class FakeServices:
+    def __init__(self, airtable_rate_limit: float = 5, llm_latency_s: float = 0,
+                 youtube_latency_s: float = 0, transcript_lines: int = 600):
+        self.airtable_rate_limit = airtable_rate_limit
+        self.llm_latency_s = llm_latency_s
+        self.youtube_latency_s = youtube_latency_s
+        self.transcript_lines = transcript_lines
+        self.tables = {}               # table -> {record_id: record}
+        self.subscriptions = {}        # Stripe
+        self.calls = Counter()
+        self._mutex = threading.Lock()
+        self._airtable_window = []     # horodatages des appels Airtable de la dernière seconde
+        self._server = None
+
+    # --- cycle de vie ---
+
+    def start(self) -> str:
+        services = self
+
+        class Handler(_Handler):
+            fake = services
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    # --- comptage ---
+
+    def compter(self, service: str, operation: str):
+        with self._mutex:
+            self.calls[(service, operation)] += 1
+
+    def reset_compteurs(self):
+        with self._mutex:
+            self.calls.clear()
+
+    def compteurs(self) -> dict:
+        with self._mutex:
+            return {f"{s}.{o}": n for (s, o), n in sorted(self.calls.items())}
+
+    def airtable_limite_atteinte(self) -> bool:
+        """
+        Fenêtre glissante d'une seconde, comme la limite Airtable (5 req/s par base).
+        """
+        if not self.airtable_rate_limit:
+            return False
+        now = time.monotonic()
+        with self._mutex:
+            self._airtable_window = [t for t in self._airtable_window if now - t < 1.0]
+            if len(self._airtable_window) >= self.airtable_rate_limit:
+                return True
+            self._airtable_window.append(now)
+            return False
+
+    # --- données Airtable ---
+
+    def creer_record(self, table: str, fields: dict) -> dict:
+        record = {
+            "id": "rec" + secrets.token_hex(7),
+            "createdTime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "fields": {k: v for k, v in fields.items() if v is not None},
+        }
+        with self._mutex:
+            self.tables.setdefault(table, {})[record["id"]] = record
+        return record
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    # --- utilitaires ---
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if "application/json" in (self.headers.get("Content-Type") or ""):
+            return json.loads(raw or b"{}")
+        return parse_qs(raw.decode()) if raw else {}
+
+    def _send(self, status: int, payload, content_type: str = "application/json"):
+        data = payload if isinstance(payload, bytes) else (
+            payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        )
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method: str):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        query = parse_qs(url.query)
+        body = self._body() if method in ("POST", "PATCH") else {}
+        if parts[:1] == ["v0"]:
+            return self._airtable(method, parts[2:], query, body)
+        if parts[:1] == ["v1"] and parts[1:2] in (["responses"], ["images"]):
+            return self._openai(parts[1:])
+        if parts[:1] == ["v1"]:
+            return self._stripe(method, parts[1:])
+        if parts[:1] == ["youtube"]:
+            return self._youtube(parts[1:], query, body)
+        self._send(404, {"error": "not found"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PATCH(self):
+        self._route("PATCH")
+
+    # --- Airtable ---
+
+    def _airtable(self, method, parts, query, body):
+        fake = self.fake
+        table = parts[0]
+        op = {"GET": "list" if len(parts) == 1 else "get", "POST": "create", "PATCH": "update"}[method]
+        if len(parts) == 2 and parts[1] == "listRecords":
+            op = "list"
+        if fake.airtable_limite_atteinte():
+            fake.compter("airtable", "429")
+            return self._send(429, {"errors": [{"type": "RATE_LIMIT_REACHED"}]})
+        fake.compter("airtable", op)
+
+        records = fake.tables.setdefault(table, {})
+        if op == "list":
+            params = body if method == "POST" else {k: v[0] for k, v in query.items()}
+            rows = list(records.values())
+            formula = params.get("filterByFormula")
+            if formula:
+                m = _FORMULA_RE.match(formula)
+                if m:
+                    lower, field, value = bool(m.group(1)), m.group(2), m.group(3).replace("\\'", "'")
+                    rows = [
+                        r for r in rows
+                        if (str(r["fields"].get(field, "")).lower() if lower else r["fields"].get(field)) == value
+                    ]
+            max_records = int(params.get("maxRecords") or 0)
+            if max_records:
+                rows = rows[:max_records]
+            page_size = int(params.get("pageSize") or 100)
+            offset = int(params.get("offset") or 0)
+            page = rows[offset:offset + page_size]
+            payload = {"records": page}
+            if offset + page_size < len(rows):
+                payload["offset"] = str(offset + page_size)
+            return self._send(200, payload)
+        if op == "get":
+            record = records.get(parts[1])
+            return self._send(200, record) if record else self._send(404, {"error": "NOT_FOUND"})
+        if op == "create":
+            if "records" in body:
+                created = [fake.creer_record(table, r["fields"]) for r in body["records"]]
+                return self._send(200, {"records": created})
+            return self._send(200, fake.creer_record(table, body.get("fields", {})))
+        record = records.get(parts[1])
+        if not record:
+            return self._send(404, {"error": "NOT_FOUND"})
+        record["fields"].update({k: v for k, v in body.get("fields", {}).items() if v is not None})
+        return self._send(200, record)
+
+    # --- OpenAI ---
+
+    def _openai(self, parts):
+        fake = self.fake
+        if fake.llm_latency_s:
+            time.sleep(fake.llm_latency_s)
+        if parts[0] == "images":
+            fake.compter("openai", "image")
+            return self._send(200, {"created": int(time.time()), "data": [{"b64_json": _PNG_1X1}]})
+        fake.compter("openai", "text")
+        article = {
+            "html": "<h1>Article de benchmark</h1>" + "<p>Paragraphe généré pour le benchmark.</p>" * 40,
+            "keyword": "benchmark",
+            "seo_title": "Article de benchmark",
+            "meta_description": "Article généré par la doublure OpenAI du benchmark.",
+            "image_prompt": "Une illustration abstraite",
+        }
+        return self._send(200, {
+            "id": "resp_" + secrets.token_hex(6),
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": "gpt-5.1",
+            "status": "completed",
+            "output": [{
+                "type": "message",
+                "id": "msg_" + secrets.token_hex(6),
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": json.dumps(article), "annotations": []}],
+            }],
+        })
+
+    # --- YouTube ---
+
+    def _youtube(self, parts, query, body):
+        fake = self.fake
+        if fake.youtube_latency_s:
+            time.sleep(fake.youtube_latency_s / 3)  # réparti sur les 3 appels d'un fetch
+        base = f"http://{self.headers.get('Host')}/youtube"
+        if parts[0] == "watch":
+            fake.compter("youtube", "watch")
+            return self._send(200, '<html><script>{"INNERTUBE_API_KEY": "benchkey"}</script></html>', "text/html")
+        if parts[0] == "youtubei":
+            fake.compter("youtube", "innertube")
+            video_id = body.get("videoId", "video")
+            return self._send(200, {
+                "playabilityStatus": {"status": "OK"},
+                "captions": {"playerCaptionsTracklistRenderer": {"captionTracks": [{
+                    "baseUrl": f"{base}/timedtext?v={video_id}&lang=fr",
+                    "name": {"runs": [{"text": "Français"}]},
+                    "languageCode": "fr",
+                    "kind": "asr",
+                }]}},
+            })
+        if parts[0] == "timedtext":
+            fake.compter("youtube", "timedtext")
+            video_id = query.get("v", ["video"])[0]
+            lines = "".join(
+                f'<text start="{i * 2.5:.1f}" dur="2.5">Phrase {i} de la vidéo {video_id}, '
+                f'sur le sujet numéro {i // 40}.</text>'
+                for i in range(fake.transcript_lines)
+            )
+            return self._send(200, f'<?xml version="1.0" encoding="utf-8" ?><transcript>{lines}</transcript>',
+                              "text/xml")
+        self._send(404, {"error": "not found"})
+
+    # --- Stripe ---
+
+    def _stripe(self, method, parts):
+        fake = self.fake
+        if parts[0] == "subscriptions" and len(parts) == 2 and method == "GET":
+            fake.compter("stripe", "subscription.retrieve")
+            sub = fake.subscriptions.get(parts[1])
+            if sub:
+                return self._send(200, sub)
+        fake.compter("stripe", "other")
+        return self._send(404, {"error": {"type": "invalid_request_error", "message": "No such object"}})
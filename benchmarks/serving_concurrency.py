@@ -0,0 +1,137 @@
+# benchmarks/serving_concurrency.py
+"""
+Compare les modes de service gunicorn quand des requêtes longues (LLM, YouTube) sont en cours :
+des /blogify lents tournent pendant qu'on mesure la latence d'une page légère (/login).
+
+    python -m benchmarks.serving_concurrency --slow-requests 8 --llm-latency 3
+
+Mode "sync"    : gunicorn app:app --workers 1 (ancien Procfile)
+Mode "gthread" : configuration de gunicorn.conf.py
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import afficher_rapport, preparer_environnement, resume_latences
+
+MODES = {
+    "sync": ["--workers", "1", "--worker-class", "sync", "--threads", "1"],
+    "gthread": [],  # valeurs de gunicorn.conf.py
+}
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="sync,gthread")
+    parser.add_argument("--slow-requests", type=int, default=8, help="/blogify simultanés")
+    parser.add_argument("--llm-latency", type=float, default=3.0, help="durée simulée d'un appel LLM (s)")
+    parser.add_argument("--probe-interval", type=float, default=0.1, help="intervalle entre deux sondes /login (s)")
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(base_url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(base_url + "/login", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn n'a pas démarré à temps")
+
+
+def _creer_utilisateur(email: str, password: str):
+    from werkzeug.security import generate_password_hash
+    from config_airtable import get_users_table
+
+    get_users_table().create({
+        "email": email, "password": generate_password_hash(password), "status": "gratuit",
+        "planName": "free", "credits": 100000, "isConfirmed": True,
+    })
+
+
+def _run_mode(mode: str, args) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    cmd = [sys.executable, "-m", "gunicorn", "benchmarks.slow_app:app", "-c", "gunicorn.conf.py",
+           "--bind", f"127.0.0.1:{port}", "--log-level", "warning"] + MODES[mode]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(base_url)
+
+        def logged_session():
+            s = requests.Session()
+            s.post(base_url + "/login", data={"email": "bench@example.com", "password": "bench-password"})
+            return s
+
+        slow_latencies = []
+        probe_latencies = []
+        done = threading.Event()
+
+        sessions = [logged_session() for _ in range(args.slow_requests)]
+
+        def slow_call(s):
+            t0 = time.perf_counter()
+            s.post(base_url + "/blogify", data={"source_text": "Texte source du benchmark. " * 50})
+            slow_latencies.append(time.perf_counter() - t0)
+
+        def probe():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                requests.get(base_url + "/login", timeout=120)
+                probe_latencies.append(time.perf_counter() - t0)
+                time.sleep(args.probe_interval)
+
+        prober = threading.Thread(target=probe, daemon=True)
+        started = time.perf_counter()
+        prober.start()
+        with ThreadPoolExecutor(max_workers=args.slow_requests) as pool:
+            list(pool.map(slow_call, sessions))
+        wall = time.perf_counter() - started
+        done.set()
+        prober.join()
+
+        return {
+            "slow_requests": args.slow_requests,
+            "slow_wall_seconds": round(wall, 2),
+            "effective_concurrency": round(args.slow_requests * args.llm_latency / wall, 2),
+            "slow_latency": resume_latences(slow_latencies),
+            "login_probe_latency": resume_latences(probe_latencies),
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    preparer_environnement(BENCH_LLM_LATENCY=args.llm_latency)
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    _creer_utilisateur("bench@example.com", "bench-password")
+
+    results = {}
+    for mode in args.modes.split(","):
+        results[mode] = _run_mode(mode.strip(), args)
+        if not args.json:
+            afficher_rapport(f"Serving mode : {mode}", results[mode])
+    if args.json:
+        afficher_rapport("Serving modes", results, as_json=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+# benchmarks/slow_app.py
+"""
+Application servie par gunicorn pendant les benchs de concurrence : même `app`, mais
+OpenAI et YouTube sont remplacés par des attentes (I/O simulées, sans coût).
+Les variables d'environnement (base SQLite temporaire...) sont fournies par le bench.
+"""
+import os
+import time
+
+import app as app_module
+import transcript_prefetch
+
+LLM_LATENCY_SECONDS = float(os.getenv("BENCH_LLM_LATENCY", "3"))
+YOUTUBE_LATENCY_SECONDS = float(os.getenv("BENCH_YOUTUBE_LATENCY", "1"))
+
+
+def _fake_generer_article_et_seo(source_text, **kwargs):
+    time.sleep(LLM_LATENCY_SECONDS)
+    return {
+        "html": "<h1>Article de test</h1><p>" + source_text[:200] + "</p>",
+        "keyword": "test",
+        "seo_title": "Article de test",
+        "meta_description": "Article généré pendant un benchmark.",
+        "image_prompt": "",
+    }
+
+
+def _fake_recuperer_segments(video_id, langues=None):
+    time.sleep(YOUTUBE_LATENCY_SECONDS)
+    return [{"text": f"Phrase {i} de la transcription de {video_id}.", "start": 3.0 * i, "duration": 3.0}
+            for i in range(200)]
+
+
+app_module.generer_article_et_seo = _fake_generer_article_et_seo
+app_module.recuperer_segments = _fake_recuperer_segments
+transcript_prefetch.recuperer_segments = _fake_recuperer_segments
+
+app = app_module.app
@@ -0,0 +1,225 @@
+# benchmarks/webhook_replay.py
+"""
+Rejeu d'events Stripe signés contre /webhook, avec Stripe et Airtable remplacés par des
+doublures locales. Mesure le débit d'acquittement, les latences, le temps de traitement
+de la file, et vérifie les crédits obtenus.
+
+    python -m benchmarks.webhook_replay --users 200 --renewals 3 --concurrency 16 --duplicates 0.2
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import afficher_rapport, preparer_environnement, resume_latences, signer_payload_stripe
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="nombre de clients abonnés")
+    parser.add_argument("--renewals", type=int, default=2, help="renouvellements (invoice.payment_succeeded) par client")
+    parser.add_argument("--cancel-ratio", type=float, default=0.1, help="part des clients qui résilient à la fin")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="part des events renvoyés en double")
+    parser.add_argument("--concurrency", type=int, default=8, help="livraisons simultanées")
+    parser.add_argument("--stripe-latency-ms", type=float, default=0, help="latence simulée de l'API Stripe")
+    parser.add_argument("--airtable-latency-ms", type=float, default=0, help="latence simulée du stockage")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="attente max du traitement de la file (s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="sortie JSON (comparaison entre commits)")
+    parser.add_argument("--verbose", action="store_true", help="affiche les logs de l'application")
+    return parser.parse_args(argv)
+
+
+class FakeStripe:
+    """
+    Doublure de l'API Stripe utilisée par le traitement des webhooks.
+    """
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self.subscriptions = {}
+        self.calls = 0
+        self._mutex = threading.Lock()
+
+    def retrieve_subscription(self, subscription_id, **kwargs):
+        with self._mutex:
+            self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self.subscriptions[subscription_id]
+
+
+def _ralentir_stockage(latency_s: float):
+    import storage
+
+    for name in ("get", "first_where", "create", "update"):
+        original = getattr(storage.SQLiteTable, name)
+
+        def slow(self, *args, __original=original, **kwargs):
+            time.sleep(latency_s)
+            return __original(self, *args, **kwargs)
+
+        setattr(storage.SQLiteTable, name, slow)
+
+
+def _generer_events(users, renewals, cancel_ratio, rng):
+    """
+    Séquences d'events par client (ordre Stripe respecté pour un même client),
+    entrelacées entre clients comme un jour de renouvellement.
+    """
+    per_customer = []
+    for u in users:
+        seq = [{
+            "id": f"evt_co_{u['n']}",
+            "type": "checkout.session.completed",
+            "data": {"object": {
+                "id": f"cs_{u['n']}", "object": "checkout.session",
+                "customer": u["customer"], "subscription": u["subscription"],
+                "metadata": {"user_id": u["id"], "plan": u["plan"]},
+            }},
+        }, {
+            "id": f"evt_inv0_{u['n']}",
+            "type": "invoice.payment_succeeded",
+            "data": {"object": {
+                "id": f"in_0_{u['n']}", "customer": u["customer"], "subscription": u["subscription"],
+                "billing_reason": "subscription_create",
+            }},
+        }]
+        for k in range(1, renewals + 1):
+            seq.append({
+                "id": f"evt_inv{k}_{u['n']}",
+                "type": "invoice.payment_succeeded",
+                "data": {"object": {
+                    "id": f"in_{k}_{u['n']}", "customer": u["customer"], "subscription": u["subscription"],
+                    "billing_reason": "subscription_cycle",
+                }},
+            })
+        if rng.random() < cancel_ratio:
+            u["cancelled"] = True
+            seq.append({
+                "id": f"evt_del_{u['n']}",
+                "type": "customer.subscription.deleted",
+                "data": {"object": {"id": u["subscription"], "customer": u["customer"]}},
+            })
+        per_customer.append(seq)
+
+    events = []
+    while any(per_customer):
+        for seq in per_customer:
+            if seq:
+                events.append(seq.pop(0))
+    return events
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    preparer_environnement()
+
+    import app as app_module
+    import credits_ledger
+    import webhook_queue
+    import stripe_cache
+    from config_airtable import get_users_table
+
+    rng = random.Random(args.seed)
+    fake_stripe = FakeStripe(args.stripe_latency_ms / 1000.0)
+    stripe_cache.stripe.Subscription.retrieve = fake_stripe.retrieve_subscription
+    if args.airtable_latency_ms:
+        _ralentir_stockage(args.airtable_latency_ms / 1000.0)
+
+    # Comptes de départ (5 crédits offerts à l'inscription, comme /signup)
+    users_table = get_users_table()
+    users = []
+    for n in range(args.users):
+        plan = rng.choice(["medium", "premium"])
+        rec = users_table.create({
+            "email": f"bench{n}@example.com", "status": "gratuit", "planName": "free",
+            "credits": 5, "isConfirmed": True,
+        })
+        users.append({
+            "n": n, "id": rec["id"], "plan": plan,
+            "customer": f"cus_bench_{n}", "subscription": f"sub_bench_{n}", "cancelled": False,
+        })
+        fake_stripe.subscriptions[f"sub_bench_{n}"] = {
+            "id": f"sub_bench_{n}", "customer": f"cus_bench_{n}",
+            "metadata": {"user_id": rec["id"], "plan": plan},
+            "items": {"data": [{"price": {"id": app_module.STRIPE_PRICE_BY_PLAN[plan]}}]},
+        }
+
+    events = _generer_events(users, args.renewals, args.cancel_ratio, rng)
+    # Doublons renvoyés un peu plus tard, comme les retries Stripe
+    keyed = [(float(i), ev) for i, ev in enumerate(events)]
+    keyed += [(i + rng.uniform(1, 20), ev) for i, ev in enumerate(events) if rng.random() < args.duplicates]
+    deliveries = [ev for _, ev in sorted(keyed, key=lambda x: x[0])]
+
+    secret = os.environ["STRIPE_WEBHOOK_SECRET"]
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def deliver(ev):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app_module.app.test_client()
+        payload = json.dumps(ev)
+        headers = {"Stripe-Signature": signer_payload_stripe(payload, secret), "Content-Type": "application/json"}
+        t0 = time.perf_counter()
+        resp = client.post("/webhook", data=payload, headers=headers)
+        elapsed = time.perf_counter() - t0
+        with lock:
+            latencies.append(elapsed)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+    app_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with app_output:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(deliver, deliveries))
+        ack_elapsed = time.perf_counter() - started
+
+        # Attente de la fin du traitement asynchrone
+        while time.perf_counter() - started < args.drain_timeout:
+            stats = webhook_queue.stats()
+            if not stats.get("pending") and not stats.get("processing"):
+                break
+            time.sleep(0.05)
+        drain_elapsed = time.perf_counter() - started
+
+    # Vérification : crédits et formule attendus pour chaque client
+    errors = 0
+    for u in users:
+        plan_credits = app_module.PLANS[u["plan"]]["credits"]
+        expected = 5 + plan_credits * (1 + args.renewals)
+        got = credits_ledger.solde(u["id"])
+        fields = users_table.get(u["id"])["fields"]
+        expected_plan = "free" if u["cancelled"] else u["plan"]
+        if got != expected or fields.get("planName") != expected_plan:
+            errors += 1
+
+    results = {
+        "deliveries": len(deliveries),
+        "unique_events": len(events),
+        "concurrency": args.concurrency,
+        "http_statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "ack_throughput_per_s": round(len(deliveries) / ack_elapsed, 1),
+        "ack_latency": resume_latences(latencies),
+        "processing_throughput_per_s": round(len(events) / drain_elapsed, 1),
+        "drain_seconds": round(drain_elapsed, 3),
+        "queue": webhook_queue.stats(),
+        "stripe_api_calls": fake_stripe.calls,
+        "users_checked": len(users),
+        "users_with_wrong_credits_or_plan": errors,
+    }
+    afficher_rapport("Webhook replay", results, as_json=args.json)
+    return 0 if errors == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,13 @@
 from typing import Optional, Dict, Any
 from openai import OpenAI
+import resilience
+from app_log import get_logger
 import json
 import os
 
 client = OpenAI()
-print("OPENAI_API_KEY present:", bool(os.getenv("OPENAI_API_KEY")))
+logger = get_logger("blog_utils")
+logger.info("client OpenAI initialisé", api_key_present=bool(os.getenv("OPENAI_API_KEY")))
 
 
 def generer_article_et_seo(
@@ -13,6 +16,8 @@ def generer_article_et_seo(
     ton: str = "pédagogique et accessible",
     public_cible: str = "débutants intéressés par le sujet",
     langue: str = "français",
+    corrections: Optional[list] = None,
+    plan: Optional[list] = None,
 ) -> Dict[str, Any]:
     # 1) Limiter la taille du texte source
     source_text = source_text[:5000]  # par exemple limiter à 8 000 caractères
@@ -59,15 +64,30 @@ Retourne UNIQUEMENT un objet JSON valide, sans texte autour, de la forme :
     if titre_souhaite:
         instructions += f'\n\nTitre suggéré à intégrer ou adapter : "{titre_souhaite}".'
 
+    if plan:
+        # chapitres détectés localement dans la vidéo (chapters.py) : sert de trame aux H2
+        instructions += (
+            "\n\nChapitres détectés dans la vidéo, dans l'ordre (titres = mots-clés du passage) :\n"
+            + "\n".join(f"- {p}" for p in plan)
+            + "\nAppuie-toi sur ce découpage pour les sections H2 de l'article, avec des titres rédigés."
+        )
+
+    if corrections:
+        # régénération après une analyse SEO insuffisante (seo_score.py)
+        instructions += "\n\nUne première version avait ces défauts SEO, corrige-les :\n" + "\n".join(
+            f"- {c}" for c in corrections
+        )
+
     prompt_complet = f"{instructions}\n\nTexte source à transformer :\n\n{source_text}"
 
-    print("LONGUEUR source_text:", len(source_text))
-    print("LONGUEUR prompt_complet:", len(prompt_complet))
+    logger.debug("prompt article", source_len=len(source_text), prompt_len=len(prompt_complet))
 
-    response = client.responses.create(
-        model="gpt-5.1",
-        input=prompt_complet,
-    )
+    # pas de nouvel essai automatique : le timeout est déjà borné par le budget de la requête
+    with resilience.appel("openai", "text") as timeout:
+        response = client.with_options(timeout=timeout, max_retries=0).responses.create(
+            model="gpt-5.1",
+            input=prompt_complet,
+        )
 
     raw = response.output[0].content[0].text
 
@@ -89,7 +109,7 @@ Retourne UNIQUEMENT un objet JSON valide, sans texte autour, de la forme :
 def generer_image_article(image_prompt: str) -> Optional[str]:
     
     if not image_prompt:
-        print("[IMAGE] Pas de prompt image fourni, aucune image générée.")
+        logger.info("image : pas de prompt fourni, aucune image générée")
         return None
 
     prompt_final = (
@@ -97,19 +117,16 @@ def generer_image_article(image_prompt: str) -> Optional[str]:
         + " ; aucun texte, aucun mot, aucune typographie dans l'image."
     )
 
-    print("[IMAGE] Prompt final envoyé au modèle :")
-    print(prompt_final)
+    logger.debug("image : prompt envoyé au modèle", prompt=prompt_final)
 
     try:
-        img_resp = client.images.generate(
-            model="gpt-image-1",
-            prompt=prompt_final,
-            n=1,
-            size="1024x1024",
-        )
-
-        print("[IMAGE] Réponse brute du modèle d'image :")
-        print(img_resp)
+        with resilience.appel("openai", "image") as timeout:
+            img_resp = client.with_options(timeout=timeout, max_retries=0).images.generate(
+                model="gpt-image-1",
+                prompt=prompt_final,
+                n=1,
+                size="1024x1024",
+            )
 
         first = img_resp.data[0]
 
@@ -121,9 +138,11 @@ def generer_image_article(image_prompt: str) -> Optional[str]:
             b64_data = first.b64_json
             url = f"data:image/png;base64,{b64_data}"
 
-        print("[IMAGE] URL utilisée pour l'image :", url)
+        # jamais la data URL complète dans les logs (plusieurs Mo de base64)
+        logger.info("image générée", url=url if url and not url.startswith("data:") else None,
+                    data_url_len=len(url) if url and url.startswith("data:") else None)
         return url
 
     except Exception as e:
-        print("[IMAGE] Erreur génération image :", e)
+        logger.warning("image : génération en échec", error=e)
         return None
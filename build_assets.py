@@ -0,0 +1,104 @@
+# build_assets.py
+"""
+Construit les assets statiques servis en production :
+
+- minification de static/style.css et static/js/*.js
+- noms de fichiers avec empreinte du contenu (static/dist/style.<hash>.css...)
+- variantes précompressées .gz (et .br si le module brotli est installé)
+- static/dist/manifest.json : nom source -> nom avec empreinte (lu par assets.py)
+
+    python build_assets.py
+
+Lancé au déploiement par bin/post_compile. Sans manifest (en dev), les templates
+retombent sur les fichiers sources via url_for('static').
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:  # variantes .br optionnelles
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_NAME = "manifest.json"
+
+
+def minifier_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    # pas de suppression autour de ":" (sélecteurs type "a :hover")
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = css.replace(";}", "}")
+    return css.strip()
+
+
+def minifier_js(js: str) -> str:
+    """
+    Minification prudente, ligne par ligne : indentation, lignes vides et commentaires
+    sur ligne entière. Le contenu des template literals (`...`) est laissé intact.
+    """
+    out = []
+    in_template = False
+    for line in js.splitlines():
+        if in_template:
+            out.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith("//"):
+                out.append(stripped)
+        if line.count("`") % 2:
+            in_template = not in_template
+    return "\n".join(out) + "\n"
+
+
+def _sources():
+    yield "style.css", minifier_css
+    js_dir = os.path.join(STATIC_DIR, "js")
+    for name in sorted(os.listdir(js_dir)):
+        if name.endswith(".js"):
+            yield f"js/{name}", minifier_js
+
+
+def _ecrire(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def construire() -> dict:
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    manifest = {}
+    for source, minifier in _sources():
+        with open(os.path.join(STATIC_DIR, source), encoding="utf-8") as f:
+            content = minifier(f.read()).encode("utf-8")
+
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        root, ext = os.path.splitext(source)
+        hashed = f"{root}.{digest}{ext}"
+        target = os.path.join(DIST_DIR, hashed)
+
+        _ecrire(target, content)
+        # mtime=0 : sortie identique d'un build à l'autre
+        _ecrire(target + ".gz", gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _ecrire(target + ".br", brotli.compress(content, quality=11))
+        manifest[source] = hashed
+        print(f"[assets] {source} -> dist/{hashed} ({len(content)} octets)")
+
+    _ecrire(os.path.join(DIST_DIR, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    if brotli is None:
+        print("[assets] module brotli absent : variantes .br non générées")
+    return manifest
+
+
+if __name__ == "__main__":
+    construire()
@@ -0,0 +1,188 @@
+# chapters.py
+"""
+Découpage d'une transcription horodatée en chapitres thématiques, en local.
+
+Algorithme de type TextTiling (Hearst, 1997) sur des vecteurs de termes NumPy :
+la transcription est coupée en pseudo-phrases de W mots, on mesure la similarité
+cosinus entre les K pseudo-phrases de part et d'autre de chaque intervalle, et les
+creux les plus profonds de cette courbe deviennent des frontières de chapitre.
+Chaque chapitre est titré par ses termes les plus caractéristiques (tf-idf).
+
+Quelques dizaines de ms pour une vidéo de deux heures, sans appel au modèle.
+"""
+import math
+import os
+import re
+
+import numpy as np
+
+# Taille d'une pseudo-phrase (mots pleins) et nombre de pseudo-phrases par bloc comparé
+TILING_SEQUENCE_WORDS = 20
+TILING_BLOCK_SEQUENCES = 10
+# Un chapitre dure au moins CHAPTER_MIN_SECONDS ; une vidéo a au plus CHAPTER_MAX chapitres
+CHAPTER_MIN_SECONDS = int(os.getenv("CHAPTER_MIN_SECONDS", "90"))
+CHAPTER_MAX = int(os.getenv("CHAPTER_MAX", "12"))
+# Durée moyenne visée d'un chapitre (borne le nombre de chapitres des vidéos courtes)
+CHAPTER_TARGET_SECONDS = 240
+
+_WORD_RE = re.compile(r"[^\W\d_]{3,}(?:['’-][^\W\d_]+)*")
+
+_STOPWORDS = frozenset("""
+les des une est pas que qui dans sur pour par avec son sans sous mais ou donc car
+elle ils elles nous vous leur leurs ces cette cet ses mes tes nos vos aux été être
+avoir fait faire comme tout tous toute toutes très plus moins bien aussi alors encore
+même quand comment parce puis ainsi après avant entre chez vers voilà voici ça cela
+ceci celui celle ceux quoi dont où oui non peu trop beaucoup juste vraiment déjà
+ont avez avons suis sont était étaient sera seront peut peuvent dit dire va vais vont
+chose choses truc fois là ici euh ben bah hein enfin bon quelque quelques chaque
+the and that this with for are was were you your they them their have has had but
+not what which when where who will would can could should there here then than
+just like really about into from out yeah okay gonna get got know think going
+""".split())
+
+
+def _tokens(segments):
+    """
+    Mots pleins de la transcription (minuscules), avec l'indice du segment d'origine.
+    Retourne (termes, indices de segment, forme de surface la plus fréquente par terme).
+    """
+    terms, seg_idx = [], []
+    surfaces = {}
+    for i, seg in enumerate(segments):
+        for word in _WORD_RE.findall(seg.get("text") or ""):
+            term = word.lower()
+            if term in _STOPWORDS:
+                continue
+            terms.append(term)
+            seg_idx.append(i)
+            forms = surfaces.setdefault(term, {})
+            forms[word] = forms.get(word, 0) + 1
+    return terms, np.asarray(seg_idx, dtype=np.int64), surfaces
+
+
+def _courbe_similarite(counts: np.ndarray, k: int) -> np.ndarray:
+    """
+    Similarité cosinus entre les k pseudo-phrases avant et après chaque intervalle
+    (intervalle i : entre les pseudo-phrases i-1 et i), via des sommes cumulées.
+    """
+    n = counts.shape[0]
+    cum = np.vstack([np.zeros((1, counts.shape[1]), dtype=counts.dtype), np.cumsum(counts, axis=0)])
+    gaps = np.arange(1, n)
+    left = cum[gaps] - cum[np.maximum(0, gaps - k)]
+    right = cum[np.minimum(n, gaps + k)] - cum[gaps]
+    norms = np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1)
+    return np.einsum("ij,ij->i", left, right) / np.where(norms == 0, 1, norms)
+
+
+def _profondeurs(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Profondeur de chaque creux : écart au plus haut sommet à gauche et à droite (fenêtre k).
+    """
+    padded = np.pad(scores, k, mode="edge")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, k + 1)
+    left_peak = windows[: len(scores)].max(axis=1)
+    right_peak = windows[k:].max(axis=1)
+    return (left_peak - scores) + (right_peak - scores)
+
+
+def _titre(chapter_counts: np.ndarray, idf: np.ndarray, vocab: list, surfaces: dict, n_terms: int = 3) -> tuple:
+    weights = chapter_counts * idf
+    top = [i for i in np.argsort(weights)[::-1][:n_terms] if weights[i] > 0]
+    words = [max(surfaces[vocab[i]].items(), key=lambda kv: kv[1])[0] for i in top]
+    if not words:
+        return "", []
+    if len(words) == 1:
+        title = words[0]
+    else:
+        title = ", ".join(words[:-1]) + " et " + words[-1]
+    return title[:1].upper() + title[1:], words
+
+
+def decouper(segments: list, max_chapters: int = None) -> list:
+    """
+    Chapitres d'une transcription : segments {"text", "start", "duration"} (format de
+    youtube-transcript-api) -> [{"start", "end", "title", "keywords"}], triés par début.
+    Retourne une liste vide si la vidéo est trop courte pour être découpée.
+    """
+    if not segments:
+        return []
+    w, k = TILING_SEQUENCE_WORDS, TILING_BLOCK_SEQUENCES
+    terms, seg_idx, surfaces = _tokens(segments)
+    end_time = float(segments[-1].get("start", 0)) + float(segments[-1].get("duration", 0) or 0)
+    n_seq = len(terms) // w
+    if n_seq < 2 * k or end_time < 2 * CHAPTER_MIN_SECONDS:
+        return []
+
+    # Matrice pseudo-phrases x termes (termes vus au moins deux fois)
+    vocab_index = {}
+    term_ids = np.fromiter((vocab_index.setdefault(t, len(vocab_index)) for t in terms), dtype=np.int64,
+                           count=len(terms))
+    vocab = list(vocab_index)
+    freq = np.bincount(term_ids, minlength=len(vocab))
+    keep = freq[term_ids] >= 2
+    seq_of_token = np.arange(len(terms)) // w
+    keep &= seq_of_token < n_seq
+    counts = np.zeros((n_seq, len(vocab)), dtype=np.float32)
+    np.add.at(counts, (seq_of_token[keep], term_ids[keep]), 1)
+
+    scores = _courbe_similarite(counts, k)
+    scores = np.convolve(scores, np.ones(3) / 3, mode="same")
+    depths = _profondeurs(scores, k)
+
+    # Candidats : creux (maxima locaux de profondeur) nettement plus profonds que la moyenne
+    # des creux. Le seuil de Hearst (moyenne - écart-type / 2 sur tous les intervalles) garde
+    # trop de petits creux dus au bruit sur une transcription orale.
+    local_max = np.r_[True, depths[1:] >= depths[:-1]] & np.r_[depths[:-1] >= depths[1:], True]
+    peaks = depths[local_max]
+    threshold = peaks.mean() + peaks.std() / 2
+    candidates = np.flatnonzero(local_max & (depths > threshold))
+    candidates = candidates[np.argsort(depths[candidates])[::-1]]
+
+    seq_start_time = np.array([float(segments[i].get("start", 0)) for i in seg_idx[::w][:n_seq]])
+    max_chapters = max_chapters or min(CHAPTER_MAX, max(2, int(end_time // CHAPTER_TARGET_SECONDS)))
+    boundaries = [0.0]
+    for gap in candidates:
+        if len(boundaries) >= max_chapters:
+            break
+        t = seq_start_time[gap + 1]
+        if end_time - t < CHAPTER_MIN_SECONDS:
+            continue
+        if all(abs(t - b) >= CHAPTER_MIN_SECONDS for b in boundaries):
+            boundaries.append(t)
+    boundaries.sort()
+
+    # Titres : termes propres au chapitre (tf du chapitre x idf sur les pseudo-phrases)
+    idf = np.log(n_seq / (1 + (counts > 0).sum(axis=0))).astype(np.float32)
+    seq_bounds = np.searchsorted(seq_start_time, boundaries + [math.inf])
+    chapters = []
+    for i, start in enumerate(boundaries):
+        end = boundaries[i + 1] if i + 1 < len(boundaries) else end_time
+        chapter_counts = counts[seq_bounds[i]:max(seq_bounds[i] + 1, seq_bounds[i + 1])].sum(axis=0)
+        title, keywords = _titre(chapter_counts, idf, vocab, surfaces)
+        chapters.append({"start": round(start, 1), "end": round(end, 1), "title": title or f"Partie {i + 1}",
+                         "keywords": keywords})
+    return chapters
+
+
+def horodatage(seconds: float) -> str:
+    h, rest = divmod(int(seconds), 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+def description_youtube(chapters: list) -> str:
+    """
+    Bloc « chapitres » à coller dans la description YouTube (00:00 en premier, au moins
+    3 chapitres de 10 s : sinon YouTube l'ignore, et on retourne une chaîne vide).
+    """
+    if len(chapters) < 3:
+        return ""
+    return "\n".join(f"{horodatage(0 if i == 0 else c['start'])} {c['title']}" for i, c in enumerate(chapters))
+
+
+def plan_article(chapters: list) -> list:
+    """
+    Plan suggéré au modèle : une ligne par chapitre, dans l'ordre de la vidéo.
+    """
+    return [f"{c['title']} ({horodatage(c['start'])}) – mots-clés : {', '.join(c['keywords'])}"
+            for c in chapters]
@@ -0,0 +1,118 @@
+# compression.py
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli optionnel : gzip seul
+    brotli = None
+
+# En dessous de ce seuil la compression ne fait pas gagner de paquet réseau
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1400"))
+GZIP_LEVEL = 6
+# Qualité brotli "à la volée" : 11 est réservé aux assets précompressés (build_assets.py)
+BROTLI_QUALITY = 5
+
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "image/svg+xml",
+)
+
+
+class _Gzip:
+    def __init__(self):
+        self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 : en-tête gzip
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        # Z_SYNC_FLUSH : le navigateur peut décoder (et afficher) ce qui a déjà été envoyé
+        return self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._c.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self):
+        self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+def _choisir_encodage():
+    if brotli is not None and "br" in request.accept_encodings:
+        return "br", _Brotli
+    if "gzip" in request.accept_encodings:
+        return "gzip", _Gzip
+    return None, None
+
+
+def _compresser_flux(chunks, compressor):
+    """
+    Compresse un flux chunk par chunk, avec un flush après chaque chunk pour ne pas
+    retenir le début de la page (en-tête, formulaire) dans le buffer du compresseur.
+    """
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+def compresser_reponse(response):
+    """
+    after_request : compression gzip / brotli des réponses texte au-delà de
+    COMPRESSION_MIN_SIZE, et des réponses streamées (taille inconnue d'avance).
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough  # send_file : assets déjà précompressés
+        or "Content-Encoding" in response.headers
+        or not (response.mimetype or "").startswith(_COMPRESSIBLE_TYPES)
+        or request.method == "HEAD"
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding, compressor_cls = _choisir_encodage()
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = _compresser_flux(response.response, compressor_cls())
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESSION_MIN_SIZE:
+            return response
+        compressor = compressor_cls()
+        response.set_data(compressor.compress(data) + compressor.finish())
+
+    response.headers["Content-Encoding"] = encoding
+    # La représentation compressée n'est pas identique octet pour octet
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
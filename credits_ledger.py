@@ -0,0 +1,262 @@
+# credits_ledger.py
+import os
+import time
+
+from config_airtable import get_users_table
+from local_db import acquire_lease, ensure_schema, get_connection, transaction
+from background_tasks import start_periodic
+from app_log import get_logger
+
+logger = get_logger("credits")
+
+# Fréquence de la réconciliation locale -> Airtable
+CREDITS_SYNC_INTERVAL_SECONDS = int(os.getenv("CREDITS_SYNC_INTERVAL", "30"))
+# Un utilisateur non modifié est quand même relu dans Airtable après ce délai
+# (prise en compte des corrections manuelles faites par le back-office)
+CREDITS_RESYNC_SECONDS = int(os.getenv("CREDITS_RESYNC_SECONDS", "600"))
+# Une réservation jamais confirmée (worker tué en pleine génération) est rendue après ce délai
+RESERVATION_TTL_SECONDS = int(os.getenv("CREDITS_RESERVATION_TTL", "900"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS credit_balances (
+    user_id TEXT PRIMARY KEY,
+    credits INTEGER NOT NULL,          -- solde disponible (réservations déjà déduites)
+    synced_credits INTEGER NOT NULL,   -- dernière valeur connue côté Airtable
+    dirty INTEGER NOT NULL DEFAULT 0,  -- 1 si le solde local doit être poussé vers Airtable
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS credit_reservations (
+    request_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    status TEXT NOT NULL,              -- reserved | committed | released
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_credit_reservations_status
+    ON credit_reservations (status, created_at);
+CREATE TABLE IF NOT EXISTS credit_movements (
+    ref TEXT PRIMARY KEY,              -- ex : id d'event Stripe, garantit l'idempotence
+    user_id TEXT NOT NULL,
+    delta INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class SoldeInsuffisant(ValueError):
+    """Levée quand le solde disponible ne couvre pas la réservation demandée."""
+
+
+def _init():
+    ensure_schema("credits_ledger", _SCHEMA)
+
+
+def _assurer_solde(user_id: str):
+    """
+    Initialise le solde local depuis Airtable la première fois qu'on voit un utilisateur.
+    L'appel réseau est fait hors transaction pour ne pas bloquer les autres workers.
+    """
+    _init()
+    row = get_connection().execute(
+        "SELECT 1 FROM credit_balances WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    if row:
+        return
+
+    record = get_users_table().get(user_id)
+    remote = int(record.get("fields", {}).get("credits", 0) or 0)
+    get_connection().execute(
+        "INSERT OR IGNORE INTO credit_balances (user_id, credits, synced_credits, dirty, synced_at) "
+        "VALUES (?, ?, ?, 0, ?)",
+        (user_id, remote, remote, time.time()),
+    )
+
+
+def solde(user_id: str) -> int:
+    """
+    Retourne le solde disponible (lecture locale, sans appel Airtable une fois initialisé).
+    """
+    _assurer_solde(user_id)
+    row = get_connection().execute(
+        "SELECT credits FROM credit_balances WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return int(row["credits"])
+
+
+def reserver(user_id: str, amount: int, request_id: str) -> int:
+    """
+    Réserve `amount` crédits pour la requête `request_id` et renvoie le nouveau solde.
+    Idempotent : une deuxième réservation avec le même request_id ne débite rien.
+    Lève SoldeInsuffisant si le solde disponible est trop faible.
+    """
+    _assurer_solde(user_id)
+    now = time.time()
+    with transaction() as conn:
+        existing = conn.execute(
+            "SELECT status FROM credit_reservations WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        current = int(conn.execute(
+            "SELECT credits FROM credit_balances WHERE user_id = ?", (user_id,)
+        ).fetchone()["credits"])
+
+        if existing:
+            return current
+
+        if current < amount:
+            raise SoldeInsuffisant("Solde de crédits insuffisant.")
+
+        conn.execute(
+            "UPDATE credit_balances SET credits = credits - ?, dirty = 1 WHERE user_id = ?",
+            (amount, user_id),
+        )
+        conn.execute(
+            "INSERT INTO credit_reservations (request_id, user_id, amount, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'reserved', ?, ?)",
+            (request_id, user_id, amount, now, now),
+        )
+        return current - amount
+
+
+def confirmer(request_id: str) -> bool:
+    """
+    Confirme une réservation : les crédits sont définitivement consommés.
+    Retourne False si la réservation n'existe pas ou n'est plus en attente.
+    """
+    _init()
+    with transaction() as conn:
+        cur = conn.execute(
+            "UPDATE credit_reservations SET status = 'committed', updated_at = ? "
+            "WHERE request_id = ? AND status = 'reserved'",
+            (time.time(), request_id),
+        )
+        return cur.rowcount == 1
+
+
+def liberer(request_id: str) -> bool:
+    """
+    Annule une réservation en attente et rend les crédits à l'utilisateur.
+    """
+    _init()
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT user_id, amount FROM credit_reservations WHERE request_id = ? AND status = 'reserved'",
+            (request_id,),
+        ).fetchone()
+        if not row:
+            return False
+        conn.execute(
+            "UPDATE credit_reservations SET status = 'released', updated_at = ? WHERE request_id = ?",
+            (time.time(), request_id),
+        )
+        conn.execute(
+            "UPDATE credit_balances SET credits = credits + ?, dirty = 1 WHERE user_id = ?",
+            (row["amount"], row["user_id"]),
+        )
+        return True
+
+
+def crediter(user_id: str, amount: int, ref: str) -> int:
+    """
+    Ajoute `amount` crédits (recharge, abonnement...) et renvoie le nouveau solde.
+    Idempotent par `ref` : rejouer le même event Stripe ne crédite qu'une fois.
+    """
+    _assurer_solde(user_id)
+    with transaction() as conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO credit_movements (ref, user_id, delta, created_at) VALUES (?, ?, ?, ?)",
+            (ref, user_id, amount, time.time()),
+        )
+        if cur.rowcount == 1:
+            conn.execute(
+                "UPDATE credit_balances SET credits = credits + ?, dirty = 1 WHERE user_id = ?",
+                (amount, user_id),
+            )
+        return int(conn.execute(
+            "SELECT credits FROM credit_balances WHERE user_id = ?", (user_id,)
+        ).fetchone()["credits"])
+
+
+def _liberer_reservations_expirees():
+    rows = get_connection().execute(
+        "SELECT request_id FROM credit_reservations WHERE status = 'reserved' AND created_at < ?",
+        (time.time() - RESERVATION_TTL_SECONDS,),
+    ).fetchall()
+    for r in rows:
+        if liberer(r["request_id"]):
+            logger.info("réservation expirée libérée", request_id=r["request_id"])
+
+
+def _reconcilier_utilisateur(table, user_id: str):
+    """
+    1) Relit Airtable et applique au solde local l'écart constaté depuis la dernière synchro
+       (corrections manuelles du back-office).
+    2) Pousse le solde local vers Airtable s'il diffère.
+    """
+    before = get_connection().execute(
+        "SELECT synced_credits FROM credit_balances WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    if not before:
+        return
+    record = table.get(user_id)
+    remote = int(record.get("fields", {}).get("credits", 0) or 0)
+
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT credits, synced_credits FROM credit_balances WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if not row or row["synced_credits"] != before["synced_credits"]:
+            # synchro faite par ailleurs pendant la lecture Airtable : `remote` est peut-être
+            # antérieur à ce push, l'écart calculé serait faux (prochain passage)
+            return
+        external_delta = remote - int(row["synced_credits"])
+        target = int(row["credits"]) + external_delta
+        conn.execute(
+            "UPDATE credit_balances SET credits = ?, synced_credits = ?, synced_at = ?, "
+            "dirty = CASE WHEN ? = ? THEN 0 ELSE 1 END WHERE user_id = ?",
+            (target, remote, time.time(), target, remote, user_id),
+        )
+
+    if target == remote:
+        return
+
+    table.update(user_id, {"credits": target})
+
+    with transaction() as conn:
+        # si une réservation a eu lieu entre-temps, dirty reste à 1 pour le prochain passage
+        conn.execute(
+            "UPDATE credit_balances SET synced_credits = ?, dirty = CASE WHEN credits = ? THEN 0 ELSE 1 END "
+            "WHERE user_id = ? AND synced_credits = ?",
+            (target, target, user_id, remote),
+        )
+
+
+def reconcilier(limit: int = 50):
+    """
+    Passe de réconciliation : libère les réservations orphelines puis synchronise
+    les soldes modifiés (ou trop anciens) avec Airtable.
+    """
+    _init()
+    # un seul worker à la fois : deux passes concurrentes pourraient annuler un débit
+    if not acquire_lease("credits-reconciliation", max(60, CREDITS_SYNC_INTERVAL_SECONDS * 5)):
+        return
+    _liberer_reservations_expirees()
+
+    rows = get_connection().execute(
+        "SELECT user_id FROM credit_balances WHERE dirty = 1 OR synced_at < ? "
+        "ORDER BY dirty DESC, synced_at LIMIT ?",
+        (time.time() - CREDITS_RESYNC_SECONDS, limit),
+    ).fetchall()
+    if not rows:
+        return
+
+    table = get_users_table()
+    for r in rows:
+        try:
+            _reconcilier_utilisateur(table, r["user_id"])
+        except Exception as e:
+            logger.warning("réconciliation Airtable en échec", user_id=r["user_id"], error=e)
+
+
+def demarrer_reconciliation():
+    start_periodic("credits-reconciliation", CREDITS_SYNC_INTERVAL_SECONDS, reconcilier)
@@ -0,0 +1,269 @@
+# export.py
+"""
+Export en masse des articles d'un utilisateur, en flux :
+
+- ZIP de fichiers HTML ou Markdown (+ images dans images/)
+- NDJSON (un article par ligne)
+
+Les articles sont lus page par page et l'archive est écrite au fil de l'eau dans un
+flux non positionnable : la mémoire reste constante quel que soit le nombre d'articles.
+"""
+import base64
+import io
+import json
+import os
+import re
+import unicodedata
+import zipfile
+from html import escape
+from html.parser import HTMLParser
+
+import requests
+
+from airtable_articles import get_articles_table
+from app_log import get_logger
+from article_cache import nettoyer_html
+
+logger = get_logger("export")
+
+EXPORT_PAGE_SIZE = 100
+EXPORT_IMAGE_TIMEOUT_SECONDS = 10
+EXPORT_IMAGE_MAX_BYTES = int(os.getenv("EXPORT_IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+
+FORMATS = {
+    # format -> (mimetype, extension du fichier téléchargé)
+    "html": ("application/zip", "zip"),
+    "markdown": ("application/zip", "zip"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+_IMAGE_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp", "image/gif": "gif"}
+
+
+class _FluxSortie(io.RawIOBase):
+    """
+    Fichier en écriture seule et non positionnable : zipfile écrit alors des
+    descripteurs de données au lieu de revenir sur les en-têtes.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def vider(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+class _MarkdownConverter(HTMLParser):
+    """
+    Conversion HTML -> Markdown limitée aux balises conservées par nettoyer_html.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self._lists = []          # pile de [type de liste, compteur]
+        self._href = None
+        self._pre = False
+
+    def handle_starttag(self, tag, attrs):
+        if re.fullmatch(r"h[1-6]", tag):
+            self.out.append("\n\n" + "#" * int(tag[1]) + " ")
+        elif tag in ("p", "blockquote", "table"):
+            self.out.append("\n\n> " if tag == "blockquote" else "\n\n")
+        elif tag in ("ul", "ol"):
+            self._lists.append([tag, 0])
+            self.out.append("\n")
+        elif tag == "li":
+            indent = "  " * max(0, len(self._lists) - 1)
+            if self._lists and self._lists[-1][0] == "ol":
+                self._lists[-1][1] += 1
+                self.out.append(f"\n{indent}{self._lists[-1][1]}. ")
+            else:
+                self.out.append(f"\n{indent}- ")
+        elif tag in ("strong", "b"):
+            self.out.append("**")
+        elif tag in ("em", "i"):
+            self.out.append("*")
+        elif tag == "br":
+            self.out.append("  \n")
+        elif tag == "tr":
+            self.out.append("\n| ")
+        elif tag == "pre":
+            self._pre = True
+            self.out.append("\n\n```\n")
+        elif tag == "code" and not self._pre:
+            self.out.append("`")
+        elif tag == "a":
+            self._href = dict(attrs).get("href")
+            self.out.append("[")
+
+    def handle_endtag(self, tag):
+        if tag in ("ul", "ol") and self._lists:
+            self._lists.pop()
+            self.out.append("\n")
+        elif tag in ("strong", "b"):
+            self.out.append("**")
+        elif tag in ("em", "i"):
+            self.out.append("*")
+        elif tag in ("th", "td"):
+            self.out.append(" | ")
+        elif tag == "pre":
+            self._pre = False
+            self.out.append("\n```\n")
+        elif tag == "code" and not self._pre:
+            self.out.append("`")
+        elif tag == "a":
+            self.out.append(f"]({self._href})" if self._href else "]")
+            self._href = None
+
+    def handle_data(self, data):
+        self.out.append(data if self._pre else re.sub(r"\s+", " ", data))
+
+
+def html_vers_markdown(html: str) -> str:
+    parser = _MarkdownConverter()
+    parser.feed(nettoyer_html(html))
+    parser.close()
+    return re.sub(r"\n{3,}", "\n\n", "".join(parser.out)).strip() + "\n"
+
+
+def _slug(text: str, max_len: int = 60) -> str:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:max_len].rstrip("-") or "article"
+
+
+def _articles(user_id: str):
+    return get_articles_table().iter_linked("user", user_id, page_size=EXPORT_PAGE_SIZE)
+
+
+def _meta(record: dict) -> dict:
+    fields = record.get("fields", {})
+    return {
+        "id": record["id"],
+        "created_time": record.get("createdTime"),
+        "title": fields.get("title"),
+        "seo_title": fields.get("seo_title"),
+        "keyword": fields.get("keyword"),
+        "meta_description": fields.get("meta_description"),
+        "status": fields.get("status"),
+        "source_video_id": fields.get("source_video_id"),
+    }
+
+
+def _image_chunks(image_url: str):
+    """
+    (extension, itérateur d'octets) de l'image d'un article, ou None si elle est
+    inaccessible. Les images distantes sont lues en flux, avec une taille maximale.
+    """
+    if not image_url:
+        return None
+    if image_url.startswith("data:"):
+        header, _, data = image_url.partition(",")
+        mimetype = header[5:].split(";")[0]
+        return _IMAGE_EXTENSIONS.get(mimetype, "png"), iter([base64.b64decode(data)])
+    if not image_url.startswith(("http://", "https://")):
+        return None
+    resp = requests.get(image_url, stream=True, timeout=EXPORT_IMAGE_TIMEOUT_SECONDS)
+    resp.raise_for_status()
+    ext = _IMAGE_EXTENSIONS.get(resp.headers.get("Content-Type", "").split(";")[0], "png")
+
+    def chunks():
+        total = 0
+        with resp:
+            for chunk in resp.iter_content(64 * 1024):
+                total += len(chunk)
+                if total > EXPORT_IMAGE_MAX_BYTES:
+                    raise ValueError(f"image de plus de {EXPORT_IMAGE_MAX_BYTES} octets")
+                yield chunk
+
+    return ext, chunks()
+
+
+def _document_html(meta: dict, html: str, image_path: str) -> str:
+    title = escape(meta["seo_title"] or meta["title"] or "Article")
+    parts = [
+        "<!DOCTYPE html>",
+        '<html lang="fr">',
+        "<head>",
+        '<meta charset="utf-8">',
+        f"<title>{title}</title>",
+    ]
+    if meta["meta_description"]:
+        parts.append(f'<meta name="description" content="{escape(meta["meta_description"])}">')
+    parts += ["</head>", "<body>"]
+    if image_path:
+        parts.append(f'<img src="{escape(image_path)}" alt="{title}">')
+    parts += [nettoyer_html(html), "</body>", "</html>", ""]
+    return "\n".join(parts)
+
+
+def _document_markdown(meta: dict, html: str, image_path: str) -> str:
+    # front matter YAML (les chaînes JSON sont des scalaires YAML valides)
+    front = [f"{k}: {json.dumps(v, ensure_ascii=False)}" for k, v in meta.items() if v is not None]
+    body = html_vers_markdown(html)
+    if image_path:
+        body = f"![{meta['title'] or ''}]({image_path})\n\n" + body
+    return "---\n" + "\n".join(front) + "\n---\n\n" + body
+
+
+def flux_zip(user_id: str, fmt: str):
+    """
+    Générateur des octets d'une archive ZIP (un fichier par article, HTML ou Markdown).
+    """
+    sortie = _FluxSortie()
+    count = 0
+    with zipfile.ZipFile(sortie, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for count, record in enumerate(_articles(user_id), 1):
+            fields = record.get("fields", {})
+            meta = _meta(record)
+            base = f"{count:04d}-{_slug(meta['title'])}"
+
+            image_path = None
+            try:
+                image = _image_chunks(fields.get("image_url"))
+                if image:
+                    ext, chunks = image
+                    info = zipfile.ZipInfo(f"images/{base}.{ext}")
+                    info.compress_type = zipfile.ZIP_STORED  # déjà compressé
+                    with zf.open(info, mode="w") as dest:
+                        for chunk in chunks:
+                            dest.write(chunk)
+                            yield from sortie.vider()
+                    image_path = f"images/{base}.{ext}"
+            except Exception as e:
+                # l'entrée partielle reste dans l'archive mais n'est pas référencée
+                logger.warning("image non exportée", article_id=record["id"], error=e)
+
+            if fmt == "markdown":
+                zf.writestr(f"{base}.md", _document_markdown(meta, fields.get("html_content", ""), image_path))
+            else:
+                zf.writestr(f"{base}.html", _document_html(meta, fields.get("html_content", ""), image_path))
+            yield from sortie.vider()
+    yield from sortie.vider()
+    logger.info("export terminé", user_id=user_id, format=fmt, articles=count)
+
+
+def flux_ndjson(user_id: str):
+    """
+    Générateur NDJSON : une ligne JSON par article (HTML nettoyé, image_url telle quelle).
+    """
+    count = 0
+    for count, record in enumerate(_articles(user_id), 1):
+        fields = record.get("fields", {})
+        line = dict(_meta(record), html=nettoyer_html(fields.get("html_content", "")),
+                    image_url=fields.get("image_url"))
+        yield (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+    logger.info("export terminé", user_id=user_id, format="ndjson", articles=count)
+
+
+def flux(user_id: str, fmt: str):
+    return flux_ndjson(user_id) if fmt == "ndjson" else flux_zip(user_id, fmt)
@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+# Chargé automatiquement par `gunicorn app:app` (Procfile).
+#
+# Les routes lentes (/transcription, /blogify, /webhook) passent l'essentiel de leur temps
+# à attendre le réseau (YouTube, OpenAI, Airtable, Stripe) : des workers threadés (gthread)
+# permettent de servir les autres pages pendant ces attentes. Les clients partagés sont
+# thread-safe (OpenAI/httpx, stripe) ou propres à chaque thread (pyairtable, SQLite).
+#
+# Concurrence effective = WEB_CONCURRENCY x GUNICORN_THREADS requêtes simultanées
+# (2 x 16 = 32 par défaut, contre 1 avec l'ancien `--workers 1` en mode sync).
+#
+# Mesure (python -m benchmarks.serving_concurrency --slow-requests 8 --llm-latency 3) :
+#   sync,    1 worker       : 8 /blogify en ~24 s, /login p50 ~12 s (max ~24 s) pendant la charge
+#   gthread, 2 x 16 threads : 8 /blogify en ~3 s,  /login p95 ~11 ms pendant la charge
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
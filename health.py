@@ -0,0 +1,150 @@
+# health.py
+"""
+Sondes de disponibilité des dépendances, exécutées en tâche de fond (un seul worker à la
+fois, via un bail) et stockées dans la base SQLite partagée. /readyz ne fait que lire
+le dernier résultat : aucun appel externe par requête.
+"""
+import os
+import time
+
+import requests
+import stripe
+
+import resilience
+from app_log import get_logger
+from background_tasks import start_periodic
+from local_db import acquire_lease, ensure_schema, get_connection
+from storage import STORAGE_BACKEND
+
+logger = get_logger("health")
+
+HEALTH_PROBE_INTERVAL_SECONDS = int(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "60"))
+HEALTH_PROBE_TIMEOUT_SECONDS = 5
+# Au-delà, un résultat est considéré comme périmé (worker sondeur arrêté...)
+HEALTH_STALE_SECONDS = 3 * HEALTH_PROBE_INTERVAL_SECONDS
+
+# Sans ces dépendances l'application ne peut pas servir de pages : /readyz répond 503
+CRITICAL_PROBES = {"local_db", "airtable"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS health_probes (
+    name TEXT PRIMARY KEY,
+    ok INTEGER NOT NULL,
+    detail TEXT,
+    latency_ms REAL NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+
+def _init():
+    ensure_schema("health", _SCHEMA)
+
+
+def _sonde_local_db():
+    get_connection().execute("SELECT 1").fetchone()
+    return "ok"
+
+
+def _sonde_airtable():
+    if STORAGE_BACKEND == "sqlite":
+        return "non utilisé (STORAGE_BACKEND=sqlite)"
+    from config_airtable import get_users_table
+
+    table = get_users_table()
+    # en mode replicated, c'est Airtable qu'on sonde, pas le cache local
+    (table.remote if STORAGE_BACKEND == "replicated" else table).all(max_records=1)
+    return "ok"
+
+
+def _sonde_openai():
+    # Lecture des métadonnées du modèle : gratuit, contrairement à une génération
+    from blog_utils import client
+
+    client.with_options(timeout=HEALTH_PROBE_TIMEOUT_SECONDS, max_retries=0).models.retrieve("gpt-5.1")
+    return "ok"
+
+
+def _sonde_youtube():
+    proxy_url = os.getenv("PROXY_URL")
+    proxies = {"http": proxy_url, "https": proxy_url} if proxy_url else None
+    resp = requests.head("https://www.youtube.com/", proxies=proxies, timeout=HEALTH_PROBE_TIMEOUT_SECONDS)
+    if resp.status_code >= 500 or resp.status_code == 429:
+        raise RuntimeError(f"HTTP {resp.status_code}")
+    return "ok via proxy" if proxy_url else "ok"
+
+
+def _sonde_stripe():
+    if not stripe.api_key:
+        return "non configuré"
+    # client dédié : le client global a le timeout (plus long) des appels applicatifs
+    client = stripe.StripeClient(stripe.api_key, max_network_retries=0,
+                                 http_client=stripe.RequestsClient(timeout=HEALTH_PROBE_TIMEOUT_SECONDS))
+    client.v1.balance.retrieve()
+    return "ok"
+
+
+PROBES = {
+    "local_db": _sonde_local_db,
+    "airtable": _sonde_airtable,
+    "openai": _sonde_openai,
+    "youtube": _sonde_youtube,
+    "stripe": _sonde_stripe,
+}
+
+
+def sonder():
+    """
+    Exécute toutes les sondes et enregistre leur résultat (un seul worker à la fois).
+    """
+    if not acquire_lease("health-probes", 2 * HEALTH_PROBE_INTERVAL_SECONDS):
+        return
+    _init()
+    conn = get_connection()
+    for name, probe in PROBES.items():
+        start = time.perf_counter()
+        try:
+            ok, detail = True, probe()
+        except Exception as e:
+            ok, detail = False, f"{type(e).__name__}: {e}"[:300]
+            logger.warning("sonde en échec", probe=name, error=detail)
+        conn.execute(
+            "INSERT OR REPLACE INTO health_probes (name, ok, detail, latency_ms, checked_at) VALUES (?, ?, ?, ?, ?)",
+            (name, int(ok), detail, round((time.perf_counter() - start) * 1000, 1), time.time()),
+        )
+
+
+def etat() -> dict:
+    """
+    Dernier résultat de chaque sonde + verdict global + état des disjoncteurs (sans
+    aucun appel externe). Tant que la première série de fond n'a rien écrit, les
+    sondes sont « pas encore sondé » et l'instance n'est pas prête.
+    """
+    _init()
+    now = time.time()
+    rows = {r["name"]: r for r in get_connection().execute("SELECT * FROM health_probes")}
+    checks = {}
+    ready = True
+    for name in PROBES:
+        row = rows.get(name)
+        if row is None:
+            check = {"ok": False, "detail": "pas encore sondé"}
+        else:
+            age = now - row["checked_at"]
+            check = {
+                "ok": bool(row["ok"]) and age < HEALTH_STALE_SECONDS,
+                "detail": row["detail"] if age < HEALTH_STALE_SECONDS else f"résultat périmé ({int(age)} s)",
+                "latency_ms": row["latency_ms"],
+                "age_s": round(age, 1),
+            }
+        check["critical"] = name in CRITICAL_PROBES
+        if check["critical"] and not check["ok"]:
+            ready = False
+        checks[name] = check
+    # état des disjoncteurs, pour information (un disjoncteur ouvert ne rend pas l'instance inapte)
+    return {"ready": ready, "checks": checks, "breakers": resilience.etats()}
+
+
+def demarrer_sondes():
+    # première série immédiate : /readyz a une réponse dès le démarrage
+    start_periodic("health-probes", HEALTH_PROBE_INTERVAL_SECONDS, sonder, initial_delay=0)
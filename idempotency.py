@@ -0,0 +1,123 @@
+# idempotency.py
+"""
+Clés d'idempotence des formulaires coûteux (génération d'article) : chaque formulaire
+affiché porte une clé ; un nouvel envoi avec la même clé (double clic, rafraîchissement)
+se rattache au traitement en cours ou à son résultat au lieu de tout relancer.
+
+Les clés sont partagées entre workers via la base SQLite locale et expirent après
+IDEMPOTENCY_TTL_SECONDS. Une tentative en échec (ou abandonnée par un worker tué)
+peut être relancée avec la même clé.
+"""
+import json
+import os
+import re
+import secrets
+import time
+
+from local_db import ensure_schema, get_connection, transaction
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+# Une tentative « en cours » plus ancienne est considérée comme abandonnée
+IDEMPOTENCY_PENDING_TIMEOUT_SECONDS = int(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", "900"))
+
+_KEY_RE = re.compile(r"[A-Za-z0-9_-]{16,64}")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,         -- pending | done | failed
+    attempt INTEGER NOT NULL,
+    result TEXT,                  -- JSON, quand status = 'done'
+    updated_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (scope, user_id, key)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at);
+"""
+
+
+def _init():
+    ensure_schema("idempotency", _SCHEMA)
+
+
+def nouvelle_cle() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def cle_valide(key: str) -> bool:
+    return bool(key and _KEY_RE.fullmatch(key))
+
+
+def demarrer(scope: str, user_id: str, key: str):
+    """
+    Réserve la clé pour un nouveau traitement. Retourne :
+    - ("new", n) : à traiter, n = numéro de tentative (1, puis 2... après un échec) ;
+    - ("done", résultat) : déjà traité, résultat enregistré par terminer() ;
+    - ("pending", None) : traitement en cours dans une autre requête.
+    """
+    _init()
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT status, attempt, result, updated_at FROM idempotency_keys "
+            "WHERE scope = ? AND user_id = ? AND key = ? AND expires_at > ?",
+            (scope, user_id, key, now),
+        ).fetchone()
+        if row and row["status"] == "done":
+            return "done", json.loads(row["result"])
+        if row and row["status"] == "pending" and row["updated_at"] > now - IDEMPOTENCY_PENDING_TIMEOUT_SECONDS:
+            return "pending", None
+        attempt = row["attempt"] + 1 if row else 1
+        conn.execute(
+            "INSERT OR REPLACE INTO idempotency_keys "
+            "(scope, user_id, key, status, attempt, result, updated_at, expires_at) "
+            "VALUES (?, ?, ?, 'pending', ?, NULL, ?, ?)",
+            (scope, user_id, key, attempt, now, now + IDEMPOTENCY_TTL_SECONDS),
+        )
+        return "new", attempt
+
+
+def attendre(scope: str, user_id: str, key: str, timeout: float):
+    """
+    Attend au plus `timeout` secondes la fin d'un traitement en cours. Retourne son
+    résultat, ou None s'il a échoué ou n'est pas terminé à temps.
+    """
+    _init()
+    deadline = time.monotonic() + timeout
+    conn = get_connection()
+    while True:
+        row = conn.execute(
+            "SELECT status, result FROM idempotency_keys WHERE scope = ? AND user_id = ? AND key = ?",
+            (scope, user_id, key),
+        ).fetchone()
+        if row and row["status"] == "done":
+            return json.loads(row["result"])
+        if not row or row["status"] != "pending" or time.monotonic() >= deadline:
+            return None
+        time.sleep(0.5)
+
+
+def terminer(scope: str, user_id: str, key: str, result: dict):
+    _init()
+    get_connection().execute(
+        "UPDATE idempotency_keys SET status = 'done', result = ?, updated_at = ? "
+        "WHERE scope = ? AND user_id = ? AND key = ?",
+        (json.dumps(result, ensure_ascii=False), time.time(), scope, user_id, key),
+    )
+
+
+def echouer(scope: str, user_id: str, key: str):
+    # la clé reste utilisable : un nouvel envoi relancera une tentative
+    _init()
+    get_connection().execute(
+        "UPDATE idempotency_keys SET status = 'failed', updated_at = ? "
+        "WHERE scope = ? AND user_id = ? AND key = ? AND status = 'pending'",
+        (time.time(), scope, user_id, key),
+    )
+
+
+def purger():
+    _init()
+    get_connection().execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (time.time(),))
@@ -0,0 +1,95 @@
+# local_db.py
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Base SQLite locale partagée par tous les workers gunicorn (même machine / même dyno)
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", "local_state.db")
+
+_local = threading.local()
+_SCHEMAS_OK = set()
+_SCHEMAS_MUTEX = threading.Lock()
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Retourne une connexion SQLite propre au thread courant (et au process courant,
+    pour ne jamais réutiliser une connexion héritée d'un fork gunicorn).
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = sqlite3.connect(
+            LOCAL_DB_PATH,
+            timeout=30,
+            isolation_level=None,  # autocommit : les transactions sont explicites
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def ensure_schema(name: str, ddl: str):
+    """
+    Exécute (une seule fois par process) un script DDL idempotent (CREATE ... IF NOT EXISTS).
+    """
+    key = (os.getpid(), name)
+    if key in _SCHEMAS_OK:
+        return
+    with _SCHEMAS_MUTEX:
+        if key in _SCHEMAS_OK:
+            return
+        get_connection().executescript(ddl)
+        _SCHEMAS_OK.add(key)
+
+
+@contextmanager
+def transaction(immediate: bool = True):
+    """
+    Transaction SQLite explicite. En mode IMMEDIATE le verrou d'écriture est pris
+    dès le BEGIN : deux workers ne peuvent pas lire-modifier-écrire en même temps.
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+_LEASES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def acquire_lease(name: str, ttl_seconds: float) -> bool:
+    """
+    Bail exclusif entre workers : un seul process à la fois exécute la tâche `name`.
+    Le bail est renouvelé par son détenteur et repris par un autre s'il expire.
+    """
+    ensure_schema("leases", _LEASES_SCHEMA)
+    owner = str(os.getpid())
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        if row and row["owner"] != owner and row["expires_at"] > now:
+            return False
+        conn.execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+            (name, owner, now + ttl_seconds),
+        )
+        return True
@@ -0,0 +1,265 @@
+# metrics.py
+"""
+Métriques au format texte Prometheus, sans dépendance externe.
+
+Chaque process gunicorn agrège en mémoire (compteurs, histogrammes) et publie
+périodiquement un instantané dans la base SQLite partagée ; /metrics additionne les
+instantanés de tous les workers vivants et le cumul des workers arrêtés (ligne pid 0),
+pour que les compteurs ne décroissent pas quand gunicorn recycle un worker. Les jauges
+(profondeur de files...) sont calculées au moment du scrape.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from app_log import get_logger
+from local_db import ensure_schema, transaction
+
+logger = get_logger("metrics")
+
+# Un worker qui n'a rien publié depuis ce délai est considéré comme arrêté
+METRICS_STALE_SECONDS = int(os.getenv("METRICS_STALE_SECONDS", "300"))
+
+# Ligne cumulant les derniers instantanés des workers arrêtés
+_RETIRED_PID = 0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics_snapshots (
+    pid INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_HELP = {
+    "http_request_duration_seconds": ("histogram", "Durée des requêtes HTTP par endpoint Flask"),
+    "dependency_request_duration_seconds": ("histogram", "Durée des appels aux services externes"),
+    "dependency_errors_total": ("counter", "Appels aux services externes en erreur"),
+    "cache_requests_total": ("counter", "Lectures de cache par résultat (hit / miss)"),
+    "rate_limited_total": ("counter", "Requêtes refusées (429) par politique de limitation"),
+    "dependency_rejected_total": ("counter", "Appels externes refusés sans être tentés (disjoncteur ouvert, budget épuisé)"),
+    "circuit_breaker_transitions_total": ("counter", "Changements d'état des disjoncteurs"),
+    "transcript_prefetch_total": ("counter", "Préchargements de transcription lancés ou refusés (pool saturé)"),
+}
+
+_mutex = threading.Lock()
+_counters = {}     # (name, labels) -> valeur
+_histograms = {}   # (name, labels) -> [compteurs par bucket..., somme, total]
+_gauges = {}       # name -> (help, label, fn)
+_instance = (None, None)  # (pid, jeton) : distingue deux process successifs de même pid
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def inc(name: str, labels: dict = None, value: float = 1):
+    key = (name, _labels(labels))
+    with _mutex:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, labels: dict = None):
+    key = (name, _labels(labels))
+    with _mutex:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[-2] += seconds
+        h[-1] += 1
+
+
+def observer_requete(endpoint: str, method: str, status: int, seconds: float):
+    observe("http_request_duration_seconds", seconds,
+            {"endpoint": endpoint or "none", "method": method, "status": status})
+
+
+@contextmanager
+def dependance(service: str, operation: str):
+    """
+    Mesure un appel externe : `with metrics.dependance("airtable", "get"): ...`
+    (le nombre d'appels est le _count de l'histogramme).
+    """
+    labels = {"service": service, "operation": operation}
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc("dependency_errors_total", labels)
+        raise
+    finally:
+        observe("dependency_request_duration_seconds", time.perf_counter() - start, labels)
+
+
+def instrumenter(service: str, operation: str):
+    """
+    Décorateur équivalent à `dependance` pour une fonction entière.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with dependance(service, operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cache(nom: str, hit: bool):
+    inc("cache_requests_total", {"cache": nom, "result": "hit" if hit else "miss"})
+
+
+def jauge(name: str, help_text: str, fn, label: str = None):
+    """
+    Enregistre une jauge calculée au scrape. `fn` retourne un nombre, ou un dict
+    {valeur du label `label`: nombre}.
+    """
+    _gauges[name] = (help_text, label, fn)
+
+
+def _jeton() -> str:
+    global _instance
+    if _instance[0] != os.getpid():
+        _instance = (os.getpid(), secrets.token_hex(8))
+    return _instance[1]
+
+
+def _snapshot() -> dict:
+    with _mutex:
+        return {
+            "instance": _jeton(),
+            "counters": [[n, list(map(list, l)), v] for (n, l), v in _counters.items()],
+            "histograms": [[n, list(map(list, l)), list(h)] for (n, l), h in _histograms.items()],
+        }
+
+
+def publier():
+    """
+    Publie l'instantané du process courant (appelé périodiquement et à chaque scrape).
+    """
+    ensure_schema("metrics", _SCHEMA)
+    snapshot = _snapshot()
+    with transaction() as conn:
+        row = conn.execute("SELECT pid, data FROM metrics_snapshots WHERE pid = ?", (os.getpid(),)).fetchone()
+        if row and json.loads(row["data"]).get("instance") != snapshot["instance"]:
+            # pid réutilisé : l'instantané est celui d'un worker arrêté
+            _retirer(conn, [row])
+        conn.execute(
+            "INSERT OR REPLACE INTO metrics_snapshots (pid, data, updated_at) VALUES (?, ?, ?)",
+            (os.getpid(), json.dumps(snapshot), time.time()),
+        )
+
+
+def _ajouter(counters: dict, histograms: dict, data: dict):
+    for name, labels, value in data["counters"]:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, h in data["histograms"]:
+        key = (name, tuple(map(tuple, labels)))
+        acc = histograms.setdefault(key, [0] * len(h))
+        for i, v in enumerate(h):
+            acc[i] += v
+
+
+def _retirer(conn, rows):
+    """
+    Ajoute les instantanés `rows` (workers arrêtés) au cumul de la ligne pid 0, puis
+    les supprime.
+    """
+    counters, histograms = {}, {}
+    retired = conn.execute("SELECT data FROM metrics_snapshots WHERE pid = ?", (_RETIRED_PID,)).fetchone()
+    for row in ([retired] if retired else []) + list(rows):
+        _ajouter(counters, histograms, json.loads(row["data"]))
+    data = {
+        "counters": [[n, list(map(list, l)), v] for (n, l), v in counters.items()],
+        "histograms": [[n, list(map(list, l)), h] for (n, l), h in histograms.items()],
+    }
+    conn.execute(
+        "INSERT OR REPLACE INTO metrics_snapshots (pid, data, updated_at) VALUES (?, ?, ?)",
+        (_RETIRED_PID, json.dumps(data), time.time()),
+    )
+    conn.executemany("DELETE FROM metrics_snapshots WHERE pid = ?", [(row["pid"],) for row in rows])
+
+
+def _fusionner() -> tuple:
+    counters, histograms = {}, {}
+    cutoff = time.time() - METRICS_STALE_SECONDS
+    with transaction() as conn:
+        stale = conn.execute(
+            "SELECT pid, data FROM metrics_snapshots WHERE pid != ? AND updated_at <= ?", (_RETIRED_PID, cutoff)
+        ).fetchall()
+        if stale:
+            _retirer(conn, stale)
+        rows = conn.execute("SELECT data FROM metrics_snapshots").fetchall()
+    for row in rows:
+        _ajouter(counters, histograms, json.loads(row["data"]))
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def exposition() -> str:
+    """
+    Texte au format d'exposition Prometheus (tous workers confondus).
+    """
+    publier()
+    counters, histograms = _fusionner()
+    lines = []
+
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for (name, labels), h in histograms.items():
+        by_name.setdefault(name, []).append((labels, h))
+
+    for name in sorted(by_name):
+        kind, help_text = _HELP.get(name, ("counter", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind == "histogram":
+                for bound, count in zip(LATENCY_BUCKETS, value):
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    for name in sorted(_gauges):
+        help_text, label, fn = _gauges[name]
+        try:
+            value = fn()
+        except Exception as e:
+            logger.warning("jauge indisponible", gauge=name, error=e)
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            for k, v in sorted(value.items()):
+                lines.append(f"{name}{_format_labels([(label, k)])} {_format_value(v)}")
+        else:
+            lines.append(f"{name} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
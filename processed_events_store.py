@@ -0,0 +1,113 @@
+# processed_events_store.py
+import os
+import threading
+import time
+
+from app_log import get_logger
+from local_db import ensure_schema, get_connection
+
+logger = get_logger("processed_events")
+
+# Stripe relance un event pendant ~3 jours : au-delà, inutile de garder son id
+PROCESSED_EVENTS_RETENTION_DAYS = int(os.getenv("PROCESSED_EVENTS_RETENTION_DAYS", "30"))
+# Ancien fichier texte : importé une seule fois puis ignoré
+LEGACY_PROCESSED_EVENTS_FILE = "processed_events.txt"
+
+_PURGE_EVERY_N_INSERTS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_events (
+    event_id TEXT PRIMARY KEY,
+    event_type TEXT,
+    processed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_processed_events_at ON processed_events (processed_at);
+CREATE TABLE IF NOT EXISTS processed_events_imports (
+    path TEXT PRIMARY KEY,
+    imported_at REAL NOT NULL
+);
+"""
+
+# Cache mémoire des ids déjà vus par ce process (borné par la purge)
+_seen = set()
+_seen_mutex = threading.Lock()
+_inserts = 0
+_import_pid = None
+
+
+def _importer_fichier_historique(conn):
+    path = os.path.abspath(LEGACY_PROCESSED_EVENTS_FILE)
+    if not os.path.exists(path):
+        return
+    if conn.execute("SELECT 1 FROM processed_events_imports WHERE path = ?", (path,)).fetchone():
+        return
+    imported_at = os.path.getmtime(path)
+    with open(path, "r", encoding="utf-8") as f:
+        ids = [(line.strip(), imported_at) for line in f if line.strip()]
+    conn.executemany(
+        "INSERT OR IGNORE INTO processed_events (event_id, event_type, processed_at) VALUES (?, NULL, ?)",
+        ids,
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO processed_events_imports (path, imported_at) VALUES (?, ?)",
+        (path, time.time()),
+    )
+    logger.info("event ids importés", count=len(ids), path=LEGACY_PROCESSED_EVENTS_FILE)
+
+
+def _init():
+    global _import_pid
+    ensure_schema("processed_events", _SCHEMA)
+    if _import_pid != os.getpid():
+        _import_pid = os.getpid()
+        _importer_fichier_historique(get_connection())
+
+
+def purger():
+    """
+    Supprime les ids plus vieux que la fenêtre de rétention et vide le cache mémoire.
+    """
+    _init()
+    limite = time.time() - PROCESSED_EVENTS_RETENTION_DAYS * 86400
+    get_connection().execute("DELETE FROM processed_events WHERE processed_at < ?", (limite,))
+    with _seen_mutex:
+        _seen.clear()
+
+
+def deja_traite(event_id: str) -> bool:
+    """
+    Vérification locale (mémoire puis index SQLite), sans aucun appel réseau.
+    """
+    if event_id in _seen:
+        return True
+    _init()
+    row = get_connection().execute(
+        "SELECT 1 FROM processed_events WHERE event_id = ?", (event_id,)
+    ).fetchone()
+    if row:
+        with _seen_mutex:
+            _seen.add(event_id)
+        return True
+    return False
+
+
+def marquer_traite(event_id: str, event_type: str = None) -> bool:
+    """
+    Enregistre l'event de façon atomique. Retourne True si c'est la première fois
+    qu'on le voit (tous workers confondus), False s'il était déjà enregistré.
+    """
+    global _inserts
+    if event_id in _seen:
+        return False
+    _init()
+    cur = get_connection().execute(
+        "INSERT OR IGNORE INTO processed_events (event_id, event_type, processed_at) VALUES (?, ?, ?)",
+        (event_id, event_type, time.time()),
+    )
+    with _seen_mutex:
+        _seen.add(event_id)
+        _inserts += 1
+        should_purge = _inserts % _PURGE_EVERY_N_INSERTS == 0
+    if should_purge:
+        purger()
+    return cur.rowcount == 1
@@ -0,0 +1,169 @@
+# profiler.py
+"""
+Profileur par échantillonnage, activable à chaud depuis /admin/profiler.
+
+Une requête sur N est profilée : un thread d'échantillonnage relève la pile du thread
+de la requête (sys._current_frames) toutes les PROFILER_INTERVAL_MS millisecondes.
+Les piles sont agrégées en mémoire pendant la requête, puis ajoutées à la base SQLite
+partagée (tous workers confondus) et exportées au format "collapsed stacks"
+(flamegraph.pl, speedscope...).
+
+Désactivé, le coût par requête se limite à une comparaison d'horloge.
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from local_db import ensure_schema, get_connection, transaction
+
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+# Délai de prise en compte d'un changement de configuration par les autres workers
+_CONFIG_REFRESH_SECONDS = 5
+_MAX_DEPTH = 128
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiler_config (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    sample_every INTEGER NOT NULL,    -- 0 : désactivé, N : une requête sur N
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS profiler_stacks (
+    stack TEXT PRIMARY KEY,
+    samples INTEGER NOT NULL
+);
+"""
+
+_config = {"sample_every": 0, "checked_at": 0.0}
+_compteur = itertools.count()
+_actifs = {}                  # thread id -> Counter(pile -> échantillons)
+_actifs_mutex = threading.Lock()
+_reveil = threading.Event()
+_sampler_pid = None
+_sampler_mutex = threading.Lock()
+
+
+def _init():
+    ensure_schema("profiler", _SCHEMA)
+
+
+def configurer(sample_every: int):
+    """
+    Active le profilage d'une requête sur `sample_every` (0 pour désactiver).
+    """
+    _init()
+    get_connection().execute(
+        "INSERT OR REPLACE INTO profiler_config (id, sample_every, updated_at) VALUES (1, ?, ?)",
+        (max(0, int(sample_every)), time.time()),
+    )
+    _config["checked_at"] = 0.0
+
+
+def sample_every() -> int:
+    now = time.monotonic()
+    if now - _config["checked_at"] > _CONFIG_REFRESH_SECONDS:
+        _init()
+        row = get_connection().execute("SELECT sample_every FROM profiler_config WHERE id = 1").fetchone()
+        _config["sample_every"] = row["sample_every"] if row else 0
+        _config["checked_at"] = now
+    return _config["sample_every"]
+
+
+def _demarrer_echantillonneur():
+    global _sampler_pid
+    if _sampler_pid == os.getpid():
+        return
+    with _sampler_mutex:
+        if _sampler_pid == os.getpid():
+            return
+        _sampler_pid = os.getpid()
+        threading.Thread(target=_boucle_echantillonnage, name="profiler", daemon=True).start()
+
+
+def _pile(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < _MAX_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def _boucle_echantillonnage():
+    interval = PROFILER_INTERVAL_MS / 1000.0
+    while True:
+        if not _actifs:
+            _reveil.wait()
+            _reveil.clear()
+            continue
+        time.sleep(interval)
+        frames = sys._current_frames()
+        with _actifs_mutex:
+            for tid, counts in _actifs.items():
+                frame = frames.get(tid)
+                if frame is not None:
+                    counts[_pile(frame)] += 1
+
+
+def debut_requete():
+    """
+    À appeler au début d'une requête : démarre l'échantillonnage si elle est tirée.
+    """
+    n = sample_every()
+    if not n or next(_compteur) % n:
+        return
+    _demarrer_echantillonneur()
+    with _actifs_mutex:
+        _actifs[threading.get_ident()] = Counter()
+    _reveil.set()
+
+
+def fin_requete(label: str):
+    """
+    À appeler en fin de requête (teardown, après le streaming éventuel de la réponse).
+    """
+    if not _actifs:
+        return
+    with _actifs_mutex:
+        counts = _actifs.pop(threading.get_ident(), None)
+    if not counts:
+        return
+    _init()
+    with transaction() as conn:
+        for stack, n in counts.items():
+            conn.execute(
+                "INSERT INTO profiler_stacks (stack, samples) VALUES (?, ?) "
+                "ON CONFLICT(stack) DO UPDATE SET samples = samples + excluded.samples",
+                (f"{label};{stack}", n),
+            )
+
+
+def collapsed() -> str:
+    """
+    Piles agrégées au format collapsed : "racine;...;feuille <échantillons>" par ligne.
+    """
+    _init()
+    rows = get_connection().execute("SELECT stack, samples FROM profiler_stacks ORDER BY stack").fetchall()
+    return "".join(f"{r['stack']} {r['samples']}\n" for r in rows)
+
+
+def resume(limit: int = 20) -> list:
+    """
+    Fonctions les plus présentes en feuille de pile (temps "self"), pour l'affichage admin.
+    """
+    _init()
+    totals = Counter()
+    for r in get_connection().execute("SELECT stack, samples FROM profiler_stacks"):
+        totals[r["stack"].rsplit(";", 1)[-1]] += r["samples"]
+    total = sum(totals.values()) or 1
+    return [
+        {"frame": frame, "samples": n, "percent": round(100.0 * n / total, 1)}
+        for frame, n in totals.most_common(limit)
+    ]
+
+
+def reinitialiser():
+    _init()
+    get_connection().execute("DELETE FROM profiler_stacks")
@@ -0,0 +1,153 @@
+# rate_limit.py
+"""
+Limitation de débit par seau à jetons, partagée entre workers via la base SQLite locale.
+
+Chaque politique définit une capacité (rafale) et un débit de recharge, par utilisateur
+connecté ou par IP. Une requête refusée reçoit un 429 avec Retry-After. Les seaux pleins
+(inactifs) sont purgés périodiquement et leur nombre est plafonné.
+"""
+import math
+import os
+import time
+from functools import wraps
+
+from flask import make_response, request, session
+
+import metrics
+from app_log import get_logger
+from background_tasks import start_periodic
+from local_db import ensure_schema, get_connection, transaction
+
+logger = get_logger("rate_limit")
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+# Nombre de proxys de confiance devant l'application (routeur Heroku : 1)
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "1"))
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+
+
+def _politique(name: str, default: str, key: str) -> dict:
+    # RATE_LIMIT_<NAME>="capacité/secondes" : `capacité` requêtes en rafale, rechargées en `secondes`
+    capacity, period = os.getenv(f"RATE_LIMIT_{name.upper()}", default).split("/")
+    return {"capacity": float(capacity), "rate": float(capacity) / float(period), "key": key}
+
+
+POLICIES = {
+    "login": _politique("login", "10/300", "ip"),
+    "signup": _politique("signup", "5/3600", "ip"),
+    "transcription": _politique("transcription", "10/120", "user"),
+    "prefetch": _politique("prefetch", "20/120", "user"),
+    "blogify": _politique("blogify", "3/180", "user"),
+    "export": _politique("export", "3/600", "user"),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    full_at REAL NOT NULL         -- instant où le seau sera de nouveau plein (purgeable)
+);
+CREATE INDEX IF NOT EXISTS idx_rate_buckets_full ON rate_buckets (full_at);
+"""
+
+
+def _init():
+    ensure_schema("rate_limit", _SCHEMA)
+
+
+def ip_client() -> str:
+    forwarded = [p.strip() for p in request.headers.get("X-Forwarded-For", "").split(",") if p.strip()]
+    # Seules les entrées ajoutées par nos propres proxys sont fiables (les premières sont falsifiables)
+    if RATE_LIMIT_PROXY_HOPS and len(forwarded) >= RATE_LIMIT_PROXY_HOPS:
+        return forwarded[-RATE_LIMIT_PROXY_HOPS]
+    return request.remote_addr or "inconnu"
+
+
+def consommer(key: str, capacity: float, rate: float) -> float:
+    """
+    Prend un jeton du seau `key`. Retourne 0 si la requête passe, sinon le nombre de
+    secondes avant qu'un jeton soit disponible.
+    """
+    _init()
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+        tokens = capacity if row is None else min(capacity, row["tokens"] + (now - row["updated_at"]) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        conn.execute(
+            "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+            (key, tokens, now, now + (capacity - tokens) / rate),
+        )
+    return wait
+
+
+def verifier(policy_name: str):
+    """
+    Applique la politique `policy_name` à la requête courante : None si elle passe,
+    sinon la réponse 429 à renvoyer. Pour limiter après des vérifications propres à
+    la route (ex : /blogify ne compte pas un formulaire déjà traité).
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
+    policy = POLICIES[policy_name]
+    user = session.get("user") or {}
+    if policy["key"] == "user" and user.get("id"):
+        key = f"{policy_name}:user:{user['id']}"
+    else:
+        key = f"{policy_name}:ip:{ip_client()}"
+    try:
+        wait = consommer(key, policy["capacity"], policy["rate"])
+    except Exception as e:
+        # base indisponible : on laisse passer plutôt que de bloquer tout le monde
+        logger.warning("limiteur indisponible", policy=policy_name, error=e)
+        wait = 0
+    if not wait:
+        return None
+    metrics.inc("rate_limited_total", {"policy": policy_name})
+    logger.info("requête limitée", policy=policy_name, key=key, retry_after=round(wait, 1))
+    retry_after = max(1, math.ceil(wait))
+    resp = make_response(f"Trop de requêtes : merci de réessayer dans {retry_after} secondes.", 429)
+    resp.headers["Retry-After"] = str(retry_after)
+    resp.mimetype = "text/plain"
+    return resp
+
+
+def limite(policy_name: str, methods=("POST",)):
+    """
+    Décorateur de route : applique la politique `policy_name` (à placer sous
+    @login_required pour les politiques par utilisateur).
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            if request.method in methods:
+                refus = verifier(policy_name)
+                if refus is not None:
+                    return refus
+            return view_func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def purger():
+    """
+    Supprime les seaux redevenus pleins (équivalents à une absence de seau), puis les
+    plus anciens si le plafond RATE_LIMIT_MAX_BUCKETS est dépassé.
+    """
+    _init()
+    conn = get_connection()
+    conn.execute("DELETE FROM rate_buckets WHERE full_at < ?", (time.time(),))
+    conn.execute(
+        "DELETE FROM rate_buckets WHERE key IN ("
+        "  SELECT key FROM rate_buckets ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+        (RATE_LIMIT_MAX_BUCKETS,),
+    )
+
+
+def demarrer_purge():
+    start_periodic("rate-limit-purge", 300, purger)
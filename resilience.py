@@ -0,0 +1,317 @@
+# resilience.py
+"""
+Disjoncteurs par dépendance externe (Airtable, OpenAI, YouTube, Stripe) et budget de
+temps par requête.
+
+- Chaque requête HTTP reçoit une échéance globale (flask.g.deadline). Un appel externe
+  prend comme timeout le plus petit de son délai propre et du temps restant ; il n'est
+  pas tenté s'il reste moins de RESILIENCE_MIN_CALL_SECONDS. Une route peut mettre de
+  côté une partie de ce budget (reserver) pour ses dernières étapes.
+- Après BREAKER_FAILURE_THRESHOLD pannes (timeout, erreur réseau, 5xx, 429) en
+  BREAKER_WINDOW_SECONDS, le disjoncteur s'ouvre : les appels échouent immédiatement
+  pendant BREAKER_COOLDOWN_SECONDS, puis un seul appel d'essai passe (semi-ouvert) ;
+  son succès referme le disjoncteur, son échec le rouvre.
+
+L'état des disjoncteurs est partagé entre workers via la base SQLite locale.
+"""
+import math
+import os
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+import metrics
+from app_log import get_logger
+from local_db import ensure_schema, get_connection, transaction
+
+logger = get_logger("resilience")
+
+SERVICES = {
+    # service -> (nom affiché, timeout par défaut d'un appel en secondes)
+    "airtable": ("Airtable", 10),
+    "openai": ("OpenAI", 120),
+    "youtube": ("YouTube", 20),
+    "stripe": ("Stripe", 15),
+}
+TIMEOUTS = {s: float(os.getenv(f"RESILIENCE_TIMEOUT_{s.upper()}", str(t))) for s, (_, t) in SERVICES.items()}
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_WINDOW_SECONDS = int(os.getenv("BREAKER_WINDOW_SECONDS", "60"))
+BREAKER_COOLDOWN_SECONDS = int(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Budget global d'une requête ; les routes longues vont jusqu'au timeout gunicorn (moins une marge)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+REQUEST_DEADLINE_LONG_SECONDS = float(os.getenv("GUNICORN_TIMEOUT", "180")) - 10
+LONG_ENDPOINTS = {"blogify", "transcription"}
+RESILIENCE_MIN_CALL_SECONDS = 1.0
+
+STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS circuit_breakers (
+    service TEXT PRIMARY KEY,
+    state TEXT NOT NULL,          -- closed | open | half_open
+    failures INTEGER NOT NULL,    -- pannes dans la fenêtre courante
+    window_start REAL NOT NULL,
+    opened_at REAL,
+    last_error TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class DependanceIndisponible(RuntimeError):
+    """Appel externe refusé sans être tenté : disjoncteur ouvert ou budget de la requête épuisé."""
+
+    def __init__(self, service: str, raison: str):
+        self.service = service
+        self.raison = raison
+        nom = SERVICES[service][0]
+        if raison == "deadline":
+            message = f"Délai de la requête dépassé avant l'appel à {nom}. Réessaie dans un instant."
+        else:
+            message = f"{nom} est momentanément indisponible. Réessaie dans quelques instants."
+        super().__init__(message)
+
+
+def _init():
+    ensure_schema("resilience", _SCHEMA)
+
+
+# --- Budget de temps par requête ---------------------------------------------
+
+def demarrer_budget():
+    # à appeler en before_request
+    long = request.endpoint in LONG_ENDPOINTS
+    g.deadline = time.monotonic() + (REQUEST_DEADLINE_LONG_SECONDS if long else REQUEST_DEADLINE_SECONDS)
+
+
+def reserver(seconds: float):
+    """
+    Met de côté `seconds` du budget de la requête en cours : les appels suivants voient
+    une échéance avancée d'autant, jusqu'à liberer_reserve() (par exemple pour garder
+    de quoi enregistrer un résultat déjà payé).
+    """
+    if has_request_context():
+        g.deadline_reserve = seconds
+
+
+def liberer_reserve():
+    if has_request_context():
+        g.pop("deadline_reserve", None)
+
+
+def restant() -> float:
+    """
+    Temps restant (secondes) avant l'échéance de la requête, réserve déduite ; infini
+    hors requête.
+    """
+    deadline = g.get("deadline") if has_request_context() else None
+    if deadline is None:
+        return math.inf
+    return deadline - g.get("deadline_reserve", 0) - time.monotonic()
+
+
+def delai(service: str) -> float:
+    """
+    Timeout à utiliser pour un appel à `service` : son délai propre, borné par le temps
+    restant de la requête en cours. Lève DependanceIndisponible si le budget est épuisé.
+    """
+    timeout = TIMEOUTS[service]
+    deadline = g.get("deadline") if has_request_context() else None
+    if deadline is None:
+        # tâches de fond, réponses streamées : pas d'échéance de requête
+        return timeout
+    remaining = restant()
+    if remaining < RESILIENCE_MIN_CALL_SECONDS:
+        metrics.inc("dependency_rejected_total", {"service": service, "reason": "deadline"})
+        raise DependanceIndisponible(service, "deadline")
+    return min(timeout, remaining)
+
+
+# --- Disjoncteurs --------------------------------------------------------------
+
+def _est_panne(exc: Exception) -> bool:
+    """
+    Erreur imputable au service (à compter pour le disjoncteur), par opposition aux
+    erreurs « métier » (404, transcription absente, carte refusée...).
+    """
+    status = getattr(exc, "status_code", None) or getattr(exc, "http_status", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    name = type(exc).__name__
+    if any(s in name for s in ("Timeout", "Connection", "Blocked")):
+        return True
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+def _transition(conn, service: str, state: str, now: float, error: str = None):
+    conn.execute(
+        "UPDATE circuit_breakers SET state = ?, failures = 0, window_start = ?, updated_at = ?, "
+        "opened_at = CASE WHEN ? = 'open' THEN ? ELSE opened_at END, last_error = COALESCE(?, last_error) "
+        "WHERE service = ?",
+        (state, now, now, state, now, error, service),
+    )
+    metrics.inc("circuit_breaker_transitions_total", {"service": service, "state": state})
+    log = logger.warning if state == "open" else logger.info
+    log("disjoncteur", service=service, state=state, error=error)
+
+
+def _autoriser(service: str) -> str:
+    """
+    État vu par l'appel : "closed" / "dirty" (pannes récentes) / "trial" (appel d'essai
+    en semi-ouvert) si l'appel peut être tenté, "open" sinon.
+    """
+    row = get_connection().execute(
+        "SELECT state, failures, updated_at FROM circuit_breakers WHERE service = ?", (service,)
+    ).fetchone()
+    if row is None or row["state"] == "closed":
+        return "dirty" if row is not None and row["failures"] else "closed"
+    now = time.time()
+    if now - row["updated_at"] < BREAKER_COOLDOWN_SECONDS:
+        return "open"
+    # délai écoulé (ou appel d'essai jamais revenu) : un seul appel d'essai, tous workers confondus
+    with transaction() as conn:
+        cur = conn.execute(
+            "UPDATE circuit_breakers SET state = 'half_open', updated_at = ? "
+            "WHERE service = ? AND state = ? AND updated_at = ?",
+            (now, service, row["state"], row["updated_at"]),
+        )
+    if cur.rowcount != 1:
+        return "open"
+    metrics.inc("circuit_breaker_transitions_total", {"service": service, "state": "half_open"})
+    return "trial"
+
+
+def _succes(service: str, vu: str):
+    if vu == "closed":
+        return
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute("SELECT state FROM circuit_breakers WHERE service = ?", (service,)).fetchone()
+        if row and row["state"] == "half_open":
+            _transition(conn, service, "closed", now)
+        elif row:
+            conn.execute("UPDATE circuit_breakers SET failures = 0, updated_at = ? WHERE service = ?", (now, service))
+
+
+def _echec(service: str, exc: Exception):
+    now = time.time()
+    error = f"{type(exc).__name__}: {exc}"[:500]
+    with transaction() as conn:
+        row = conn.execute("SELECT * FROM circuit_breakers WHERE service = ?", (service,)).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT INTO circuit_breakers (service, state, failures, window_start, last_error, updated_at) "
+                "VALUES (?, 'closed', 0, ?, NULL, ?)",
+                (service, now, now),
+            )
+            row = {"state": "closed", "failures": 0, "window_start": now}
+        if row["state"] == "half_open":
+            _transition(conn, service, "open", now, error)
+            return
+        if row["state"] == "open":
+            return
+        failures = (row["failures"] if now - row["window_start"] < BREAKER_WINDOW_SECONDS else 0) + 1
+        if failures >= BREAKER_FAILURE_THRESHOLD:
+            _transition(conn, service, "open", now, error)
+            return
+        conn.execute(
+            "UPDATE circuit_breakers SET failures = ?, window_start = ?, last_error = ?, updated_at = ? "
+            "WHERE service = ?",
+            (failures, row["window_start"] if failures > 1 else now, error, now, service),
+        )
+
+
+@contextmanager
+def appel(service: str, operation: str):
+    """
+    Appel protégé à un service externe, mesuré comme metrics.dependance :
+    `with resilience.appel("airtable", "get") as timeout: ...` (timeout en secondes).
+    """
+    timeout = delai(service)
+    try:
+        _init()
+        vu = _autoriser(service)
+    except Exception as e:
+        # base indisponible : on laisse passer plutôt que de bloquer tous les appels
+        logger.warning("disjoncteur illisible", service=service, error=e)
+        vu = None
+    if vu == "open":
+        metrics.inc("dependency_rejected_total", {"service": service, "reason": "open"})
+        raise DependanceIndisponible(service, "open")
+
+    with metrics.dependance(service, operation):
+        try:
+            yield timeout
+        except Exception as e:
+            if vu is not None:
+                try:
+                    if _est_panne(e):
+                        _echec(service, e)
+                    else:
+                        # une erreur « métier » prouve que le service répond
+                        _succes(service, vu)
+                except Exception as db_error:
+                    logger.warning("disjoncteur non mis à jour", service=service, error=db_error)
+            raise
+    if vu is not None:
+        try:
+            _succes(service, vu)
+        except Exception as e:
+            logger.warning("disjoncteur non mis à jour", service=service, error=e)
+
+
+def ouvert(service: str) -> bool:
+    """
+    Vrai si le disjoncteur est ouvert (lecture seule : ne consomme pas l'appel d'essai).
+    À utiliser pour renoncer tôt à un traitement coûteux.
+    """
+    try:
+        _init()
+        row = get_connection().execute(
+            "SELECT state, updated_at FROM circuit_breakers WHERE service = ?", (service,)
+        ).fetchone()
+    except Exception:
+        return False
+    return bool(row and row["state"] == "open" and time.time() - row["updated_at"] < BREAKER_COOLDOWN_SECONDS)
+
+
+def etats() -> dict:
+    """
+    État de chaque disjoncteur (page d'admin, /readyz, métriques).
+    """
+    _init()
+    rows = {r["service"]: r for r in get_connection().execute("SELECT * FROM circuit_breakers")}
+    now = time.time()
+    out = {}
+    for service in SERVICES:
+        row = rows.get(service)
+        if row is None:
+            out[service] = {"state": "closed", "failures": 0, "opened_at": None, "last_error": None}
+            continue
+        out[service] = {
+            "state": row["state"],
+            "failures": row["failures"] if now - row["window_start"] < BREAKER_WINDOW_SECONDS else 0,
+            "opened_at": row["opened_at"],
+            "last_error": row["last_error"],
+        }
+    return out
+
+
+def reinitialiser(service: str) -> bool:
+    """
+    Referme un disjoncteur à la main (admin), par exemple après un incident résolu.
+    """
+    if service not in SERVICES:
+        return False
+    _init()
+    now = time.time()
+    with transaction() as conn:
+        if not conn.execute("SELECT 1 FROM circuit_breakers WHERE service = ?", (service,)).fetchone():
+            return False
+        _transition(conn, service, "closed", now)
+    return True
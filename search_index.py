@@ -0,0 +1,231 @@
+# search_index.py
+"""
+Recherche plein texte locale (SQLite FTS5) sur les articles et leurs transcriptions.
+
+L'index est mis à jour à chaque sauvegarde d'article et resynchronisé périodiquement
+avec la table des articles (articles modifiés ou supprimés dans Airtable) ; une
+recherche ne fait jamais d'appel Airtable.
+
+L'index est réparti en SEARCH_SHARDS tables FTS5 selon l'utilisateur : BM25 parcourt
+toute la liste de documents d'un terme pour calculer son IDF, ce qui coûte plusieurs
+dizaines de ms pour un terme fréquent à 100k articles dans une table unique. Dans une
+partition, la requête est en plus restreinte à l'utilisateur via la colonne user_id.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import zlib
+from html import escape, unescape
+
+from app_log import get_logger
+from background_tasks import start_periodic
+from local_db import acquire_lease, ensure_schema, get_connection, transaction
+
+logger = get_logger("search_index")
+
+SEARCH_MAX_RESULTS = 50
+SEARCH_SYNC_INTERVAL_SECONDS = int(os.getenv("SEARCH_SYNC_INTERVAL_SECONDS", "3600"))
+# Poids BM25 par colonne : user_id (filtre uniquement), titre, mot-clé, texte, transcription
+_BM25_WEIGHTS = (0.0, 10.0, 5.0, 1.0, 0.5)
+
+# Nombre de partitions de l'index (changer cette valeur impose de reconstruire l'index)
+SEARCH_SHARDS = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_docs (
+    id INTEGER PRIMARY KEY,           -- rowid du document dans sa partition articles_fts_NN
+    article_id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    title TEXT,
+    created_time TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_search_docs_user ON search_docs (user_id, created_time);
+CREATE TABLE IF NOT EXISTS search_versions (
+    article_id TEXT PRIMARY KEY,
+    version TEXT NOT NULL,            -- empreinte des champs indexés
+    indexed_at REAL NOT NULL
+);
+""" + "".join(
+    f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts_{n:02d} USING fts5(
+    user_id, title, keyword, body, transcript,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);"""
+    for n in range(SEARCH_SHARDS)
+)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_QUERY_TOKEN_RE = re.compile(r"[^\W_]+\*?")
+# Marqueurs de surlignage insérés par snippet(), échappés ensuite
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+
+def _init():
+    ensure_schema("search_index", _SCHEMA)
+
+
+def _partition(user_id: str) -> str:
+    return f"articles_fts_{zlib.crc32(user_id.encode('utf-8')) % SEARCH_SHARDS:02d}"
+
+
+def _texte(html: str) -> str:
+    return re.sub(r"\s+", " ", unescape(_TAG_RE.sub(" ", html or ""))).strip()
+
+
+def _version(record: dict) -> str:
+    fields = record.get("fields", {})
+    indexed = [fields.get(k) for k in ("user", "title", "seo_title", "keyword", "html_content", "source_transcript")]
+    return hashlib.sha256(json.dumps(indexed, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+
+def _retirer(conn, article_id: str):
+    row = conn.execute("SELECT id, user_id FROM search_docs WHERE article_id = ?", (article_id,)).fetchone()
+    if row:
+        conn.execute(f"DELETE FROM {_partition(row['user_id'])} WHERE rowid = ?", (row["id"],))
+        conn.execute("DELETE FROM search_docs WHERE id = ?", (row["id"],))
+    conn.execute("DELETE FROM search_versions WHERE article_id = ?", (article_id,))
+
+
+def indexer(record: dict, transcript: str = None):
+    """
+    Ajoute ou remplace un article dans l'index (rattaché au premier utilisateur lié).
+    `transcript` : texte source, qui n'est pas conservé dans la table des articles.
+    """
+    _init()
+    fields = record.get("fields", {})
+    owners = fields.get("user") or []
+    with transaction() as conn:
+        row = conn.execute("SELECT id, user_id FROM search_docs WHERE article_id = ?", (record["id"],)).fetchone()
+        if row and transcript is None:
+            # réindexation sans transcription : on garde celle déjà indexée
+            old = conn.execute(
+                f"SELECT transcript FROM {_partition(row['user_id'])} WHERE rowid = ?", (row["id"],)
+            ).fetchone()
+            transcript = old["transcript"] if old else None
+        _retirer(conn, record["id"])
+        if not owners:
+            return
+        conn.execute(
+            "INSERT INTO search_versions (article_id, version, indexed_at) VALUES (?, ?, ?)",
+            (record["id"], _version(record), time.time()),
+        )
+        cur = conn.execute(
+            "INSERT INTO search_docs (article_id, user_id, title, created_time) VALUES (?, ?, ?, ?)",
+            (record["id"], owners[0], fields.get("title"), record.get("createdTime")),
+        )
+        conn.execute(
+            f"INSERT INTO {_partition(owners[0])} (rowid, user_id, title, keyword, body, transcript) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (cur.lastrowid, owners[0], " ".join(filter(None, [fields.get("title"), fields.get("seo_title")])),
+             fields.get("keyword"), _texte(fields.get("html_content")), transcript or fields.get("source_transcript")),
+        )
+
+
+def _requete_fts(query: str, user_id: str):
+    """
+    Traduit la saisie utilisateur en requête FTS5 sûre : chaque mot est cité (aucun
+    opérateur injecté), `mot*` et le dernier mot saisi deviennent des recherches par préfixe
+    (à partir de 2 caractères, couverts par l'index `prefix`).
+    """
+    tokens = _QUERY_TOKEN_RE.findall(query or "")
+    if not tokens:
+        return None
+    terms = []
+    for i, token in enumerate(tokens):
+        word = token.rstrip("*")
+        prefix = (token.endswith("*") or i == len(tokens) - 1) and len(word) >= 2
+        terms.append(f'"{word}"' + ("*" if prefix else ""))
+    user_id = user_id.replace('"', '""')
+    return f'user_id:"{user_id}" AND {{title keyword body transcript}}: ({" ".join(terms)})'
+
+
+def _surligner(snippet: str) -> str:
+    return escape(snippet or "").replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def rechercher(user_id: str, query: str, limit: int = SEARCH_MAX_RESULTS) -> list:
+    """
+    Articles de l'utilisateur correspondant à `query`, du plus pertinent au moins pertinent
+    (BM25). `snippet` est du HTML déjà échappé, avec les termes trouvés dans des <mark>.
+    """
+    _init()
+    match = _requete_fts(query, user_id)
+    if not match:
+        return []
+    table = _partition(user_id)
+    weights = ", ".join(str(w) for w in _BM25_WEIGHTS)
+    start = time.perf_counter()
+    rows = get_connection().execute(
+        "SELECT d.article_id, d.title, d.created_time, "
+        f"snippet({table}, 3, '{_MARK_START}', '{_MARK_END}', '…', 16) AS body_snippet, "
+        f"snippet({table}, 4, '{_MARK_START}', '{_MARK_END}', '…', 16) AS transcript_snippet "
+        f"FROM {table} JOIN search_docs d ON d.id = {table}.rowid "
+        f"WHERE {table} MATCH ? ORDER BY bm25({table}, {weights}) LIMIT ?",
+        (match, limit),
+    ).fetchall()
+    logger.debug("recherche", user_id=user_id, results=len(rows),
+                 elapsed_ms=round((time.perf_counter() - start) * 1000, 2))
+    results = []
+    for r in rows:
+        # extrait du texte de l'article, sauf si seuls la transcription ou le titre correspondent
+        body, transcript = r["body_snippet"] or "", r["transcript_snippet"] or ""
+        snippet = transcript if _MARK_START not in body and _MARK_START in transcript else body
+        results.append({
+            "id": r["article_id"],
+            "title": r["title"],
+            "created_time": r["created_time"],
+            "snippet": _surligner(snippet),
+        })
+    return results
+
+
+def lister(user_id: str) -> list:
+    """
+    Articles indexés de l'utilisateur, du plus récent au plus ancien : liste de secours
+    quand la table des articles est inaccessible.
+    """
+    _init()
+    rows = get_connection().execute(
+        "SELECT article_id, title, created_time FROM search_docs WHERE user_id = ? ORDER BY created_time DESC",
+        (user_id,),
+    ).fetchall()
+    return [{"id": r["article_id"], "title": r["title"], "created_time": r["created_time"]} for r in rows]
+
+
+def synchroniser():
+    """
+    Resynchronise l'index avec la table des articles (un seul worker, via un bail) :
+    réindexe les articles modifiés et retire ceux qui ont été supprimés.
+    """
+    _init()
+    if not acquire_lease("search-backfill", 600):
+        return
+    from airtable_articles import get_articles_table
+
+    started_at = time.time()
+    conn = get_connection()
+    versions = {r["article_id"]: r["version"] for r in conn.execute("SELECT article_id, version FROM search_versions")}
+    indexed = {r["article_id"] for r in conn.execute("SELECT article_id FROM search_docs")}
+    seen = set()
+    updated = 0
+    for record in get_articles_table().all():
+        seen.add(record["id"])
+        if versions.get(record["id"]) != _version(record):
+            indexer(record)
+            updated += 1
+    # articles absents de la liste complète, sauf ceux indexés pendant la synchronisation
+    removed = 0
+    for article_id in (indexed | set(versions)) - seen:
+        with transaction() as conn:
+            row = conn.execute("SELECT indexed_at FROM search_versions WHERE article_id = ?", (article_id,)).fetchone()
+            if row is None or row["indexed_at"] < started_at:
+                _retirer(conn, article_id)
+                removed += 1
+    logger.info("index de recherche synchronisé", articles=len(seen), updated=updated, removed=removed)
+
+
+def demarrer_remplissage():
+    start_periodic("search-backfill", SEARCH_SYNC_INTERVAL_SECONDS, synchroniser, initial_delay=0)
@@ -0,0 +1,227 @@
+# seo_score.py
+"""
+Analyse SEO d'un article généré : densité du mot-clé, structure des titres, lisibilité,
+longueur du titre SEO et de la meta description, contenu dupliqué.
+
+Le HTML est parcouru en une seule passe (expressions précompilées, pas de DOM) et le
+résultat est mis en cache dans la base SQLite partagée, par empreinte du contenu.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from html import unescape
+
+import metrics
+from local_db import ensure_schema, get_connection
+
+# À incrémenter quand le calcul change : les anciens scores du cache sont alors ignorés
+SEO_SCORE_VERSION = 1
+# En dessous, l'article est régénéré une fois (si SEO_AUTO_REGENERATE=1)
+SEO_MIN_SCORE = int(os.getenv("SEO_MIN_SCORE", "60"))
+SEO_AUTO_REGENERATE = os.getenv("SEO_AUTO_REGENERATE", "0") == "1"
+
+KEYWORD_DENSITY_RANGE = (0.5, 2.5)     # % des mots
+SEO_TITLE_RANGE = (30, 60)             # caractères
+META_DESCRIPTION_RANGE = (120, 160)
+MIN_WORDS = 600
+
+# Balise ouvrante/fermante ou texte entre deux balises
+_TOKEN_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9]*)\b[^>]*>|([^<]+)")
+_WORD_RE = re.compile(r"[^\W\d_]+(?:['’-][^\W\d_]+)*|\d+")
+_SENTENCE_END_RE = re.compile(r"[.!?…]+(?=\s|$)")
+_VOWEL_GROUP_RE = re.compile(r"[aeiouy]+")
+_HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_BLOCK_TAGS = {"p", "li", "blockquote", "td", "th"} | set(_HEADING_TAGS)
+
+# Poids de chaque critère dans le score sur 100
+_WEIGHTS = {
+    "keyword": 25,
+    "headings": 20,
+    "readability": 20,
+    "seo_title": 10,
+    "meta_description": 10,
+    "duplication": 10,
+    "length": 5,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seo_scores (
+    content_hash TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def _init():
+    ensure_schema("seo_scores", _SCHEMA)
+
+
+def _normaliser(text: str) -> str:
+    # minuscules sans accents : "Référencement" et "referencement" comptent pareil
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _tokeniser(html: str):
+    """
+    Une passe sur le HTML : titres (niveau, texte) et blocs de texte, dans l'ordre.
+    """
+    headings, blocks = [], []
+    current, current_heading = [], None
+    for m in _TOKEN_RE.finditer(html or ""):
+        closing, tag, text = m.groups()
+        if text is not None:
+            current.append(text)
+            continue
+        tag = tag.lower()
+        if tag not in _BLOCK_TAGS:
+            continue
+        block = unescape(" ".join(current)).strip()
+        if block:
+            blocks.append(block)
+            if current_heading:
+                headings.append((current_heading, block))
+        current = []
+        current_heading = _HEADING_TAGS.get(tag) if not closing else None
+    tail = unescape(" ".join(current)).strip()
+    if tail:
+        blocks.append(tail)
+    return headings, blocks
+
+
+def _ratio_score(value: float, low: float, high: float) -> float:
+    """
+    1 dans l'intervalle [low, high], décroissance linéaire jusqu'à 0 en dehors.
+    """
+    if low <= value <= high:
+        return 1.0
+    if value < low:
+        return max(0.0, value / low) if low else 0.0
+    return max(0.0, 1 - (value - high) / high)
+
+
+def _analyser(html: str, keyword: str, seo_title: str, meta_description: str) -> dict:
+    headings, blocks = _tokeniser(html)
+    text = _normaliser(" ".join(blocks))
+    words = _WORD_RE.findall(text)
+    nb_words = len(words)
+    issues = []
+    scores = {}
+
+    # Mot-clé : densité de l'expression complète + présence dans les endroits clés
+    kw_words = _WORD_RE.findall(_normaliser(keyword or ""))
+    density = 0.0
+    if kw_words and nb_words:
+        n = len(kw_words)
+        hits = sum(1 for i in range(nb_words - n + 1) if words[i:i + n] == kw_words)
+        density = 100.0 * hits * n / nb_words
+        kw = " ".join(kw_words)
+        placements = [
+            any(level == 1 and kw in " ".join(_WORD_RE.findall(_normaliser(h))) for level, h in headings),
+            kw in " ".join(_WORD_RE.findall(_normaliser(seo_title or ""))),
+            kw in " ".join(_WORD_RE.findall(_normaliser(meta_description or ""))),
+            bool(blocks) and kw in " ".join(words[:100]),
+        ]
+        scores["keyword"] = 0.6 * _ratio_score(density, *KEYWORD_DENSITY_RANGE) + 0.1 * sum(placements)
+        if not KEYWORD_DENSITY_RANGE[0] <= density <= KEYWORD_DENSITY_RANGE[1]:
+            issues.append(f"Densité du mot-clé de {density:.1f} % (cible : "
+                          f"{KEYWORD_DENSITY_RANGE[0]}–{KEYWORD_DENSITY_RANGE[1]} %).")
+        for ok, where in zip(placements, ("le H1", "le titre SEO", "la meta description", "l'introduction")):
+            if not ok:
+                issues.append(f"Mot-clé absent de {where}.")
+    else:
+        scores["keyword"] = 0.0
+        issues.append("Aucun mot-clé principal.")
+
+    # Titres : un seul H1, au moins deux H2, pas de niveau sauté
+    levels = [level for level, _ in headings]
+    h1 = levels.count(1)
+    skips = sum(1 for a, b in zip(levels, levels[1:]) if b > a + 1)
+    scores["headings"] = (0.4 * (h1 == 1) + 0.4 * min(1.0, levels.count(2) / 2) + 0.2 * (skips == 0))
+    if h1 != 1:
+        issues.append(f"{h1} titre(s) H1 (attendu : 1).")
+    if levels.count(2) < 2:
+        issues.append("Moins de deux sous-titres H2.")
+    if skips:
+        issues.append("Hiérarchie des titres avec des niveaux sautés.")
+
+    # Lisibilité : Flesch adapté au français (Kandel & Moles)
+    sentences = sum(max(1, len(_SENTENCE_END_RE.findall(b))) for b in blocks) or 1
+    syllables = sum(max(1, len(_VOWEL_GROUP_RE.findall(w))) for w in words)
+    readability = 207 - 1.015 * (nb_words / sentences) - 73.6 * (syllables / nb_words) if nb_words else 0.0
+    scores["readability"] = _ratio_score(readability, 50, 100)
+    if readability < 50:
+        issues.append(f"Lisibilité faible ({readability:.0f}/100) : phrases ou mots trop longs.")
+
+    # Longueurs du titre SEO et de la meta description
+    title_len = len((seo_title or "").strip())
+    meta_len = len((meta_description or "").strip())
+    scores["seo_title"] = _ratio_score(title_len, *SEO_TITLE_RANGE)
+    scores["meta_description"] = _ratio_score(meta_len, *META_DESCRIPTION_RANGE)
+    if not SEO_TITLE_RANGE[0] <= title_len <= SEO_TITLE_RANGE[1]:
+        issues.append(f"Titre SEO de {title_len} caractères (cible : {SEO_TITLE_RANGE[0]}–{SEO_TITLE_RANGE[1]}).")
+    if not META_DESCRIPTION_RANGE[0] <= meta_len <= META_DESCRIPTION_RANGE[1]:
+        issues.append(f"Meta description de {meta_len} caractères "
+                      f"(cible : {META_DESCRIPTION_RANGE[0]}–{META_DESCRIPTION_RANGE[1]}).")
+
+    # Duplication interne : part des séquences de 8 mots déjà vues plus haut
+    shingles = [tuple(words[i:i + 8]) for i in range(max(0, nb_words - 7))]
+    duplication = 1 - len(set(shingles)) / len(shingles) if shingles else 0.0
+    scores["duplication"] = max(0.0, 1 - duplication / 0.1)
+    if duplication > 0.02:
+        issues.append(f"{duplication * 100:.0f} % de passages répétés dans l'article.")
+
+    scores["length"] = min(1.0, nb_words / MIN_WORDS)
+    if nb_words < MIN_WORDS:
+        issues.append(f"Article court ({nb_words} mots, recommandé : {MIN_WORDS}+).")
+
+    # article vide : pas de points « gratuits » (aucune duplication, aucun niveau sauté...)
+    total = sum(_WEIGHTS[k] * min(1.0, v) for k, v in scores.items()) if nb_words else 0
+    return {
+        "score": round(total),
+        "criteria": {k: round(min(1.0, v) * _WEIGHTS[k], 1) for k, v in scores.items()},
+        "keyword_density": round(density, 2),
+        "readability": round(readability, 1),
+        "words": nb_words,
+        "headings": levels,
+        "duplication": round(duplication, 3),
+        "issues": issues,
+    }
+
+
+def empreinte(html: str, keyword: str, seo_title: str, meta_description: str) -> str:
+    payload = json.dumps([SEO_SCORE_VERSION, html or "", keyword or "", seo_title or "", meta_description or ""],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def analyser(html: str, keyword: str = None, seo_title: str = None, meta_description: str = None) -> dict:
+    """
+    Score SEO (0-100), détail par critère et liste des problèmes, mis en cache par empreinte.
+    """
+    _init()
+    conn = get_connection()
+    key = empreinte(html, keyword, seo_title, meta_description)
+    row = conn.execute("SELECT result FROM seo_scores WHERE content_hash = ?", (key,)).fetchone()
+    metrics.cache("seo_score", row is not None)
+    if row:
+        return json.loads(row["result"])
+    result = _analyser(html, keyword, seo_title, meta_description)
+    conn.execute(
+        "INSERT OR REPLACE INTO seo_scores (content_hash, result, created_at) VALUES (?, ?, ?)",
+        (key, json.dumps(result, ensure_ascii=False), time.time()),
+    )
+    return result
+
+
+def analyser_article(fields: dict) -> dict:
+    return analyser(fields.get("html_content", ""), fields.get("keyword"),
+                    fields.get("seo_title"), fields.get("meta_description"))
+
+
+def doit_regenerer(result: dict) -> bool:
+    return SEO_AUTO_REGENERATE and result["score"] < SEO_MIN_SCORE
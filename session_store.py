@@ -0,0 +1,167 @@
+# session_store.py
+import os
+import secrets
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+from local_db import ensure_schema, get_connection
+
+SESSION_LIFETIME_SECONDS = int(os.getenv("SESSION_LIFETIME_SECONDS", str(31 * 86400)))
+# On ne repousse l'expiration en base qu'au plus une fois par intervalle (pas d'écriture par requête)
+SESSION_TOUCH_INTERVAL_SECONDS = 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    user_id TEXT,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at);
+"""
+
+_serializer = TaggedJSONSerializer()
+
+
+def _init():
+    ensure_schema("sessions", _SCHEMA)
+
+
+def _user_id(data: dict):
+    user = data.get("user") or {}
+    return user.get("id") if isinstance(user, dict) else None
+
+
+class ServerSideSession(SecureCookieSession):
+    """
+    Session dont seules les données changées sont réécrites en base.
+    `serialized` garde l'état lu au début de la requête : les mutations de dicts imbriqués
+    (session["user"]["credits"] = ...) sont détectées à la comparaison, sans drapeau manuel.
+    """
+
+    def __init__(self, initial=None, sid=None, serialized=None, updated_at=0):
+        super().__init__(initial)
+        self.sid = sid
+        self.serialized = serialized
+        self.updated_at = updated_at
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """
+    Sessions stockées côté serveur (base SQLite partagée par les workers). Le cookie ne
+    contient qu'un identifiant opaque, envoyé une seule fois à la création de la session.
+    """
+
+    def open_session(self, app, request):
+        _init()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = get_connection().execute(
+                "SELECT data, updated_at FROM sessions WHERE sid = ? AND expires_at > ?",
+                (sid, time.time()),
+            ).fetchone()
+            if row:
+                return ServerSideSession(
+                    _serializer.loads(row["data"]), sid=sid, serialized=row["data"], updated_at=row["updated_at"]
+                )
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        conn = get_connection()
+        now = time.time()
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.sid:
+                conn.execute("DELETE FROM sessions WHERE sid = ?", (session.sid,))
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        data = dict(session)
+        serialized = _serializer.dumps(data)
+        expires_at = now + SESSION_LIFETIME_SECONDS
+
+        if session.sid is None:
+            sid = secrets.token_urlsafe(32)
+            conn.execute(
+                "INSERT INTO sessions (sid, user_id, data, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (sid, _user_id(data), serialized, expires_at, now),
+            )
+            response.set_cookie(
+                name, sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite,
+            )
+            response.vary.add("Cookie")
+        elif serialized != session.serialized:
+            conn.execute(
+                "UPDATE sessions SET user_id = ?, data = ?, expires_at = ?, updated_at = ? WHERE sid = ?",
+                (_user_id(data), serialized, expires_at, now, session.sid),
+            )
+        elif now - (session.updated_at or 0) > SESSION_TOUCH_INTERVAL_SECONDS:
+            conn.execute(
+                "UPDATE sessions SET expires_at = ?, updated_at = ? WHERE sid = ?",
+                (expires_at, now, session.sid),
+            )
+
+
+def regenerer(session, fermer_autres: bool = False) -> None:
+    """
+    Change l'identifiant de la session courante (connexion, confirmation d'inscription,
+    changement de mot de passe) : un identifiant connu avant l'authentification
+    (fixation de session) ne donne plus accès au compte. Les données sont conservées ;
+    le nouveau cookie est envoyé par save_session.
+    `fermer_autres=True` (changement de mot de passe) : supprime aussi toutes les autres
+    sessions de l'utilisateur.
+    """
+    if not isinstance(session, ServerSideSession):
+        return
+    _init()
+    conn = get_connection()
+    if fermer_autres and _user_id(session):
+        # la session courante sera recréée par save_session avec un nouvel identifiant
+        conn.execute("DELETE FROM sessions WHERE user_id = ?", (_user_id(session),))
+    if session.sid is not None:
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (session.sid,))
+    session.sid = None
+    session.serialized = None
+
+
+def maj_sessions_utilisateur(user_id: str, updates: dict) -> int:
+    """
+    Applique `updates` au dict session["user"] de toutes les sessions actives d'un
+    utilisateur (ex : crédits ajoutés par un webhook Stripe). Retourne le nombre de sessions.
+    """
+    if not user_id or not updates:
+        return 0
+    _init()
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT sid, data FROM sessions WHERE user_id = ? AND expires_at > ?", (user_id, time.time())
+    ).fetchall()
+    for row in rows:
+        data = _serializer.loads(row["data"])
+        data.setdefault("user", {}).update(updates)
+        conn.execute(
+            "UPDATE sessions SET data = ?, updated_at = ? WHERE sid = ?",
+            (_serializer.dumps(data), time.time(), row["sid"]),
+        )
+    return len(rows)
+
+
+def purger():
+    _init()
+    get_connection().execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
@@ -0,0 +1,128 @@
+// static/js/article_tools.js
+// Copie / aperçu de la transcription et de l'article (transcription.html, article_view.html)
+function copierTranscription() {
+    const textarea = document.getElementById('transcript-text');
+    if (!textarea) return;
+
+    textarea.select();
+    textarea.setSelectionRange(0, 99999); // pour mobile
+
+    try {
+        document.execCommand('copy');
+        alert('Transcription copiée dans le presse-papier ✔️');
+    } catch (e) {
+        alert('Impossible de copier automatiquement. Sélectionnez le texte manuellement.');
+    }
+}
+
+// Bloc « chapitres » au format de la description YouTube
+function copierChapitres() {
+    const textarea = document.getElementById('chapters-description');
+    if (!textarea) return;
+
+    const temp = document.createElement("textarea");
+    temp.value = textarea.value;
+    document.body.appendChild(temp);
+    temp.select();
+
+    try {
+        document.execCommand('copy');
+        alert('Chapitres copiés dans le presse-papier ✔️');
+    } catch (e) {
+        alert('Impossible de copier automatiquement. Sélectionnez le texte manuellement.');
+    }
+
+    document.body.removeChild(temp);
+}
+
+// Copie le HTML d'un élément via un textarea temporaire
+function copierHTMLDepuis(elementId) {
+    const articleEl = document.getElementById(elementId);
+    if (!articleEl) {
+        alert("Erreur : article introuvable.");
+        return;
+    }
+
+    const temp = document.createElement("textarea");
+    temp.value = articleEl.innerHTML.trim();
+    document.body.appendChild(temp);
+
+    temp.select();
+    temp.setSelectionRange(0, 999999); // Compatibilité mobile
+
+    try {
+        document.execCommand("copy");
+        alert("Article copié dans le presse-papier ✔️");
+    } catch (err) {
+        alert("Impossible de copier automatiquement. Copiez manuellement.");
+    }
+
+    document.body.removeChild(temp);
+}
+
+function copierArticleHTML() {
+    copierHTMLDepuis("article-html");
+}
+
+function copierArticleHTMLDepuisView() {
+    copierHTMLDepuis("article-html-view");
+}
+
+function ouvrirArticleNouvelOnglet() {
+    const articleEl = document.getElementById("article-html");
+    if (!articleEl) {
+        alert("Erreur : article introuvable.");
+        return;
+    }
+
+    const htmlContent = articleEl.innerHTML;
+
+    const win = window.open("", "_blank");
+    if (!win) {
+        alert("Le navigateur a bloqué l’ouverture du nouvel onglet.");
+        return;
+    }
+
+    win.document.write(`<!doctype html>
+<html lang="fr">
+<head>
+  <meta charset="utf-8">
+  <title>Aperçu de l’article</title>
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <style>
+    body {
+      font-family: system-ui, -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
+      max-width: 800px;
+      margin: 30px auto;
+      padding: 0 16px 40px;
+      line-height: 1.7;
+    }
+    h1, h2, h3 {
+      margin-top: 1.4em;
+      margin-bottom: 0.4em;
+    }
+    p {
+      margin: 0.4em 0 0.8em;
+    }
+    ul, ol {
+      padding-left: 1.4rem;
+      margin: 0.4em 0 0.8em;
+    }
+    li {
+      margin-bottom: 0.2em;
+    }
+    blockquote {
+      margin: 0.8em 0;
+      padding-left: 1em;
+      border-left: 3px solid #e5e7eb;
+      font-style: italic;
+      color: #6b7280;
+    }
+  </style>
+</head>
+<body>
+${htmlContent}
+</body>
+</html>`);
+    win.document.close();
+}
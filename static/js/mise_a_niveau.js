@@ -0,0 +1,24 @@
+// static/js/mise_a_niveau.js
+document.querySelectorAll('.stripe-buy').forEach(btn => {
+  btn.addEventListener('click', async function(e) {
+    const plan = btn.dataset.plan;
+    btn.disabled = true;
+    btn.textContent = "Redirection...";
+
+    try {
+      const res = await fetch(`/create-checkout-session/${plan}`, { method: 'POST' });
+      const data = await res.json();
+      if (data.url) {
+        window.location.href = data.url;
+      } else {
+        alert("Erreur Stripe: " + (data.error || "Erreur inconnue"));
+        btn.disabled = false;
+        btn.textContent = "Acheter";
+      }
+    } catch (err) {
+      alert("Erreur réseau, réessaie.");
+      btn.disabled = false;
+      btn.textContent = "Acheter";
+    }
+  });
+});
@@ -0,0 +1,43 @@
+// static/js/mon_compte.js
+document.addEventListener("DOMContentLoaded", function () {
+    var openBtn = document.getElementById("open-unsubscribe-modal");
+    var modal = document.getElementById("unsubscribe-modal");
+    var closeBtn = document.getElementById("close-unsubscribe-modal");
+    var successModal = document.getElementById("unsubscribe-success-modal");
+    var closeSuccessBtn = document.getElementById("close-success-modal");
+
+    if (openBtn && modal) {
+        openBtn.addEventListener("click", function (e) {
+            e.preventDefault();
+            modal.style.display = "flex";
+        });
+    }
+
+    if (closeBtn && modal) {
+        closeBtn.addEventListener("click", function () {
+            modal.style.display = "none";
+        });
+    }
+
+    // Afficher la popup de succès si présente
+    if (successModal) {
+        successModal.style.display = "flex";  // <-- ajouter cette ligne
+    }
+
+    // Fermer le succès
+    if (closeSuccessBtn && successModal) {
+        closeSuccessBtn.addEventListener("click", function () {
+            successModal.style.display = "none";
+        });
+    }
+
+    // Fermer la popup en cliquant sur l'overlay
+    [modal, successModal].forEach(function (m) {
+        if (!m) return;
+        m.addEventListener("click", function (e) {
+            if (e.target === m) {
+                m.style.display = "none";
+            }
+        });
+    });
+});
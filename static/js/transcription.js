@@ -0,0 +1,114 @@
+// static/js/transcription.js
+document.addEventListener("DOMContentLoaded", function () {
+    const formTranscription = document.getElementById("form-transcription");
+    const formBlogify = document.getElementById("form-blogify");
+    const skeletonTranscription = document.getElementById("transcription-skeleton");
+    const skeletonArticle = document.getElementById("article-skeleton");
+    const articleProgress = document.getElementById("article-progress");
+
+    if (formTranscription) {
+        formTranscription.addEventListener("submit", function () {
+            // Affiche le skeleton de transcription
+            if (skeletonTranscription) {
+                skeletonTranscription.classList.remove("hidden");
+            }
+            // Bouton en état loading
+            const btn = formTranscription.querySelector("button[type='submit']");
+            if (btn) {
+                btn.classList.add("btn-loading");
+                btn.setAttribute("disabled", "disabled");
+            }
+        });
+    }
+
+    // Préchargement : la transcription est demandée dès qu'une URL YouTube valide est
+    // collée, pour que l'envoi du formulaire trouve un résultat déjà prêt.
+    const urlInput = document.getElementById("url");
+    const prefetchUrl = formTranscription ? formTranscription.dataset.prefetchUrl : null;
+    const youtubeUrl = /^https?:\/\/((www|m)\.)?(youtube\.com\/(watch\?.*v=|embed\/|shorts\/)|youtu\.be\/)[\w-]{11}/;
+    let prefetchTimer = null;
+    let lastPrefetched = null;
+
+    function precharger() {
+        const url = urlInput.value.trim();
+        if (!youtubeUrl.test(url) || url === lastPrefetched) {
+            return;
+        }
+        lastPrefetched = url;
+        const body = new FormData();
+        body.append("url", url);
+        // Purement opportuniste : une erreur n'a aucun effet sur le formulaire
+        fetch(prefetchUrl, { method: "POST", body: body, credentials: "same-origin" }).catch(function () {});
+    }
+
+    if (urlInput && prefetchUrl) {
+        urlInput.addEventListener("input", function () {
+            clearTimeout(prefetchTimer);
+            prefetchTimer = setTimeout(precharger, 400);
+        });
+    }
+
+    if (formBlogify) {
+        formBlogify.addEventListener("submit", function () {
+            // Transcription modifiée à la main : on envoie le texte, sinon le handle suffit
+            const transcriptText = document.getElementById("transcript-text");
+            if (transcriptText && transcriptText.value !== transcriptText.defaultValue) {
+                let sourceText = formBlogify.querySelector("[name='source_text']");
+                if (!sourceText) {
+                    sourceText = document.createElement("textarea");
+                    sourceText.name = "source_text";
+                    sourceText.hidden = true;
+                    formBlogify.appendChild(sourceText);
+                }
+                sourceText.value = transcriptText.value;
+            }
+            // Affiche la card skeleton pour l'article
+            if (skeletonArticle) {
+                skeletonArticle.classList.remove("hidden");
+            }
+            if (articleProgress) {
+                articleProgress.classList.remove("hidden");
+            }
+            const btn = formBlogify.querySelector("button[type='submit']");
+            if (btn) {
+                btn.classList.add("btn-loading");
+                btn.setAttribute("disabled", "disabled");
+            }
+        });
+    }
+});
+
+document.addEventListener("DOMContentLoaded", function () {
+    
+    // 🌟 Bouton retour en haut
+    const btnTop = document.getElementById("btn-back-to-top");
+
+    if (btnTop) {
+        // Apparition du bouton si on scroll un peu
+        window.addEventListener("scroll", function () {
+            if (window.scrollY > 300) {
+                btnTop.classList.add("show");
+                btnTop.classList.remove("hidden");
+            } else {
+                btnTop.classList.remove("show");
+            }
+        });
+
+        // Scroll vers le haut au clic
+        btnTop.addEventListener("click", function () {
+            window.scrollTo({
+                top: 0,
+                behavior: "smooth"
+            });
+        });
+    }
+});
+
+const formGenerate = document.getElementById('form-blogify');
+if (formGenerate) {
+  formGenerate.addEventListener('submit', function(e){
+    const btn = document.getElementById('btn-generate');
+    btn.disabled = true;
+    btn.textContent = "Génération en cours…";
+  });
+}
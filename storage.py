@@ -0,0 +1,547 @@
+# storage.py
+import json
+import os
+import re
+import secrets
+import string
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from pyairtable import Api
+from pyairtable.formulas import EQ, LOWER, Field
+
+import resilience
+from app_log import get_logger
+from local_db import acquire_lease, ensure_schema, get_connection, transaction
+from background_tasks import start_periodic
+
+logger = get_logger("storage")
+
+# airtable   : tout passe par l'API Airtable (comportement historique)
+# sqlite     : base locale uniquement (dev, tests, aucun accès réseau)
+# replicated : lectures/écritures locales, copie asynchrone vers Airtable pour le back-office
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "airtable").lower()
+
+AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
+AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
+AIRTABLE_ENDPOINT_URL = os.getenv("AIRTABLE_ENDPOINT_URL", "https://api.airtable.com")
+
+REPLICATION_INTERVAL_SECONDS = float(os.getenv("STORAGE_REPLICATION_INTERVAL", "2"))
+# Relecture des records modifiés dans Airtable (back-office) : intervalle, et recouvrement
+# de la fenêtre interrogée (décalage d'horloge avec Airtable)
+REFRESH_INTERVAL_SECONDS = float(os.getenv("STORAGE_REFRESH_INTERVAL", "60"))
+REFRESH_OVERLAP_SECONDS = 30
+AIRTABLE_CONNECT_TIMEOUT_SECONDS = 5
+
+# Champs recherchés par valeur exacte : indexés côté SQLite
+_INDEXED_FIELDS = {
+    "users": [("email", True), ("stripeCustomerId", False), ("stripeSubscriptionId", False)],
+    "stripe_events": [("event_id", False)],
+}
+
+_FIELD_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    table_name TEXT NOT NULL,
+    id TEXT NOT NULL,
+    created_time TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    remote_id TEXT,                  -- id Airtable (mode replicated), NULL tant que non poussé
+    PRIMARY KEY (table_name, id)
+);
+CREATE INDEX IF NOT EXISTS idx_records_remote_id ON records (remote_id);
+CREATE TABLE IF NOT EXISTS replication_outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    op TEXT NOT NULL,                -- create | update
+    fields TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS storage_imports (
+    table_name TEXT PRIMARY KEY,
+    imported_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS storage_pulls (
+    table_name TEXT PRIMARY KEY,
+    pulled_at REAL NOT NULL          -- début de la dernière relecture des modifications Airtable
+);
+"""
+
+_local = threading.local()
+_tables = {}
+_tables_mutex = threading.Lock()
+
+
+def _get_api() -> Api:
+    # une session HTTP par thread (workers gthread) et par process
+    api = getattr(_local, "api", None)
+    if api is None or getattr(_local, "pid", None) != os.getpid():
+        api = Api(AIRTABLE_API_KEY, endpoint_url=AIRTABLE_ENDPOINT_URL,
+                  timeout=(AIRTABLE_CONNECT_TIMEOUT_SECONDS, resilience.TIMEOUTS["airtable"]))
+        # pyairtable stocke Api.timeout sans le transmettre à requests : on l'ajoute à chaque requête
+        request = api.session.request
+        api.session.request = lambda *args, **kwargs: request(*args, timeout=api.timeout, **kwargs)
+        _local.api = api
+        _local.pid = os.getpid()
+    return api
+
+
+@contextmanager
+def _appel_airtable(operation: str):
+    # disjoncteur + timeout borné par le budget de la requête en cours
+    with resilience.appel("airtable", operation) as timeout:
+        _get_api().timeout = (min(AIRTABLE_CONNECT_TIMEOUT_SECONDS, timeout), timeout)
+        yield
+
+
+def _json_path(field: str) -> str:
+    if not _FIELD_NAME_RE.match(field):
+        raise ValueError(f"Nom de champ invalide : {field!r}")
+    return f"json_extract(fields, '$.{field}')"
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + "000Z"
+
+
+def _new_record_id() -> str:
+    alphabet = string.ascii_letters + string.digits
+    return "rec" + "".join(secrets.choice(alphabet) for _ in range(14))
+
+
+class AirtableTable:
+    """
+    Table distante Airtable (une instance par table et par process, réutilisée ;
+    la session HTTP sous-jacente est propre à chaque thread).
+    """
+
+    def __init__(self, table_name: str):
+        self.name = table_name
+
+    @property
+    def _table(self):
+        return _get_api().table(AIRTABLE_BASE_ID, self.name)
+
+    def get(self, record_id: str) -> dict:
+        with _appel_airtable("get"):
+            return self._table.get(record_id)
+
+    def first_where(self, field: str, value, lower: bool = False):
+        if lower:
+            formula = EQ(LOWER(Field(field)), str(value).lower())
+        else:
+            formula = EQ(Field(field), value)
+        with _appel_airtable("first"):
+            return self._table.first(formula=str(formula))
+
+    def all(self, **kwargs) -> list:
+        with _appel_airtable("all"):
+            return self._table.all(**kwargs)
+
+    def list_linked(self, field: str, record_id: str) -> list:
+        # ARRAYJOIN() sur un champ lié renvoie les valeurs primaires, pas les ids :
+        # on filtre donc côté Python.
+        with _appel_airtable("all"):
+            records = self._table.all()
+        return [r for r in records if record_id in (r.get("fields", {}).get(field) or [])]
+
+    def iter_linked(self, field: str, record_id: str, page_size: int = 100):
+        """
+        Comme list_linked, mais page par page : une seule page en mémoire à la fois.
+        """
+        pages = self._table.iterate(page_size=page_size)
+        while True:
+            with _appel_airtable("page"):
+                page = next(pages, None)
+            if page is None:
+                return
+            for r in page:
+                if record_id in (r.get("fields", {}).get(field) or []):
+                    yield r
+
+    def create(self, fields: dict) -> dict:
+        with _appel_airtable("create"):
+            return self._table.create(fields)
+
+    def update(self, record_id: str, fields: dict) -> dict:
+        with _appel_airtable("update"):
+            return self._table.update(record_id, fields)
+
+
+class SQLiteTable:
+    """
+    Table locale stockée dans la base SQLite partagée (mêmes formes de records qu'Airtable :
+    {"id", "createdTime", "fields"}).
+    """
+
+    def __init__(self, table_name: str):
+        self.name = table_name
+        ensure_schema("storage", _SCHEMA)
+        ddl = []
+        for field, lower in _INDEXED_FIELDS.get(table_name, []):
+            expr = f"lower({_json_path(field)})" if lower else _json_path(field)
+            ddl.append(
+                f"CREATE INDEX IF NOT EXISTS idx_records_{table_name}_{field} "
+                f"ON records (table_name, {expr});"
+            )
+        if ddl:
+            ensure_schema(f"storage_idx_{table_name}", "\n".join(ddl))
+
+    @staticmethod
+    def _to_record(row) -> dict:
+        return {"id": row["id"], "createdTime": row["created_time"], "fields": json.loads(row["fields"])}
+
+    def _select_one(self, record_id: str):
+        return get_connection().execute(
+            "SELECT id, created_time, fields FROM records WHERE table_name = ? AND id = ?",
+            (self.name, record_id),
+        ).fetchone()
+
+    def get(self, record_id: str) -> dict:
+        row = self._select_one(record_id)
+        if not row:
+            raise KeyError(f"Record introuvable : {self.name}/{record_id}")
+        return self._to_record(row)
+
+    def first_where(self, field: str, value, lower: bool = False):
+        if lower:
+            sql = f"lower({_json_path(field)}) = ?"
+            value = str(value).lower()
+        else:
+            sql = f"{_json_path(field)} = ?"
+        row = get_connection().execute(
+            f"SELECT id, created_time, fields FROM records WHERE table_name = ? AND {sql} LIMIT 1",
+            (self.name, value),
+        ).fetchone()
+        return self._to_record(row) if row else None
+
+    def all(self, max_records: int = None, **kwargs) -> list:
+        sql = "SELECT id, created_time, fields FROM records WHERE table_name = ? ORDER BY created_time"
+        params = [self.name]
+        if max_records:
+            sql += " LIMIT ?"
+            params.append(max_records)
+        return [self._to_record(r) for r in get_connection().execute(sql, params)]
+
+    def list_linked(self, field: str, record_id: str) -> list:
+        _json_path(field)  # validation du nom de champ
+        rows = get_connection().execute(
+            "SELECT id, created_time, fields FROM records WHERE table_name = ? AND EXISTS "
+            f"(SELECT 1 FROM json_each(records.fields, '$.{field}') "
+            "WHERE json_each.value = ?) ORDER BY created_time",
+            (self.name, record_id),
+        )
+        return [self._to_record(r) for r in rows]
+
+    def iter_linked(self, field: str, record_id: str, page_size: int = 100):
+        """
+        Comme list_linked, par pages (pagination par clé : created_time, id).
+        """
+        _json_path(field)
+        last = ("", "")
+        while True:
+            rows = get_connection().execute(
+                "SELECT id, created_time, fields FROM records WHERE table_name = ? AND EXISTS "
+                f"(SELECT 1 FROM json_each(records.fields, '$.{field}') WHERE json_each.value = ?) "
+                "AND (created_time, id) > (?, ?) ORDER BY created_time, id LIMIT ?",
+                (self.name, record_id, last[0], last[1], page_size),
+            ).fetchall()
+            for r in rows:
+                yield self._to_record(r)
+            if len(rows) < page_size:
+                return
+            last = (rows[-1]["created_time"], rows[-1]["id"])
+
+    def _insert(self, conn, record_id: str, created_time: str, fields: dict, remote_id=None):
+        conn.execute(
+            "INSERT INTO records (table_name, id, created_time, fields, remote_id) VALUES (?, ?, ?, ?, ?)",
+            (self.name, record_id, created_time, json.dumps(fields, ensure_ascii=False), remote_id),
+        )
+
+    def create(self, fields: dict) -> dict:
+        record = {"id": _new_record_id(), "createdTime": _now_iso(), "fields": dict(fields)}
+        with transaction() as conn:
+            self._insert(conn, record["id"], record["createdTime"], record["fields"])
+            self._after_write(conn, "create", record["id"], record["fields"])
+        return record
+
+    def update(self, record_id: str, fields: dict) -> dict:
+        # même sémantique que PATCH Airtable : fusion des champs
+        with transaction() as conn:
+            row = conn.execute(
+                "SELECT id, created_time, fields FROM records WHERE table_name = ? AND id = ?",
+                (self.name, record_id),
+            ).fetchone()
+            if not row:
+                raise KeyError(f"Record introuvable : {self.name}/{record_id}")
+            merged = json.loads(row["fields"])
+            merged.update(fields)
+            conn.execute(
+                "UPDATE records SET fields = ? WHERE table_name = ? AND id = ?",
+                (json.dumps(merged, ensure_ascii=False), self.name, record_id),
+            )
+            self._after_write(conn, "update", record_id, fields)
+        return {"id": record_id, "createdTime": row["created_time"], "fields": merged}
+
+    def _after_write(self, conn, op: str, record_id: str, fields: dict):
+        pass
+
+
+class ReplicatedTable(SQLiteTable):
+    """
+    Table locale (lectures/écritures en < 1 ms) recopiée vers Airtable en tâche de fond.
+    Les records absents localement sont lus une fois dans Airtable puis conservés.
+
+    Cohérence : la copie locale fait foi pour l'application. Les écritures locales
+    arrivent dans Airtable en quelques secondes (file replication_outbox) ; les
+    modifications faites dans Airtable sont relues toutes les STORAGE_REFRESH_INTERVAL
+    secondes (records modifiés depuis la relecture précédente). En cas de conflit, une
+    écriture locale pas encore poussée l'emporte. Les suppressions faites dans Airtable
+    ne sont pas propagées.
+    """
+
+    def __init__(self, table_name: str):
+        super().__init__(table_name)
+        self._remote = None
+        demarrer_replication()
+
+    @property
+    def remote(self) -> AirtableTable:
+        if self._remote is None:
+            self._remote = AirtableTable(self.name)
+        return self._remote
+
+    def _cache_remote(self, record: dict) -> dict:
+        with transaction() as conn:
+            if not conn.execute(
+                "SELECT 1 FROM records WHERE table_name = ? AND id = ?", (self.name, record["id"])
+            ).fetchone():
+                self._insert(conn, record["id"], record.get("createdTime") or _now_iso(),
+                             record.get("fields", {}), remote_id=record["id"])
+        return record
+
+    def _assurer_import(self):
+        """
+        Import complet (une seule fois) de la table Airtable, nécessaire pour les listes.
+        """
+        conn = get_connection()
+        if conn.execute("SELECT 1 FROM storage_imports WHERE table_name = ?", (self.name,)).fetchone():
+            return
+        records = self.remote.all()
+        with transaction() as conn:
+            for r in records:
+                conn.execute(
+                    "INSERT OR IGNORE INTO records (table_name, id, created_time, fields, remote_id) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self.name, r["id"], r.get("createdTime") or _now_iso(),
+                     json.dumps(r.get("fields", {}), ensure_ascii=False), r["id"]),
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO storage_imports (table_name, imported_at) VALUES (?, ?)",
+                (self.name, time.time()),
+            )
+        logger.info("import initial depuis Airtable", table=self.name, records=len(records))
+
+    def get(self, record_id: str) -> dict:
+        try:
+            return super().get(record_id)
+        except KeyError:
+            return self._cache_remote(self.remote.get(record_id))
+
+    def first_where(self, field: str, value, lower: bool = False):
+        rec = super().first_where(field, value, lower=lower)
+        if rec:
+            return rec
+        rec = self.remote.first_where(field, value, lower=lower)
+        return self._cache_remote(rec) if rec else None
+
+    def all(self, **kwargs) -> list:
+        self._assurer_import()
+        return super().all(**kwargs)
+
+    def list_linked(self, field: str, record_id: str) -> list:
+        self._assurer_import()
+        return super().list_linked(field, record_id)
+
+    def iter_linked(self, field: str, record_id: str, page_size: int = 100):
+        self._assurer_import()
+        return super().iter_linked(field, record_id, page_size)
+
+    def update(self, record_id: str, fields: dict) -> dict:
+        if not self._select_one(record_id):
+            self.get(record_id)  # lecture Airtable + copie locale avant modification
+        return super().update(record_id, fields)
+
+    def _after_write(self, conn, op: str, record_id: str, fields: dict):
+        conn.execute(
+            "INSERT INTO replication_outbox (table_name, record_id, op, fields, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (self.name, record_id, op, json.dumps(fields, ensure_ascii=False), time.time()),
+        )
+        demarrer_replication()
+
+
+def _remote_id(record_id: str):
+    row = get_connection().execute(
+        "SELECT remote_id FROM records WHERE id = ? AND remote_id IS NOT NULL LIMIT 1", (record_id,)
+    ).fetchone()
+    return row["remote_id"] if row else None
+
+
+def _id_local(remote_id: str):
+    row = get_connection().execute("SELECT id FROM records WHERE remote_id = ? LIMIT 1", (remote_id,)).fetchone()
+    return row["id"] if row else None
+
+
+def _traduire_ids(fields: dict, vers_local: bool = False) -> dict:
+    """
+    Remplace, dans les champs liés (listes d'ids), les ids locaux par les ids Airtable
+    (ou l'inverse avec vers_local=True).
+    """
+    traduire = _id_local if vers_local else _remote_id
+    out = {}
+    for key, value in fields.items():
+        if isinstance(value, list) and all(isinstance(v, str) and v.startswith("rec") for v in value):
+            out[key] = [traduire(v) or v for v in value]
+        else:
+            out[key] = value
+    return out
+
+
+def taille_outbox() -> int:
+    ensure_schema("storage", _SCHEMA)
+    return get_connection().execute("SELECT COUNT(*) FROM replication_outbox").fetchone()[0]
+
+
+def repliquer_vers_airtable(batch_size: int = 50):
+    """
+    Pousse la file d'écritures locales vers Airtable, dans l'ordre. On s'arrête à la
+    première erreur pour ne jamais appliquer un update avant le create correspondant.
+    """
+    ensure_schema("storage", _SCHEMA)
+    if not acquire_lease("storage-replication", ttl_seconds=max(30, REPLICATION_INTERVAL_SECONDS * 5)):
+        return
+
+    rows = get_connection().execute(
+        "SELECT seq, table_name, record_id, op, fields FROM replication_outbox ORDER BY seq LIMIT ?",
+        (batch_size,),
+    ).fetchall()
+
+    for row in rows:
+        try:
+            remote = get_table(row["table_name"]).remote
+            fields = _traduire_ids(json.loads(row["fields"]))
+            if row["op"] == "create":
+                created = remote.create(fields)
+                get_connection().execute(
+                    "UPDATE records SET remote_id = ? WHERE table_name = ? AND id = ?",
+                    (created["id"], row["table_name"], row["record_id"]),
+                )
+            else:
+                remote_id = _remote_id(row["record_id"])
+                if not remote_id:
+                    raise RuntimeError(f"record {row['record_id']} pas encore créé dans Airtable")
+                remote.update(remote_id, fields)
+            get_connection().execute("DELETE FROM replication_outbox WHERE seq = ?", (row["seq"],))
+        except Exception as e:
+            get_connection().execute(
+                "UPDATE replication_outbox SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                (str(e)[:500], row["seq"]),
+            )
+            logger.warning("réplication Airtable en échec", table=row["table_name"], record_id=row["record_id"], error=e)
+            break
+
+    # même thread et même bail que l'envoi : un record tout juste créé dans Airtable a
+    # déjà son remote_id quand on relit les modifications
+    conn = get_connection()
+    for r in conn.execute("SELECT DISTINCT table_name FROM records WHERE remote_id IS NOT NULL").fetchall():
+        pull = conn.execute("SELECT pulled_at FROM storage_pulls WHERE table_name = ?", (r["table_name"],)).fetchone()
+        if pull and time.time() - pull["pulled_at"] < REFRESH_INTERVAL_SECONDS:
+            continue
+        try:
+            _relire_modifications(r["table_name"], pull["pulled_at"] if pull else None)
+        except Exception as e:
+            logger.warning("relecture Airtable en échec", table=r["table_name"], error=e)
+
+
+def _relire_modifications(table_name: str, since: float = None):
+    """
+    Applique à la copie locale les records modifiés dans Airtable depuis `since`
+    (tous les records à la première relecture).
+    """
+    started_at = time.time()
+    kwargs = {}
+    if since is not None:
+        iso = datetime.fromtimestamp(since - REFRESH_OVERLAP_SECONDS, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        kwargs["formula"] = f"IS_AFTER(LAST_MODIFIED_TIME(), DATETIME_PARSE('{iso}'))"
+    records = get_table(table_name).remote.all(**kwargs)
+    updated = 0
+    with transaction() as conn:
+        imported = conn.execute("SELECT 1 FROM storage_imports WHERE table_name = ?", (table_name,)).fetchone()
+        for record in records:
+            fields = _traduire_ids(record.get("fields", {}), vers_local=True)
+            row = conn.execute(
+                "SELECT id FROM records WHERE table_name = ? AND remote_id = ?", (table_name, record["id"])
+            ).fetchone()
+            if row is None:
+                # table importée : on complète ; sinon le record sera lu à la demande
+                if imported:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO records (table_name, id, created_time, fields, remote_id) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (table_name, record["id"], record.get("createdTime") or _now_iso(),
+                         json.dumps(fields, ensure_ascii=False), record["id"]),
+                    )
+                continue
+            # écritures locales pas encore poussées : elles l'emportent
+            for pending in conn.execute(
+                "SELECT fields FROM replication_outbox WHERE table_name = ? AND record_id = ? ORDER BY seq",
+                (table_name, row["id"]),
+            ):
+                fields.update(json.loads(pending["fields"]))
+            conn.execute(
+                "UPDATE records SET fields = ? WHERE table_name = ? AND id = ?",
+                (json.dumps(fields, ensure_ascii=False), table_name, row["id"]),
+            )
+            updated += 1
+        conn.execute(
+            "INSERT OR REPLACE INTO storage_pulls (table_name, pulled_at) VALUES (?, ?)", (table_name, started_at)
+        )
+    if records:
+        logger.info("modifications Airtable relues", table=table_name, records=len(records), updated=updated)
+
+
+def demarrer_replication():
+    start_periodic("storage-replication", REPLICATION_INTERVAL_SECONDS, repliquer_vers_airtable)
+
+
+_BACKENDS = {
+    "airtable": AirtableTable,
+    "sqlite": SQLiteTable,
+    "replicated": ReplicatedTable,
+}
+
+
+def get_table(table_name: str):
+    """
+    Retourne la table `table_name` pour le backend configuré (STORAGE_BACKEND).
+    Les instances sont réutilisées : plus de Table pyairtable créée à chaque appel.
+    """
+    key = (os.getpid(), table_name)
+    table = _tables.get(key)
+    if table is None:
+        with _tables_mutex:
+            table = _tables.get(key)
+            if table is None:
+                backend = _BACKENDS.get(STORAGE_BACKEND)
+                if backend is None:
+                    raise ValueError(f"❌ STORAGE_BACKEND inconnu : {STORAGE_BACKEND}")
+                table = backend(table_name)
+                _tables[key] = table
+    return table
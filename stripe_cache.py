@@ -0,0 +1,103 @@
+# stripe_cache.py
+import json
+import os
+import time
+
+import stripe
+
+import metrics
+import resilience
+from local_db import ensure_schema, get_connection
+
+# Les abonnements sont invalidés par les events customer.subscription.* : le TTL n'est qu'un filet
+STRIPE_CACHE_TTL_SECONDS = int(os.getenv("STRIPE_CACHE_TTL_SECONDS", "86400"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stripe_cache (
+    key TEXT PRIMARY KEY,             -- ex : subscription:sub_123
+    payload TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def _init():
+    ensure_schema("stripe_cache", _SCHEMA)
+
+
+def _to_plain(obj) -> dict:
+    # StripeObject -> dict JSON (les .get() du code appelant fonctionnent pareil)
+    if isinstance(obj, stripe.StripeObject):
+        return json.loads(str(obj))
+    return obj
+
+
+def _lire(key: str):
+    _init()
+    row = get_connection().execute(
+        "SELECT payload FROM stripe_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+    ).fetchone()
+    metrics.cache("stripe", row is not None)
+    return json.loads(row["payload"]) if row else None
+
+
+def _ecrire(key: str, obj: dict):
+    _init()
+    get_connection().execute(
+        "INSERT OR REPLACE INTO stripe_cache (key, payload, expires_at) VALUES (?, ?, ?)",
+        (key, json.dumps(obj), time.time() + STRIPE_CACHE_TTL_SECONDS),
+    )
+
+
+def invalider(key: str):
+    _init()
+    get_connection().execute("DELETE FROM stripe_cache WHERE key = ?", (key,))
+
+
+def invalider_abonnement(subscription_id: str):
+    invalider(f"subscription:{subscription_id}")
+
+
+def get_subscription(subscription_id: str, frais: bool = False) -> dict:
+    """
+    Subscription Stripe (items inclus) depuis le cache, sinon via l'API.
+    `frais=True` : toujours via l'API (le cache est mis à jour), pour les décisions de
+    facturation qui ne doivent pas dépendre de l'ordre d'arrivée des events.
+    """
+    key = f"subscription:{subscription_id}"
+    sub = None if frais else _lire(key)
+    if sub is None:
+        with resilience.appel("stripe", "subscription.retrieve"):
+            sub = _to_plain(stripe.Subscription.retrieve(subscription_id, expand=["items"]))
+        _ecrire(key, sub)
+    return sub
+
+
+def get_checkout_session(session_id: str) -> dict:
+    """
+    Session Checkout depuis le cache (alimenté par checkout.session.completed), sinon via l'API.
+    """
+    key = f"checkout_session:{session_id}"
+    checkout_session = _lire(key)
+    if checkout_session is None:
+        with resilience.appel("stripe", "checkout_session.retrieve"):
+            checkout_session = _to_plain(
+                stripe.checkout.Session.retrieve(session_id, expand=["subscription", "customer"])
+            )
+        _ecrire(key, checkout_session)
+    return checkout_session
+
+
+def rafraichir_depuis_event(event_type: str, obj: dict):
+    """
+    Met à jour le cache à partir d'un event Stripe. Les events n'arrivent pas forcément
+    dans l'ordre (et sont renvoyés pendant des jours) : un abonnement porté par un event
+    peut être plus ancien que celui du cache, on l'invalide donc au lieu de l'écrire.
+    Une session Checkout terminée ne change plus : elle est écrite telle quelle.
+    """
+    if not obj or not obj.get("id"):
+        return
+    if event_type.startswith("customer.subscription."):
+        invalider_abonnement(obj["id"])
+    elif event_type == "checkout.session.completed":
+        _ecrire(f"checkout_session:{obj['id']}", _to_plain(obj))
@@ -0,0 +1,163 @@
+# transcript_prefetch.py
+"""
+Préchargement spéculatif des transcriptions : dès qu'une URL valide est collée, la page
+demande la transcription en tâche de fond ; à l'envoi du formulaire, /transcription
+trouve le plus souvent un résultat déjà prêt (ou un téléchargement en cours à attendre).
+
+Les résultats sont partagés entre workers via la base SQLite locale, par vidéo, pendant
+PREFETCH_TTL_SECONDS. Les téléchargements passent par un pool de threads borné ; au-delà
+de PREFETCH_MAX_PENDING demandes en attente, les nouvelles sont ignorées (le formulaire
+fera alors le téléchargement normalement).
+"""
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import resilience
+from app_log import get_logger
+from local_db import ensure_schema, get_connection, transaction
+from youtube_utils import recuperer_segments
+
+logger = get_logger("transcript_prefetch")
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") != "0"
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", "16"))
+PREFETCH_TTL_SECONDS = int(os.getenv("PREFETCH_TTL_SECONDS", "600"))
+# Au-delà, un téléchargement « en cours » est considéré comme perdu (worker redémarré...)
+PREFETCH_STALE_SECONDS = 60
+# Attente maximale d'un préchargement en cours lors de l'envoi du formulaire
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "20"))
+PREFETCH_LANGUAGES = ["fr", "en"]
+
+_VIDEO_ID_RE = re.compile(r"[A-Za-z0-9_-]{11}")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcript_prefetch (
+    video_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,         -- 'pending' ou 'ready'
+    segments TEXT,                -- JSON (youtube_utils.recuperer_segments)
+    started_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transcript_prefetch_expires ON transcript_prefetch (expires_at);
+"""
+
+_executor = None
+_executor_pid = None
+_pending = {}                 # video_id -> Future (téléchargements lancés par ce process)
+_mutex = threading.Lock()
+
+
+def _init():
+    ensure_schema("transcript_prefetch", _SCHEMA)
+
+
+def _pool() -> ThreadPoolExecutor:
+    # un pool par process : les threads ne survivent pas au fork gunicorn
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        _executor_pid = os.getpid()
+        _pending.clear()
+    return _executor
+
+
+def _telecharger(video_id: str) -> list:
+    conn = get_connection()
+    try:
+        segments = recuperer_segments(video_id, langues=PREFETCH_LANGUAGES)
+        conn.execute(
+            "UPDATE transcript_prefetch SET status = 'ready', segments = ?, expires_at = ? WHERE video_id = ?",
+            (json.dumps(segments, ensure_ascii=False), time.time() + PREFETCH_TTL_SECONDS, video_id),
+        )
+        return segments
+    except Exception as e:
+        # l'erreur sera reproduite (et affichée) par le téléchargement normal du formulaire
+        conn.execute("DELETE FROM transcript_prefetch WHERE video_id = ? AND status = 'pending'", (video_id,))
+        logger.info("préchargement en échec", video_id=video_id, error=e)
+        raise
+    finally:
+        with _mutex:
+            _pending.pop(video_id, None)
+
+
+def precharger(video_id: str) -> str:
+    """
+    Lance le téléchargement de la transcription de `video_id` en tâche de fond.
+    Retourne "ready" (déjà en cache), "pending" (déjà en cours), "started", "busy"
+    (pool saturé), "unavailable" (disjoncteur YouTube ouvert) ou "disabled".
+    """
+    if not PREFETCH_ENABLED:
+        return "disabled"
+    if not _VIDEO_ID_RE.fullmatch(video_id or ""):
+        raise ValueError("Identifiant de vidéo YouTube invalide.")
+    if resilience.ouvert("youtube"):
+        return "unavailable"
+    _init()
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT status, started_at FROM transcript_prefetch WHERE video_id = ? AND expires_at > ?",
+            (video_id, now),
+        ).fetchone()
+        if row and (row["status"] == "ready" or row["started_at"] > now - PREFETCH_STALE_SECONDS):
+            return row["status"]
+        with _mutex:
+            pool = _pool()
+            if len(_pending) >= PREFETCH_MAX_PENDING:
+                metrics.inc("transcript_prefetch_total", {"result": "busy"})
+                return "busy"
+            conn.execute(
+                "INSERT OR REPLACE INTO transcript_prefetch (video_id, status, segments, started_at, expires_at) "
+                "VALUES (?, 'pending', NULL, ?, ?)",
+                (video_id, now, now + PREFETCH_TTL_SECONDS),
+            )
+            _pending[video_id] = pool.submit(_telecharger, video_id)
+    metrics.inc("transcript_prefetch_total", {"result": "started"})
+    return "started"
+
+
+def obtenir(video_id: str, wait: float = PREFETCH_WAIT_SECONDS):
+    """
+    Segments préchargés pour `video_id`, en attendant au plus `wait` secondes un
+    téléchargement en cours. None si rien n'a été préchargé (ou en cas d'échec).
+    """
+    if not PREFETCH_ENABLED:
+        return None
+    _init()
+    deadline = time.monotonic() + wait
+    with _mutex:
+        future = _pending.get(video_id) if _executor_pid == os.getpid() else None
+    if future is not None:
+        try:
+            segments = future.result(timeout=wait)
+        except Exception:
+            segments = None
+        metrics.cache("transcript_prefetch", segments is not None)
+        return segments
+
+    # téléchargement éventuellement lancé par un autre worker : on relit la base
+    conn = get_connection()
+    while True:
+        now = time.time()
+        row = conn.execute(
+            "SELECT status, segments, started_at FROM transcript_prefetch WHERE video_id = ? AND expires_at > ?",
+            (video_id, now),
+        ).fetchone()
+        if row and row["status"] == "ready":
+            metrics.cache("transcript_prefetch", True)
+            return json.loads(row["segments"])
+        if not row or row["started_at"] < now - PREFETCH_STALE_SECONDS or time.monotonic() >= deadline:
+            metrics.cache("transcript_prefetch", False)
+            return None
+        time.sleep(0.2)
+
+
+def purger():
+    _init()
+    get_connection().execute("DELETE FROM transcript_prefetch WHERE expires_at < ?", (time.time(),))
@@ -0,0 +1,91 @@
+# transcript_store.py
+import json
+import os
+import secrets
+import time
+
+from local_db import ensure_schema, get_connection
+
+# Durée de vie d'un handle : le temps de relire la transcription et de lancer la génération
+TRANSCRIPT_HANDLE_TTL_SECONDS = int(os.getenv("TRANSCRIPT_HANDLE_TTL_SECONDS", str(6 * 3600)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    handle TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    video_id TEXT,
+    text TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transcripts_expires ON transcripts (expires_at);
+CREATE TABLE IF NOT EXISTS transcript_chapters (
+    handle TEXT PRIMARY KEY,      -- même handle que transcripts, même durée de vie
+    chapters TEXT NOT NULL,       -- JSON (chapters.decouper)
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def _init():
+    ensure_schema("transcripts", _SCHEMA)
+
+
+def enregistrer(user_id: str, video_id: str, text: str, chapters: list = None) -> str:
+    """
+    Stocke une transcription (et ses chapitres éventuels) côté serveur et retourne un
+    handle court à mettre dans le formulaire /blogify (à la place du texte complet).
+    """
+    _init()
+    handle = secrets.token_urlsafe(12)
+    expires_at = time.time() + TRANSCRIPT_HANDLE_TTL_SECONDS
+    conn = get_connection()
+    conn.execute(
+        "INSERT INTO transcripts (handle, user_id, video_id, text, expires_at) VALUES (?, ?, ?, ?, ?)",
+        (handle, user_id, video_id, text, expires_at),
+    )
+    if chapters:
+        conn.execute(
+            "INSERT INTO transcript_chapters (handle, chapters, expires_at) VALUES (?, ?, ?)",
+            (handle, json.dumps(chapters, ensure_ascii=False), expires_at),
+        )
+    return handle
+
+
+def lire(handle: str, user_id: str):
+    """
+    Retourne (video_id, text) si le handle existe, n'a pas expiré et appartient à l'utilisateur,
+    sinon None.
+    """
+    if not handle or not user_id:
+        return None
+    _init()
+    row = get_connection().execute(
+        "SELECT video_id, text FROM transcripts WHERE handle = ? AND user_id = ? AND expires_at > ?",
+        (handle, user_id, time.time()),
+    ).fetchone()
+    if not row:
+        return None
+    return row["video_id"], row["text"]
+
+
+def lire_chapitres(handle: str, user_id: str) -> list:
+    """
+    Chapitres associés à un handle valide de l'utilisateur ([] s'il n'y en a pas).
+    """
+    if not handle or not user_id:
+        return []
+    _init()
+    row = get_connection().execute(
+        "SELECT c.chapters FROM transcript_chapters c JOIN transcripts t ON t.handle = c.handle "
+        "WHERE c.handle = ? AND t.user_id = ? AND t.expires_at > ?",
+        (handle, user_id, time.time()),
+    ).fetchone()
+    return json.loads(row["chapters"]) if row else []
+
+
+def purger():
+    _init()
+    now = time.time()
+    conn = get_connection()
+    conn.execute("DELETE FROM transcripts WHERE expires_at < ?", (now,))
+    conn.execute("DELETE FROM transcript_chapters WHERE expires_at < ?", (now,))
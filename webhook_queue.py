@@ -0,0 +1,216 @@
+# webhook_queue.py
+import json
+import os
+import threading
+import time
+
+from app_log import get_logger
+from local_db import ensure_schema, get_connection, transaction
+
+logger = get_logger("webhook_queue")
+
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", "1"))
+# Un event resté "processing" plus longtemps que ça (worker tué) est remis en file
+WEBHOOK_STALE_LOCK_SECONDS = int(os.getenv("WEBHOOK_STALE_LOCK_SECONDS", "600"))
+WEBHOOK_QUEUE_RETENTION_DAYS = int(os.getenv("WEBHOOK_QUEUE_RETENTION_DAYS", "7"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT NOT NULL UNIQUE,
+    event_type TEXT,
+    customer_key TEXT NOT NULL,       -- les events d'un même client sont traités dans l'ordre
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,             -- pending | processing | done | dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    locked_by TEXT,
+    locked_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_status ON webhook_events (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_customer ON webhook_events (customer_key, status, seq);
+"""
+
+_wakeup = threading.Event()
+_worker_pid = None
+_worker_mutex = threading.Lock()
+
+
+def _init():
+    ensure_schema("webhook_queue", _SCHEMA)
+
+
+def _customer_key(event: dict) -> str:
+    obj = (event.get("data") or {}).get("object") or {}
+    customer = obj.get("customer")
+    if isinstance(customer, dict):
+        customer = customer.get("id")
+    return customer or f"event:{event.get('id')}"
+
+
+def enqueue(event: dict, payload: str) -> bool:
+    """
+    Enregistre durablement un event Stripe déjà vérifié.
+    Retourne False si l'event était déjà en file (livraison en double).
+    """
+    _init()
+    now = time.time()
+    cur = get_connection().execute(
+        "INSERT OR IGNORE INTO webhook_events "
+        "(event_id, event_type, customer_key, payload, status, next_attempt_at, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)",
+        (event.get("id"), event.get("type"), _customer_key(event), payload, now, now, now),
+    )
+    _wakeup.set()
+    return cur.rowcount == 1
+
+
+def _claim_next():
+    """
+    Prend le prochain event traitable : le plus ancien event en attente dont aucun
+    event antérieur du même client n'est encore en attente ou en cours.
+    """
+    now = time.time()
+    owner = f"{os.getpid()}:{threading.get_ident()}"
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE webhook_events SET status = 'pending', locked_by = NULL "
+            "WHERE status = 'processing' AND locked_at < ?",
+            (now - WEBHOOK_STALE_LOCK_SECONDS,),
+        )
+        row = conn.execute(
+            "SELECT * FROM webhook_events e WHERE e.status = 'pending' AND e.next_attempt_at <= ? "
+            "AND NOT EXISTS (SELECT 1 FROM webhook_events p WHERE p.customer_key = e.customer_key "
+            "AND p.seq < e.seq AND p.status IN ('pending', 'processing')) "
+            "ORDER BY e.seq LIMIT 1",
+            (now,),
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute(
+            "UPDATE webhook_events SET status = 'processing', locked_by = ?, locked_at = ?, "
+            "attempts = attempts + 1, updated_at = ? WHERE seq = ?",
+            (owner, now, now, row["seq"]),
+        )
+        return row
+
+
+def _finish(seq: int, error: str = None, attempts: int = 0):
+    now = time.time()
+    conn = get_connection()
+    if error is None:
+        conn.execute(
+            "UPDATE webhook_events SET status = 'done', last_error = NULL, locked_by = NULL, updated_at = ? "
+            "WHERE seq = ?",
+            (now, seq),
+        )
+    elif attempts >= WEBHOOK_MAX_ATTEMPTS:
+        conn.execute(
+            "UPDATE webhook_events SET status = 'dead', last_error = ?, locked_by = NULL, updated_at = ? "
+            "WHERE seq = ?",
+            (error, now, seq),
+        )
+    else:
+        delay = min(5 * 2 ** (attempts - 1), 3600)
+        conn.execute(
+            "UPDATE webhook_events SET status = 'pending', last_error = ?, next_attempt_at = ?, "
+            "locked_by = NULL, updated_at = ? WHERE seq = ?",
+            (error, now + delay, now, seq),
+        )
+
+
+def traiter_file(handler, max_events: int = 100) -> int:
+    """
+    Traite les events disponibles avec `handler(event_dict)`. Une exception du handler
+    déclenche un nouvel essai (backoff exponentiel) puis la dead-letter.
+    Retourne le nombre d'events traités.
+    """
+    _init()
+    count = 0
+    while count < max_events:
+        row = _claim_next()
+        if row is None:
+            break
+        count += 1
+        try:
+            handler(json.loads(row["payload"]))
+            _finish(row["seq"])
+        except Exception as e:
+            logger.exception("échec traitement webhook", event_id=row["event_id"], attempt=row["attempts"] + 1)
+            _finish(row["seq"], error=f"{type(e).__name__}: {e}"[:1000], attempts=row["attempts"] + 1)
+    return count
+
+
+def purger():
+    _init()
+    get_connection().execute(
+        "DELETE FROM webhook_events WHERE status = 'done' AND updated_at < ?",
+        (time.time() - WEBHOOK_QUEUE_RETENTION_DAYS * 86400,),
+    )
+
+
+def demarrer_worker(handler):
+    """
+    Lance (une fois par process) le thread qui consomme la file. Réveillé immédiatement
+    par enqueue(), sinon il repasse toutes les WEBHOOK_POLL_SECONDS (retries, autres workers).
+    """
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _worker_mutex:
+        if _worker_pid == os.getpid():
+            return
+        _worker_pid = os.getpid()
+
+    def _loop():
+        last_purge = 0
+        while True:
+            _wakeup.wait(WEBHOOK_POLL_SECONDS)
+            _wakeup.clear()
+            try:
+                while traiter_file(handler):
+                    pass
+                if time.time() - last_purge > 3600:
+                    purger()
+                    last_purge = time.time()
+            except Exception:
+                logger.exception("erreur worker webhooks")
+
+    threading.Thread(target=_loop, name="webhook-worker", daemon=True).start()
+
+
+def stats() -> dict:
+    _init()
+    rows = get_connection().execute(
+        "SELECT status, COUNT(*) AS n FROM webhook_events GROUP BY status"
+    ).fetchall()
+    return {r["status"]: r["n"] for r in rows}
+
+
+def lister(status: str = "dead", limit: int = 100) -> list:
+    _init()
+    rows = get_connection().execute(
+        "SELECT seq, event_id, event_type, customer_key, status, attempts, last_error, created_at, updated_at "
+        "FROM webhook_events WHERE status = ? ORDER BY seq DESC LIMIT ?",
+        (status, limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def rejouer(event_id: str) -> bool:
+    """
+    Remet un event de la dead-letter en file (après correction côté Airtable / config).
+    """
+    _init()
+    now = time.time()
+    cur = get_connection().execute(
+        "UPDATE webhook_events SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ? "
+        "WHERE event_id = ? AND status = 'dead'",
+        (now, now, event_id),
+    )
+    _wakeup.set()
+    return cur.rowcount == 1
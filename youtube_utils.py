@@ -1,6 +1,9 @@
 from urllib.parse import urlparse, parse_qs
+import functools
 import os
 
+import requests
+
 from youtube_transcript_api import (
     YouTubeTranscriptApi,
     TranscriptsDisabled,
@@ -10,6 +13,8 @@ from youtube_transcript_api import (
 from youtube_transcript_api._errors import RequestBlocked
 from youtube_transcript_api.proxies import GenericProxyConfig
 
+import resilience
+
 
 PROXY_URL = os.getenv("PROXY_URL")
 
@@ -43,12 +48,15 @@ def extraire_video_id(url: str) -> str:
     raise ValueError("URL YouTube non reconnue.")
 
 
-def _build_api_with_proxy() -> YouTubeTranscriptApi:
+def _build_api_with_proxy(timeout: float) -> YouTubeTranscriptApi:
     """
     Construit une instance de YouTubeTranscriptApi avec proxy si PROXY_URL est défini.
+    `timeout` s'applique à chaque requête HTTP (la bibliothèque n'en fixe aucun).
     """
+    http_client = requests.Session()
+    http_client.request = functools.partial(http_client.request, timeout=timeout)
     if not PROXY_URL:
-        return YouTubeTranscriptApi()
+        return YouTubeTranscriptApi(http_client=http_client)
 
     # même URL pour http et https, Oxylabs accepte ça
     proxy_config = GenericProxyConfig(
@@ -56,23 +64,23 @@ def _build_api_with_proxy() -> YouTubeTranscriptApi:
         https_url=PROXY_URL,
     )
 
-    return YouTubeTranscriptApi(proxy_config=proxy_config)
+    return YouTubeTranscriptApi(proxy_config=proxy_config, http_client=http_client)
 
 
-def recuperer_transcription(video_id: str, langues=None) -> str:
+def recuperer_segments(video_id: str, langues=None) -> list:
     """
-    Récupère la transcription YouTube en utilisant éventuellement un proxy (Oxylabs).
+    Récupère la transcription YouTube horodatée (proxy Oxylabs si configuré) :
+    liste de segments {"text", "start", "duration"}.
     """
     if langues is None:
         langues = ["fr", "en"]
 
-    ytt_api = _build_api_with_proxy()
-
     try:
-        fetched = ytt_api.fetch(
-            video_id,
-            languages=langues,
-        )
+        with resilience.appel("youtube", "fetch") as timeout:
+            fetched = _build_api_with_proxy(timeout).fetch(
+                video_id,
+                languages=langues,
+            )
     except RequestBlocked as e:
         # blocage IP (même via proxy)
         raise RuntimeError(
@@ -80,6 +88,15 @@ def recuperer_transcription(video_id: str, langues=None) -> str:
             "Réessaie plus tard ou avec une autre vidéo."
         ) from e
 
-    segments = fetched.to_raw_data()
-    lignes = [s["text"] for s in segments if s.get("text")]
-    return "\n".join(lignes)
+    return fetched.to_raw_data()
+
+
+def texte_des_segments(segments: list) -> str:
+    return "\n".join(s["text"] for s in segments if s.get("text"))
+
+
+def recuperer_transcription(video_id: str, langues=None) -> str:
+    """
+    Récupère la transcription YouTube en texte brut (une ligne par segment).
+    """
+    return texte_des_segments(recuperer_segments(video_id, langues))